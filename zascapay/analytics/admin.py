@@ -0,0 +1,9 @@
+from django.contrib import admin
+
+from .models import RollupWatermark
+
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('source', 'last_id', 'last_at', 'updated_at')
+    readonly_fields = [f.name for f in RollupWatermark._meta.fields]
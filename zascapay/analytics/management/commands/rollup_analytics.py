@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from analytics.services import ROLLUP_BATCH_SIZE, reset_rollups, run_rollups
+
+
+class Command(BaseCommand):
+    help = "Cộng dồn scans/sales/refunds mới (sau watermark) vào bảng rollup theo giờ/ngày. Chạy định kỳ (cron mỗi vài phút)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE, help='Số dòng raw mỗi nguồn trong một transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Xóa toàn bộ rollup và watermark rồi tổng hợp lại từ đầu')
+
+    def handle(self, *args, **opts):
+        if opts['rebuild']:
+            reset_rollups()
+        processed = run_rollups(batch_size=opts['batch_size'])
+        summary = ', '.join(f'{source}={count}' for source, count in processed.items())
+        self.stdout.write(self.style.SUCCESS(f'Rollup done: {summary}'))
@@ -0,0 +1,73 @@
+from django.db import models
+
+
+class ScanEvent(models.Model):
+    """Một lần scan ảnh qua `/product/api/scan/` (nguồn raw cho rollup scans/detections)."""
+
+    store_id = models.BigIntegerField()
+    # Number of boxes matched to a product of the store
+    detection_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'analytics_scan_event'
+
+
+class ScanDetection(models.Model):
+    """Một sản phẩm được nhận diện trong một `ScanEvent`."""
+
+    event = models.ForeignKey(ScanEvent, on_delete=models.CASCADE, related_name='detections')
+    product_id = models.BigIntegerField()
+    accuracy = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'analytics_scan_detection'
+
+
+class Rollup(models.Model):
+    """Số liệu tổng hợp theo giờ / ngày cho từng store và sản phẩm.
+
+    `product_id = 0` là dòng tổng của cả store (scans, orders, revenue, refunds);
+    các dòng `product_id > 0` chứa detections, orders, items_sold, revenue của
+    sản phẩm đó. Được cộng dồn bởi `analytics.services.run_rollups`; không dùng
+    FK để số liệu cũ vẫn còn khi store/sản phẩm bị xóa.
+    """
+
+    class Granularity(models.TextChoices):
+        HOUR = 'hour', 'Giờ'
+        DAY = 'day', 'Ngày'
+
+    granularity = models.CharField(max_length=4, choices=Granularity.choices)
+    bucket = models.DateTimeField()
+    store_id = models.BigIntegerField()
+    product_id = models.BigIntegerField(default=0)
+    scans = models.PositiveIntegerField(default=0)
+    detections = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    refunds = models.PositiveIntegerField(default=0)
+    refunded_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'analytics_rollup'
+        constraints = [
+            # Also the index used by the chart queries
+            models.UniqueConstraint(
+                fields=['store_id', 'granularity', 'product_id', 'bucket'], name='uniq_rollup_key',
+            ),
+        ]
+        verbose_name = 'Rollup'
+        verbose_name_plural = 'Rollups'
+
+
+class RollupWatermark(models.Model):
+    """Vị trí đã tổng hợp tới của từng nguồn raw (id cuối cùng hoặc thời điểm cuối cùng)."""
+
+    source = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'analytics_watermark'
@@ -0,0 +1,286 @@
+"""Incremental hourly/daily rollups per store and product.
+
+Each raw source (scan events, sales, refunds) has a `RollupWatermark`; a run
+reads only the rows past it, aggregates them per hour, folds the hours into
+days and adds both into `Rollup`. Chart queries then read a few hundred
+pre-aggregated rows instead of scanning `orders`/`order_items`/`payments`.
+
+Orders, items sold and revenue count sales: an order is counted in the hour
+its payment succeeded (`Payment.paid_at`), so pending, failed and cancelled
+orders never add revenue. A later refund does not take the sale back; it is
+counted by the refunds source (`refunds`, `refunded_amount`), net revenue
+being `revenue - refunded_amount`.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from core.bulk import bulk_update_rows
+from payment.models import OrderItem, Payment
+from product.models import Product
+from .models import Rollup, RollupWatermark, ScanDetection, ScanEvent
+
+METRICS = ('scans', 'detections', 'orders', 'items_sold', 'revenue', 'refunds', 'refunded_amount')
+ROLLUP_BATCH_SIZE = 10000
+
+# (hour bucket, store_id, product_id) -> metric -> delta
+Key = Tuple[datetime, int, int]
+Deltas = Dict[Key, Dict[str, object]]
+
+
+def settle_lag() -> timedelta:
+    # Rows younger than this may belong to transactions that have not committed
+    # yet (ids are allocated before commit); they are picked up by the next run.
+    return timedelta(seconds=getattr(settings, 'ANALYTICS_SETTLE_LAG', 60))
+
+
+def record_scan(store_id: int, detections: Iterable[dict]) -> ScanEvent:
+    """Log one scan and its matched products (2 INSERTs)."""
+    detections = list(detections)
+    event = ScanEvent.objects.create(store_id=store_id, detection_count=len(detections))
+    if detections:
+        ScanDetection.objects.bulk_create([
+            ScanDetection(event=event, product_id=d['product_id'], accuracy=d.get('accuracy') or 0)
+            for d in detections
+        ])
+    return event
+
+
+def _add(deltas: Deltas, hour: datetime, store_id: int, product_id: int, **metrics) -> None:
+    entry = deltas[(hour, store_id, product_id)]
+    for name, value in metrics.items():
+        if value:
+            entry[name] = entry.get(name, 0) + value
+
+
+def _next_ids(qs, pk: str, after: int, settled: datetime, batch_size: int) -> List[int]:
+    return list(
+        qs.filter(**{f'{pk}__gt': after}, created_at__lt=settled)
+        .order_by(pk).values_list(pk, flat=True)[:batch_size]
+    )
+
+
+# --------------------------
+# Sources
+# --------------------------
+
+def _collect_scans(mark: RollupWatermark, deltas: Deltas, settled: datetime, batch_size: int) -> int:
+    ids = _next_ids(ScanEvent.objects, 'id', mark.last_id, settled, batch_size)
+    if not ids:
+        return 0
+    low, high = mark.last_id, ids[-1]
+    events = (
+        ScanEvent.objects.filter(id__gt=low, id__lte=high).order_by()
+        .values(hour=TruncHour('created_at'), store=F('store_id'))
+        .annotate(scans=Count('id'), found=Sum('detection_count'))
+    )
+    for row in events:
+        _add(deltas, row['hour'], row['store'], 0, scans=row['scans'], detections=row['found'])
+    products = (
+        ScanDetection.objects.filter(event_id__gt=low, event_id__lte=high).order_by()
+        .values('product_id', hour=TruncHour('event__created_at'), store=F('event__store_id'))
+        .annotate(found=Count('id'))
+    )
+    for row in products:
+        _add(deltas, row['hour'], row['store'], row['product_id'], detections=row['found'])
+    mark.last_id = high
+    return len(ids)
+
+
+def _collect_sales(mark: RollupWatermark, deltas: Deltas, settled: datetime, batch_size: int) -> int:
+    # Payments succeed out of id order (a charge may stay pending for a while),
+    # so this source is keyed on (paid_at, id). An order is paid at most once.
+    # Orders created before orders had a store cannot be attributed and are skipped.
+    qs = Payment.objects.filter(paid_at__lt=settled, order__store__isnull=False)
+    if mark.last_at is not None:
+        qs = qs.filter(Q(paid_at__gt=mark.last_at) | Q(paid_at=mark.last_at, id__gt=mark.last_id))
+    rows = list(
+        qs.order_by('paid_at', 'id')
+        .values_list('id', 'paid_at', 'order_id', 'order__store_id', 'order__total_amount')[:batch_size]
+    )
+    if not rows:
+        return 0
+    sales = {}
+    for _, paid_at, order_id, store_id, total in rows:
+        hour = paid_at.replace(minute=0, second=0, microsecond=0)
+        sales[order_id] = (hour, store_id)
+        _add(deltas, hour, store_id, 0, orders=1, revenue=total)
+    lines = (
+        OrderItem.objects.filter(order_id__in=sales).order_by()
+        .values('order_id', 'product_id')
+        .annotate(qty=Sum('quantity'), amount=Sum('line_total'))
+    )
+    for row in lines:
+        hour, store_id = sales[row['order_id']]
+        _add(deltas, hour, store_id, row['product_id'], orders=1, items_sold=row['qty'], revenue=row['amount'])
+    mark.last_id, mark.last_at = rows[-1][0], rows[-1][1]
+    return len(rows)
+
+
+def _collect_refunds(mark: RollupWatermark, deltas: Deltas, settled: datetime, batch_size: int) -> int:
+    # A refund updates the payment row (status, processed_at) instead of adding
+    # one, so this source is keyed on (processed_at, id) rather than on id.
+    qs = Payment.objects.filter(status=Payment.Status.REFUNDED, store__isnull=False, processed_at__lt=settled)
+    if mark.last_at is not None:
+        qs = qs.filter(Q(processed_at__gt=mark.last_at) | Q(processed_at=mark.last_at, id__gt=mark.last_id))
+    rows = list(
+        qs.order_by('processed_at', 'id')
+        .values_list('id', 'processed_at', 'store_id', 'metadata', 'order__total_amount')[:batch_size]
+    )
+    for pk, processed_at, store_id, metadata, order_total in rows:
+        amount = (metadata or {}).get('refund_amount') or order_total or 0
+        hour = processed_at.replace(minute=0, second=0, microsecond=0)
+        _add(deltas, hour, store_id, 0, refunds=1, refunded_amount=Decimal(str(amount)))
+    if rows:
+        mark.last_id, mark.last_at = rows[-1][0], rows[-1][1]
+    return len(rows)
+
+
+SOURCES = {
+    'scans': _collect_scans,
+    'sales': _collect_sales,
+    'refunds': _collect_refunds,
+}
+
+
+# --------------------------
+# Apply
+# --------------------------
+
+def _fold_days(hourly: Deltas) -> Deltas:
+    daily: Deltas = defaultdict(dict)
+    for (hour, store_id, product_id), metrics in hourly.items():
+        _add(daily, hour.replace(hour=0), store_id, product_id, **metrics)
+    return daily
+
+
+def _apply(granularity: str, deltas: Deltas) -> None:
+    """Add `deltas` into the rollup rows: one read, one bulk INSERT and batched CASE UPDATEs."""
+    if not deltas:
+        return
+    existing = {
+        (row[1], row[2], row[3]): row
+        for row in Rollup.objects.filter(
+            granularity=granularity,
+            store_id__in={key[1] for key in deltas},
+            bucket__in={key[0] for key in deltas},
+        ).values_list('id', 'bucket', 'store_id', 'product_id', *METRICS)
+    }
+    updates, creates = [], []
+    for key, metrics in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            creates.append(Rollup(granularity=granularity, bucket=key[0], store_id=key[1], product_id=key[2], **metrics))
+        else:
+            current = dict(zip(METRICS, row[4:]))
+            updates.append((row[0], *(current[m] + metrics.get(m, 0) for m in METRICS)))
+    Rollup.objects.bulk_create(creates, batch_size=1000)
+    bulk_update_rows(Rollup, METRICS, updates)
+
+
+def reset_rollups() -> None:
+    """Drop every rollup and watermark; the next `run_rollups` rebuilds them from the raw rows."""
+    with transaction.atomic():
+        # Payments settled before `paid_at` existed: best known time of the charge
+        Payment.objects.filter(paid_at__isnull=True, status=Payment.Status.SUCCESS).update(paid_at=F('processed_at'))
+        Payment.objects.filter(paid_at__isnull=True, status=Payment.Status.REFUNDED).update(paid_at=F('created_at'))
+        Rollup.objects.all().delete()
+        RollupWatermark.objects.all().delete()
+
+
+def run_rollups(*, batch_size: int = ROLLUP_BATCH_SIZE, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Fold every settled raw row past the watermarks into `Rollup`; returns rows read per source.
+
+    Each batch runs in one transaction with the watermark rows locked, so
+    concurrent runs (cron + manual) serialize instead of double counting, and
+    a crash leaves rollups and watermarks consistent.
+    """
+    settled = (now or timezone.now()) - settle_lag()
+    RollupWatermark.objects.bulk_create([RollupWatermark(source=s) for s in SOURCES], ignore_conflicts=True)
+    processed = dict.fromkeys(SOURCES, 0)
+    while True:
+        with transaction.atomic():
+            marks = {m.source: m for m in RollupWatermark.objects.select_for_update().filter(source__in=SOURCES)}
+            hourly: Deltas = defaultdict(dict)
+            read = {source: collect(marks[source], hourly, settled, batch_size) for source, collect in SOURCES.items()}
+            _apply(Rollup.Granularity.HOUR, hourly)
+            _apply(Rollup.Granularity.DAY, _fold_days(hourly))
+            for source, count in read.items():
+                if count:
+                    marks[source].save(update_fields=['last_id', 'last_at', 'updated_at'])
+                processed[source] += count
+        if all(count < batch_size for count in read.values()):
+            return processed
+
+
+# --------------------------
+# Queries
+# --------------------------
+
+def bucket_range(granularity: str, start: date, end: date) -> List[datetime]:
+    first = datetime.combine(start, time.min)
+    last = datetime.combine(end, time.max)
+    step = timedelta(hours=1) if granularity == Rollup.Granularity.HOUR else timedelta(days=1)
+    buckets = []
+    current = first
+    while current <= last:
+        buckets.append(current)
+        current += step
+    return buckets
+
+
+def store_series(store_id: int, granularity: str, start: date, end: date, product_id: int = 0) -> List[dict]:
+    """Zero-filled time series of one store (or one of its products) between two dates, inclusive."""
+    buckets = bucket_range(granularity, start, end)
+    rows = {
+        row['bucket']: row
+        for row in Rollup.objects.filter(
+            store_id=store_id, granularity=granularity, product_id=product_id,
+            bucket__gte=buckets[0], bucket__lte=buckets[-1],
+        ).values('bucket', *METRICS)
+    }
+    zero = dict.fromkeys(METRICS, 0)
+    series = []
+    for bucket in buckets:
+        row = rows.get(bucket, zero)
+        point = {'bucket': bucket.isoformat()}
+        for metric in METRICS:
+            value = row[metric]
+            point[metric] = str(value) if isinstance(value, Decimal) else value
+        series.append(point)
+    return series
+
+
+def top_products(store_id: int, start: date, end: date, *, metric: str = 'revenue', limit: int = 10) -> List[dict]:
+    """Products of a store ranked by `metric` over a date range, from the daily rollups."""
+    rows = (
+        Rollup.objects.filter(
+            store_id=store_id, granularity=Rollup.Granularity.DAY, product_id__gt=0,
+            bucket__gte=datetime.combine(start, time.min), bucket__lte=datetime.combine(end, time.min),
+        )
+        .values('product_id')
+        .annotate(**{f'total_{m}': Sum(m) for m in ('detections', 'orders', 'items_sold', 'revenue')})
+        .order_by(f'-total_{metric}', 'product_id')[:limit]
+    )
+    rows = list(rows)
+    names = dict(Product.objects.filter(id__in=[r['product_id'] for r in rows]).values_list('id', 'name'))
+    return [
+        {
+            'product_id': r['product_id'],
+            'name': names.get(r['product_id'], ''),
+            'detections': r['total_detections'],
+            'orders': r['total_orders'],
+            'items_sold': r['total_items_sold'],
+            'revenue': str(r['total_revenue']),
+        }
+        for r in rows
+    ]
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from payment.models import Order, Payment
+from payment.services import OrderService, PaymentService
+from product.models import Product, ProductCategory
+from store.models import Store, StoreCategory, StoreInventory
+from store.pricebook import clear_price_books
+from .models import Rollup, ScanEvent
+from .services import record_scan, reset_rollups, run_rollups
+
+User = get_user_model()
+
+
+@override_settings(ANALYTICS_SETTLE_LAG=0)
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='secret123')
+        self.store = Store.objects.create(name='Shop', code='shop', owner=self.user,
+                                          category=StoreCategory.objects.create(name='Khác'))
+        category = ProductCategory.objects.create(name='Đồ Uống')
+        self.coca, self.pepsi = (Product.objects.create(name=n, sku=n, category=category) for n in ('Coca', 'Pepsi'))
+        StoreInventory.objects.bulk_create([
+            StoreInventory(store=self.store, product=self.coca, price=Decimal('10.00'), quantity=100),
+            StoreInventory(store=self.store, product=self.pepsi, price=Decimal('8.00'), quantity=100),
+        ])
+        clear_price_books()
+        self.hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+        self.day = self.hour.replace(hour=0)
+
+    def _order(self, *lines):
+        return OrderService.create_order(self.user, [{'product_id': p.id, 'quantity': q} for p, q in lines])
+
+    def _pay(self, order):
+        return PaymentService.process_payment(self.store, order, order.total_amount, 'VND', 'cash')
+
+    def _row(self, granularity, product_id=0):
+        return Rollup.objects.get(store_id=self.store.id, granularity=granularity, product_id=product_id)
+
+    def test_rollup_is_incremental(self):
+        record_scan(self.store.id, [{'product_id': self.coca.id, 'accuracy': 91.5}, {'product_id': self.pepsi.id}])
+        record_scan(self.store.id, [])
+        first = self._order((self.coca, 2), (self.pepsi, 1))
+        self._pay(first)
+
+        self.assertEqual(run_rollups(), {'scans': 2, 'sales': 1, 'refunds': 0})
+        store_day = self._row(Rollup.Granularity.DAY)
+        self.assertEqual((store_day.bucket, store_day.scans, store_day.detections, store_day.orders),
+                         (self.day, 2, 2, 1))
+        self.assertEqual(store_day.revenue, Decimal('28.00'))
+        self.assertEqual(self._row(Rollup.Granularity.HOUR).bucket, self.hour)
+
+        # Second run only reads the new rows and adds them to the existing buckets
+        self._pay(self._order((self.coca, 3)))
+        PaymentService.refund_payment(Payment.objects.get(order=first).id, Decimal('5.00'))
+        self.assertEqual(run_rollups(), {'scans': 0, 'sales': 1, 'refunds': 1})
+        self.assertEqual(run_rollups(), {'scans': 0, 'sales': 0, 'refunds': 0})
+
+        store_day = self._row(Rollup.Granularity.DAY)
+        self.assertEqual((store_day.orders, store_day.revenue), (2, Decimal('58.00')))
+        self.assertEqual((store_day.refunds, store_day.refunded_amount), (1, Decimal('5.00')))
+        coca = self._row(Rollup.Granularity.DAY, self.coca.id)
+        self.assertEqual((coca.detections, coca.orders, coca.items_sold, coca.revenue), (1, 2, 5, Decimal('50.00')))
+        self.assertEqual(Rollup.objects.filter(granularity=Rollup.Granularity.HOUR).count(), 3)
+
+    def test_only_paid_orders_count(self):
+        paid = self._order((self.coca, 1))
+        pending = self._order((self.coca, 2))
+        cancelled = self._order((self.pepsi, 4))
+        OrderService.cancel_order(cancelled.id)
+        self._pay(paid)
+        self.assertEqual(run_rollups()['sales'], 1)
+        store_day = self._row(Rollup.Granularity.DAY)
+        self.assertEqual((store_day.orders, store_day.revenue), (1, Decimal('10.00')))
+        self.assertFalse(Rollup.objects.filter(product_id=self.pepsi.id).exists())
+
+        # Paid later: counted when the payment succeeds
+        self._pay(pending)
+        self.assertEqual(run_rollups()['sales'], 1)
+        store_day = self._row(Rollup.Granularity.DAY)
+        self.assertEqual((store_day.orders, store_day.revenue), (2, Decimal('30.00')))
+        self.assertEqual(self._row(Rollup.Granularity.DAY, self.coca.id).items_sold, 3)
+
+        run_rollups()
+        reset_rollups()
+        self.assertEqual(run_rollups()['sales'], 2)
+        self.assertEqual(self._row(Rollup.Granularity.DAY).revenue, Decimal('30.00'))
+
+    def test_batches_resume_from_watermark(self):
+        for _ in range(5):
+            record_scan(self.store.id, [{'product_id': self.coca.id}])
+        self.assertEqual(run_rollups(batch_size=2)['scans'], 5)
+        self.assertEqual(self._row(Rollup.Granularity.DAY).scans, 5)
+        self.assertEqual(self._row(Rollup.Granularity.DAY, self.coca.id).detections, 5)
+
+    @override_settings(ANALYTICS_SETTLE_LAG=3600)
+    def test_recent_rows_wait_for_settle_lag(self):
+        record_scan(self.store.id, [])
+        self.assertEqual(run_rollups()['scans'], 0)
+        ScanEvent.objects.update(created_at=datetime.now() - timedelta(hours=2))
+        self.assertEqual(run_rollups()['scans'], 1)
+
+    def test_series_endpoint(self):
+        self._pay(self._order((self.pepsi, 2)))
+        run_rollups()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        start = (self.day - timedelta(days=6)).date()
+        with self.assertNumQueries(2):
+            response = client.get(f'/api/analytics/stores/{self.store.id}/series/',
+                                  {'start': start.isoformat(), 'end': self.day.date().isoformat()})
+        self.assertEqual(response.status_code, 200)
+        series = response.json()['series']
+        self.assertEqual(len(series), 7)
+        self.assertEqual((series[-1]['orders'], series[-1]['revenue']), (1, '16.00'))
+        self.assertEqual(series[0]['orders'], 0)
+
+        response = client.get(f'/api/analytics/stores/{self.store.id}/products/', {'metric': 'items_sold'})
+        self.assertEqual(response.json()['products'][0]['name'], 'Pepsi')
+        response = client.get(f'/api/analytics/stores/{self.store.id}/series/', {'granularity': 'hour', 'start': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+        other = User.objects.create_user(username='other', password='secret123', email='o@example.com')
+        client.force_authenticate(other)
+        self.assertEqual(client.get(f'/api/analytics/stores/{self.store.id}/series/').status_code, 404)
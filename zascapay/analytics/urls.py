@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import StoreTimeSeriesView, StoreTopProductsView
+
+urlpatterns = [
+    path('api/analytics/stores/<int:pk>/series/', StoreTimeSeriesView.as_view(), name='analytics-store-series'),
+    path('api/analytics/stores/<int:pk>/products/', StoreTopProductsView.as_view(), name='analytics-store-products'),
+]
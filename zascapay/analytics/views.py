@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from store.models import Store
+from .models import Rollup
+from .services import store_series, top_products
+
+# Longest range served per granularity (number of buckets stays bounded)
+MAX_RANGE_DAYS = {Rollup.Granularity.HOUR: 31, Rollup.Granularity.DAY: 366}
+DEFAULT_RANGE_DAYS = {Rollup.Granularity.HOUR: 1, Rollup.Granularity.DAY: 30}
+
+
+class StoreAnalyticsMixin:
+    permission_classes = [IsAuthenticated]
+
+    def get_store(self, request, pk):
+        qs = Store.objects.filter(pk=pk, is_deleted=False)
+        user = request.user
+        if not (user.is_staff or getattr(user, 'is_system_admin', False)):
+            qs = qs.filter(owner=user)
+        return qs.only('id').first()
+
+    def parse_range(self, params, granularity):
+        """(start, end) dates from `start`/`end` (YYYY-MM-DD); raises ValueError."""
+        end = parse_date(params['end']) if params.get('end') else timezone.now().date()
+        start = parse_date(params['start']) if params.get('start') else end - timedelta(days=DEFAULT_RANGE_DAYS[granularity] - 1)
+        if start is None or end is None:
+            raise ValueError('start/end phải có dạng YYYY-MM-DD')
+        if start > end:
+            raise ValueError('start phải trước end')
+        if (end - start).days + 1 > MAX_RANGE_DAYS[granularity]:
+            raise ValueError(f'Khoảng thời gian tối đa {MAX_RANGE_DAYS[granularity]} ngày cho granularity={granularity}')
+        return start, end
+
+
+class StoreTimeSeriesView(StoreAnalyticsMixin, APIView):
+    """Chuỗi thời gian scans/detections/orders/revenue/refunds của một store, đọc từ bảng rollup.
+
+    `GET /api/analytics/stores/<id>/series/?granularity=day|hour&start=&end=[&product=<id>]`
+    """
+
+    def get(self, request, pk):
+        store = self.get_store(request, pk)
+        if store is None:
+            return Response({'detail': 'Không tìm thấy store.'}, status=status.HTTP_404_NOT_FOUND)
+        params = request.query_params
+        granularity = params.get('granularity') or Rollup.Granularity.DAY
+        if granularity not in Rollup.Granularity.values:
+            return Response({'detail': 'granularity phải là hour hoặc day.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start, end = self.parse_range(params, granularity)
+            product_id = int(params.get('product') or 0)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'store_id': store.id,
+            'product_id': product_id or None,
+            'granularity': granularity,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'series': store_series(store.id, granularity, start, end, product_id),
+        })
+
+
+class StoreTopProductsView(StoreAnalyticsMixin, APIView):
+    """Sản phẩm nổi bật của store trong khoảng ngày (rollup theo ngày).
+
+    `GET /api/analytics/stores/<id>/products/?start=&end=&metric=revenue|items_sold|orders|detections&limit=10`
+    """
+
+    metrics = ('revenue', 'items_sold', 'orders', 'detections')
+
+    def get(self, request, pk):
+        store = self.get_store(request, pk)
+        if store is None:
+            return Response({'detail': 'Không tìm thấy store.'}, status=status.HTTP_404_NOT_FOUND)
+        params = request.query_params
+        metric = params.get('metric') or 'revenue'
+        if metric not in self.metrics:
+            return Response({'detail': f"metric phải là một trong {', '.join(self.metrics)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start, end = self.parse_range(params, Rollup.Granularity.DAY)
+            limit = min(max(int(params.get('limit') or 10), 1), 100)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'store_id': store.id,
+            'metric': metric,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'products': top_products(store.id, start, end, metric=metric, limit=limit),
+        })
@@ -0,0 +1,28 @@
+from django.contrib import admin
+
+from .models import IdempotencyKey, SlowQuery
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('short_sql', 'count', 'avg_ms', 'max_ms', 'full_scan', 'recommendation', 'view', 'last_seen')
+    list_filter = ('full_scan', 'view')
+    search_fields = ('normalized_sql', 'view', 'source')
+    readonly_fields = [f.name for f in SlowQuery._meta.fields] + ['avg_ms']
+
+    @admin.display(description='SQL')
+    def short_sql(self, obj):
+        return obj.normalized_sql[:120]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'endpoint', 'status_code', 'created_at')
+    search_fields = ('key',)
+    readonly_fields = [f.name for f in IdempotencyKey._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
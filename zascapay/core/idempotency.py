@@ -0,0 +1,261 @@
+"""`Idempotency-Key` support for POST endpoints that create orders/payments.
+
+A request carrying the header runs inside one transaction that first inserts
+the `(user, key)` row and stores the response in it before committing. So:
+
+- a retry after success gets the stored response back without running the
+  view (first from a per-process LRU, else from the table);
+- a concurrent duplicate blocks on the unique index until the first request
+  commits (or, for `atomic=False` views, polls the in-progress key), then
+  replays its response;
+- an in-progress key whose request died (worker killed mid-call) is taken
+  over by a retry once its lease (`IDEMPOTENCY_LEASE_SECONDS`) has lapsed;
+- if the view errors out (exception or 5xx) everything rolls back, including
+  the key, and the client may retry the same key.
+
+Reusing a key with another body or on another endpoint is rejected with 422.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+class StoredResponse(NamedTuple):
+    endpoint: str
+    request_hash: str
+    status_code: int
+    body: object
+
+
+_responses: "OrderedDict[tuple, StoredResponse]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _max_cached() -> int:
+    return int(getattr(settings, 'IDEMPOTENCY_CACHE_SIZE', 1024))
+
+
+def key_ttl() -> timedelta:
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def _new_lease():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 120))
+
+
+def _remember(cache_key: tuple, stored: StoredResponse) -> None:
+    with _lock:
+        _responses[cache_key] = stored
+        _responses.move_to_end(cache_key)
+        while len(_responses) > _max_cached():
+            _responses.popitem(last=False)
+
+
+def _cached(cache_key: tuple) -> Optional[StoredResponse]:
+    with _lock:
+        stored = _responses.get(cache_key)
+        if stored is not None:
+            _responses.move_to_end(cache_key)
+        return stored
+
+
+def clear_idempotency_cache() -> None:
+    with _lock:
+        _responses.clear()
+
+
+def request_hash(request) -> str:
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _replay(stored: StoredResponse, endpoint: str, digest: str) -> Response:
+    if stored.endpoint != endpoint or stored.request_hash != digest:
+        return Response(
+            {'detail': f'{HEADER} đã được dùng cho một request khác.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(stored.body, status=stored.status_code, headers={REPLAY_HEADER: 'true'})
+
+
+def _load(user, key: str) -> Optional[StoredResponse]:
+    row = (
+        IdempotencyKey.objects.filter(user=user, key=key)
+        .values_list('endpoint', 'request_hash', 'status_code', 'response_body').first()
+    )
+    return StoredResponse(*row) if row else None
+
+
+def _wait_for(user, key: str) -> Optional[StoredResponse]:
+    """Poll a key claimed by a concurrent non-atomic request until it has a response."""
+    deadline = time.monotonic() + float(getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10))
+    while True:
+        stored = _load(user, key)
+        if stored is None or stored.status_code or time.monotonic() >= deadline:
+            return stored
+        time.sleep(0.05)
+
+
+def _take_over(user, key: str, endpoint: str, digest: str):
+    """Claim an in-progress key whose lease has lapsed; returns the new lease, or None if another request holds it."""
+    lease = _new_lease()
+    taken = IdempotencyKey.objects.filter(
+        user=user, key=key, endpoint=endpoint, request_hash=digest,
+        status_code=0, lease_expires_at__lt=timezone.now(),
+    ).update(lease_expires_at=lease)
+    return lease if taken else None
+
+
+def _conflict() -> Response:
+    # Still running, or rolled back / purged in between: the client retries later
+    return Response({'detail': 'Request trùng đang được xử lý, thử lại sau.'}, status=status.HTTP_409_CONFLICT)
+
+
+class _Rollback(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def idempotent(view_method=None, *, atomic: bool = True):
+    """Decorator for viewset/APIView handlers; requests without the header are untouched.
+
+    `atomic=True` (default) runs the view in the key's transaction, so the key
+    exists only if the view's writes committed. Views that call external
+    services (payment gateways) use `atomic=False`: the key is committed first
+    as in-progress (`status_code = 0`), the view runs outside any transaction,
+    and concurrent duplicates poll until the response is stored
+    (`IDEMPOTENCY_WAIT_SECONDS`). If the claim's lease has lapsed by then, the
+    duplicate takes the key over and runs the view itself; such views must
+    make a second run safe (`PaymentService` refuses to charge an order with a
+    PENDING payment).
+    """
+    if view_method is None:
+        return lambda method: idempotent(method, atomic=atomic)
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': f'{HEADER} tối đa {MAX_KEY_LENGTH} ký tự.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        endpoint = f'{request.method} {request.path}'[:200]
+        digest = request_hash(request)
+        cache_key = (request.user.pk, key)
+        stored = _cached(cache_key) or _load(request.user, key)
+        if stored is not None and not stored.status_code:
+            stored = _wait_for(request.user, key)
+            if stored is not None and not stored.status_code and not atomic:
+                lease = _take_over(request.user, key, endpoint, digest)
+                if lease is not None:
+                    return _run_leased(view_method, self, request, args, kwargs, key, endpoint, digest, cache_key, lease)
+        if stored is not None:
+            if not stored.status_code:
+                return _conflict()
+            _remember(cache_key, stored)
+            return _replay(stored, endpoint, digest)
+
+        run = _run_atomic if atomic else _run_claimed
+        stored = run(view_method, self, request, args, kwargs, key, endpoint, digest, cache_key)
+        if isinstance(stored, Response):
+            return stored
+        if stored is None or not stored.status_code:
+            return _conflict()
+        _remember(cache_key, stored)
+        return _replay(stored, endpoint, digest)
+
+    return wrapper
+
+
+def _run_atomic(view_method, view, request, args, kwargs, key, endpoint, digest, cache_key):
+    """Response of the view, or the StoredResponse of whoever owns the key."""
+    try:
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user, key=key, endpoint=endpoint, request_hash=digest,
+                    )
+            except IntegrityError:
+                # Key already used: the other request has committed by now
+                # (the INSERT waited on its lock)
+                record = None
+            if record is not None:
+                response = view_method(view, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    raise _Rollback(response)
+                record.status_code = response.status_code
+                record.response_body = response.data
+                record.save(update_fields=['status_code', 'response_body'])
+                stored = StoredResponse(endpoint, digest, response.status_code, response.data)
+                transaction.on_commit(lambda: _remember(cache_key, stored))
+                return response
+    except _Rollback as rollback:
+        return rollback.response
+    return _wait_for(request.user, key)
+
+
+def _run_claimed(view_method, view, request, args, kwargs, key, endpoint, digest, cache_key):
+    lease = _new_lease()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                user=request.user, key=key, endpoint=endpoint, request_hash=digest, lease_expires_at=lease,
+            )
+    except IntegrityError:
+        stored = _wait_for(request.user, key)
+        if stored is None or stored.status_code:
+            return stored
+        lease = _take_over(request.user, key, endpoint, digest)
+        if lease is None:
+            return stored
+    return _run_leased(view_method, view, request, args, kwargs, key, endpoint, digest, cache_key, lease)
+
+
+def _run_leased(view_method, view, request, args, kwargs, key, endpoint, digest, cache_key, lease):
+    # Filtered on our lease: if the key was taken over meanwhile, the new owner's row is left alone
+    mine = IdempotencyKey.objects.filter(user=request.user, key=key, status_code=0, lease_expires_at=lease)
+    try:
+        response = view_method(view, request, *args, **kwargs)
+    except Exception:
+        mine.delete()
+        raise
+    if response.status_code >= 500:
+        mine.delete()
+        return response
+    mine.update(status_code=response.status_code, response_body=response.data)
+    stored = StoredResponse(endpoint, digest, response.status_code, response.data)
+    transaction.on_commit(lambda: _remember(cache_key, stored))
+    return response
+
+
+def purge_expired_keys(now=None) -> int:
+    """Delete keys older than `IDEMPOTENCY_KEY_TTL_HOURS`; returns the number deleted."""
+    cutoff = (now or timezone.now()) - key_ttl()
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    clear_idempotency_cache()
+    return deleted
@@ -0,0 +1,97 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from payment.models import Order, OrderItem, Payment
+from payment.serializers import CompiledPaymentSerializer, PaymentSerializer
+from product.models import Product, ProductCategory
+from product.serializers import CompiledProductSerializer, ProductSerializer
+from store.models import Store, StoreCategory
+from store.serializers import CompiledStoreSerializer, StoreSerializer
+
+
+TARGETS = {
+    'products': (lambda: Product.objects.filter(is_deleted=False).order_by('name'), ProductSerializer, CompiledProductSerializer),
+    'stores': (lambda: Store.objects.filter(is_deleted=False).order_by('name'), StoreSerializer, CompiledStoreSerializer),
+    'payments': (lambda: Payment.objects.order_by('-created_at'), PaymentSerializer, CompiledPaymentSerializer),
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark list serialization: DRF ModelSerializer vs compiled .values() read path (rows/second)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=[*TARGETS, 'all'], default='all')
+        parser.add_argument('--limit', type=int, default=1000, help='Số dòng đọc mỗi lần đo (mặc định 1000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Số lần đo, lấy kết quả tốt nhất')
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Tạo N dòng giả cho mỗi bảng trong transaction và rollback sau khi đo',
+        )
+
+    def handle(self, *args, **opts):
+        targets = list(TARGETS) if opts['target'] == 'all' else [opts['target']]
+        with transaction.atomic():
+            if opts['seed']:
+                self._seed(opts['seed'])
+            for name in targets:
+                self._run(name, opts['limit'], opts['repeat'])
+            # Never keep seeded rows
+            transaction.set_rollback(True)
+
+    def _run(self, name, limit, repeat):
+        make_qs, serializer_class, compiled = TARGETS[name]
+
+        def drf():
+            qs = serializer_class.optimize_queryset(make_qs())[:limit]
+            return serializer_class(qs, many=True).data
+
+        def fast():
+            plan = compiled.plan()
+            return plan.render(plan.values(make_qs())[:limit])
+
+        rows = len(fast())
+        if not rows:
+            self.stdout.write(self.style.WARNING(f"{name}: không có dữ liệu (dùng --seed N)"))
+            return
+        before = rows / self._best(drf, repeat)
+        after = rows / self._best(fast, repeat)
+        self.stdout.write(
+            f"{name:<9} rows={rows:<6} drf={before:>10,.0f} rows/s  compiled={after:>10,.0f} rows/s  "
+            f"speedup={after / before:.1f}x"
+        )
+
+    @staticmethod
+    def _best(fn, repeat):
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def _seed(self, n):
+        pcat, _ = ProductCategory.objects.get_or_create(name='Benchmark')
+        scat, _ = StoreCategory.objects.get_or_create(name='Benchmark')
+        Product.objects.bulk_create(
+            Product(name=f'Bench {i}', sku=f'BENCH-{i}', category=pcat, accuracy_rate=Decimal('93.25'))
+            for i in range(n)
+        )
+        Store.objects.bulk_create(
+            Store(name=f'Bench {i}', code=f'bench-{i}', category=scat, accuracy_rate=Decimal('88.10'))
+            for i in range(n)
+        )
+        store = Store.objects.filter(code='bench-0').first()
+        product = Product.objects.filter(sku='BENCH-0').first()
+        for i in range(n):
+            order = Order.objects.create(total_amount=Decimal('31.50'))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, name=product.name, quantity=3,
+                          unit_price=Decimal('10.50'), line_total=Decimal('31.50')),
+            ])
+            Payment.objects.create(order=order, store=store, status=Payment.Status.SUCCESS)
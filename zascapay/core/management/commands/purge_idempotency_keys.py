@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.idempotency import key_ttl, purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Xóa Idempotency-Key cũ hơn IDEMPOTENCY_KEY_TTL_HOURS (chạy cron hằng ngày)."
+
+    def handle(self, *args, **opts):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} idempotency key(s) older than {key_ttl()}'))
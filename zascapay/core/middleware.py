@@ -0,0 +1,81 @@
+import logging
+import threading
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import querylog
+from .queryinspect import inspect_queries
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+class SlowQueryMiddleware:
+    """Log SQL slower than `SLOW_QUERY_THRESHOLD_MS` to the `SlowQuery` table (see admin).
+
+    Every connection gets an `execute_wrapper` for the duration of the request;
+    captured queries are aggregated after the response is built, with EXPLAIN
+    sampled at `SLOW_QUERY_EXPLAIN_RATE`. Turn off with `SLOW_QUERY_LOG = False`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Nested requests (e.g. a view calling another view) are covered by the outer one
+        if not getattr(settings, 'SLOW_QUERY_LOG', True) or getattr(_state, 'active', False):
+            return self.get_response(request)
+
+        threshold = querylog.threshold_ms()
+        recorders = [querylog.QueryRecorder(alias, threshold) for alias in connections]
+        _state.active = True
+        try:
+            with ExitStack() as stack:
+                for recorder in recorders:
+                    stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _state.active = False
+
+        captured = [q for recorder in recorders for q in recorder.captured]
+        if captured:
+            match = getattr(request, 'resolver_match', None)
+            view = (match.view_name or match._func_path) if match else request.path
+            try:
+                querylog.flush(captured, view=view)
+            except Exception:
+                # Instrumentation must never break the request
+                logger.warning('Could not record slow queries', exc_info=True)
+        return response
+
+
+class QueryInspectorMiddleware:
+    """Dev tool: warn when a request repeats the same query shape (N+1).
+
+    Enabled by `QUERY_INSPECTOR`. Each response gets `X-Query-Count` and
+    `X-Query-Time-Ms`; shapes seen `QUERY_INSPECTOR_REPEAT_THRESHOLD` times or
+    more are logged with the lines that issued them. Walks the stack for every
+    query, so keep it off in production.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_INSPECTOR', False):
+            return self.get_response(request)
+
+        with inspect_queries() as inspector:
+            response = self.get_response(request)
+        response['X-Query-Count'] = str(inspector.count)
+        response['X-Query-Time-Ms'] = f'{inspector.duration_ms:.1f}'
+        repeated = inspector.repeated()
+        if repeated:
+            logger.warning(
+                'Repeated queries in %s %s (%d queries total):\n%s',
+                request.method, request.path, inspector.count, '\n'.join(f'  {q}' for q in repeated),
+            )
+        return response
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class SlowQuery(models.Model):
+    """Slow SQL gom theo fingerprint (SQL đã chuẩn hóa), ghi bởi `SlowQueryMiddleware`.
+
+    `explain` lưu plan lấy mẫu gần nhất; `full_scan` / `recommendation` được
+    suy ra từ plan đó để admin lọc nhanh các query cần thêm index.
+    """
+
+    fingerprint = models.CharField(max_length=40, unique=True)
+    normalized_sql = models.TextField()
+    sample_sql = models.TextField(blank=True)
+    view = models.CharField(max_length=200, blank=True)
+    source = models.CharField(max_length=300, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    explain = models.TextField(blank=True)
+    explained_at = models.DateTimeField(blank=True, null=True)
+    full_scan = models.BooleanField(default=False)
+    recommendation = models.CharField(max_length=300, blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'core_slow_query'
+        ordering = ['-total_ms']
+        verbose_name = 'Slow query'
+        verbose_name_plural = 'Slow queries'
+
+    @property
+    def avg_ms(self) -> float:
+        return round(self.total_ms / self.count, 2) if self.count else 0.0
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.fingerprint[:8]} x{self.count} ({self.avg_ms} ms)"
+
+
+class IdempotencyKey(models.Model):
+    """Kết quả đã trả cho một header `Idempotency-Key` (xem `core.idempotency`).
+
+    Dòng được insert cùng transaction với thao tác nghiệp vụ, nên chỉ tồn tại
+    khi thao tác đã commit; request trùng key nhận lại đúng response đã lưu.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    # "POST /api/orders/" - a key can't be reused on another endpoint
+    endpoint = models.CharField(max_length=200)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(default=0)
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, blank=True, null=True)
+    # In-progress keys (status_code = 0) of `atomic=False` views: a retry may take the key over after this
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'core_idempotency_key'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='uniq_idempotency_user_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idx_idempotency_created'),
+        ]
+        verbose_name = 'Idempotency key'
+        verbose_name_plural = 'Idempotency keys'
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.key} ({self.endpoint} -> {self.status_code})"
@@ -0,0 +1,94 @@
+"""Per-request query inspection: counts query shapes and flags N+1 patterns.
+
+`inspect_queries()` wraps every DB connection for the duration of a block and
+groups executed SQL by normalized shape (same fingerprint as the slow query
+log). A shape repeated `QUERY_INSPECTOR_REPEAT_THRESHOLD` times or more is
+almost always a lazy relation read inside a loop; each one is reported with the
+code lines that issued it. Used by `QueryInspectorMiddleware` (dev) and by the
+query budget tests.
+"""
+from __future__ import annotations
+
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from .querylog import app_frame, normalize_sql
+
+
+def repeat_threshold() -> int:
+    return int(getattr(settings, 'QUERY_INSPECTOR_REPEAT_THRESHOLD', 5))
+
+
+@dataclass
+class QueryShape:
+    sql: str
+    count: int = 0
+    duration_ms: float = 0.0
+    origins: Counter = field(default_factory=Counter)
+
+
+@dataclass
+class RepeatedQuery:
+    sql: str
+    count: int
+    duration_ms: float
+    origins: List[str]
+
+    def __str__(self) -> str:
+        return f"{self.count}x ({self.duration_ms:.1f} ms) {self.sql[:200]} <- {', '.join(self.origins) or '?'}"
+
+
+class QueryInspector:
+    """`connection.execute_wrapper` that groups queries by shape.
+
+    Origins (stack walks) are only collected when `with_origins` is set, since
+    extracting a traceback per query is the expensive part.
+    """
+
+    def __init__(self, with_origins: bool = True):
+        self.with_origins = with_origins
+        self.shapes: Dict[str, QueryShape] = {}
+        self.count = 0
+        self.duration_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            normalized = normalize_sql(sql)
+            shape = self.shapes.get(normalized)
+            if shape is None:
+                shape = self.shapes[normalized] = QueryShape(normalized)
+            shape.count += 1
+            shape.duration_ms += elapsed
+            if self.with_origins:
+                shape.origins[app_frame()] += 1
+            self.count += 1
+            self.duration_ms += elapsed
+
+    def repeated(self, threshold: Optional[int] = None) -> List[RepeatedQuery]:
+        """Shapes executed at least `threshold` times, most frequent first."""
+        threshold = threshold or repeat_threshold()
+        return [
+            RepeatedQuery(s.sql, s.count, s.duration_ms, [o for o, _ in s.origins.most_common(3) if o])
+            for s in sorted(self.shapes.values(), key=lambda s: -s.count)
+            if s.count >= threshold
+        ]
+
+
+@contextmanager
+def inspect_queries(with_origins: bool = True, using: Optional[List[str]] = None) -> Iterator[QueryInspector]:
+    """`with inspect_queries() as qi: ...` then read `qi.count` / `qi.repeated()`."""
+    inspector = QueryInspector(with_origins)
+    with ExitStack() as stack:
+        for alias in using or list(connections):
+            stack.enter_context(connections[alias].execute_wrapper(inspector))
+        yield inspector
@@ -0,0 +1,247 @@
+"""Slow-query capture: fingerprinting, sampled EXPLAIN and index hints.
+
+Used by `core.middleware.SlowQueryMiddleware`; results land in `SlowQuery`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import traceback
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES = re.compile(r"\bVALUES\s*\(.*\)", re.IGNORECASE | re.DOTALL)
+_CASE_WHEN = re.compile(r"(?:WHEN \? THEN (?:CAST\(\? AS [\w ]+(?:\([^)]*\))?\)|\?) ?){2,}", re.IGNORECASE)
+# Keeps bulk statements within a MySQL TEXT column
+MAX_SQL_LENGTH = 10000
+_SPACE = re.compile(r"\s+")
+
+_COL = r'[`"](\w+)[`"]\.[`"](\w+)[`"]'
+_EQ = re.compile(_COL + r"\s*(?:=\s*(?:%s|\?|'|-?\d)|IN\s*\(|IS\s+NULL)", re.IGNORECASE)
+_NOT_BOOL = re.compile(r"\bNOT\s+" + _COL, re.IGNORECASE)
+_BARE_BOOL = re.compile(r"(?:\(|\bAND\s+|\bOR\s+)" + _COL + r"\s*(?=\)|\s+AND\b|\s+OR\b)", re.IGNORECASE)
+_RANGE = re.compile(_COL + r"\s*(?:<|>|BETWEEN\b)", re.IGNORECASE)
+_WHERE = re.compile(r"\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|\bFOR UPDATE\b|$)", re.IGNORECASE | re.DOTALL)
+
+# Frames from these paths are never the "origin" of a query
+_SKIP_FRAMES = ('site-packages', 'dist-packages', '/django/', '/rest_framework/', 'core/querylog.py',
+                'core/queryinspect.py', 'core/middleware.py')
+# Shared mixins/helpers; only reported when no app frame issued the query
+_GENERIC_FRAMES = ('core/',)
+
+
+def threshold_ms() -> float:
+    return float(getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200))
+
+
+def explain_rate() -> float:
+    return float(getattr(settings, 'SLOW_QUERY_EXPLAIN_RATE', 0.1))
+
+
+def normalize_sql(sql: str) -> str:
+    """Replace literals/params by `?` and collapse IN-lists so equal queries share a fingerprint."""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _VALUES.sub('VALUES (...)', sql)
+    sql = _SPACE.sub(' ', sql).strip()
+    # bulk_update()-style CASE pk WHEN ... THEN ... lists
+    return _CASE_WHEN.sub('WHEN ? THEN ? ... ', sql)[:MAX_SQL_LENGTH]
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def app_frame() -> str:
+    """`path:line in func` of the innermost project frame that issued the query."""
+    base = str(settings.BASE_DIR)
+    fallback = ''
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        relative = filename[len(base) + 1:]
+        # manage.py / zascapay/wsgi.py are entry points, not query origins
+        if not filename.startswith(base) or '/' not in relative or relative.startswith('zascapay/') \
+                or any(s in filename for s in _SKIP_FRAMES):
+            continue
+        location = f'{relative}:{frame.lineno} in {frame.name}'
+        if not relative.startswith(_GENERIC_FRAMES):
+            return location
+        fallback = fallback or location
+    return fallback
+
+
+@dataclass
+class CapturedQuery:
+    alias: str
+    sql: str
+    params: Optional[Sequence]
+    duration_ms: float
+    source: str
+
+
+class QueryRecorder:
+    """`connection.execute_wrapper` callable that keeps queries slower than the threshold.
+
+    Only timing happens inside the wrapper; persisting (and EXPLAIN) is done
+    later by `flush()`, outside the wrapper, so it never records itself.
+    """
+
+    max_entries = 50
+
+    def __init__(self, alias: str, threshold: float):
+        self.alias = alias
+        self.threshold = threshold
+        self.captured: List[CapturedQuery] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            if elapsed >= self.threshold and len(self.captured) < self.max_entries:
+                self.captured.append(CapturedQuery(
+                    self.alias, sql, None if many else params, elapsed, app_frame(),
+                ))
+
+
+# --------------------------
+# EXPLAIN / index hints
+# --------------------------
+
+def explain(alias: str, sql: str, params) -> Tuple[list, List[str]]:
+    """Run EXPLAIN for a SELECT; returns (plan rows, tables read by full scan)."""
+    connection = connections[alias]
+    vendor = connection.vendor
+    prefix = 'EXPLAIN QUERY PLAN ' if vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        columns = [c[0] for c in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    full_scans = []
+    for row in rows:
+        if vendor == 'mysql' and str(row.get('type', '')).upper() == 'ALL' and row.get('table'):
+            full_scans.append(row['table'])
+        elif vendor == 'sqlite':
+            detail = str(row.get('detail', ''))
+            if detail.startswith('SCAN ') and 'USING' not in detail:
+                full_scans.append(detail.split()[1])
+        elif vendor == 'postgresql':
+            match = re.search(r'Seq Scan on (\w+)', str(next(iter(row.values()), '')))
+            if match:
+                full_scans.append(match.group(1))
+    return rows, full_scans
+
+
+def predicate_columns(sql: str, table: str) -> List[str]:
+    """Columns of `table` used in WHERE: equality predicates first, then one range column."""
+    where = _WHERE.search(sql)
+    if not where:
+        return []
+    clause = where.group(1)
+    equality = []
+    for pattern in (_EQ, _NOT_BOOL, _BARE_BOOL):
+        equality += [(m.start(), m.group(2)) for m in pattern.finditer(clause) if m.group(1) == table]
+    columns = []
+    for _, column in sorted(equality):
+        if column not in columns:
+            columns.append(column)
+    for m in _RANGE.finditer(clause):
+        if m.group(1) == table and m.group(2) not in columns:
+            columns.append(m.group(2))
+            break
+    return columns
+
+
+def recommend_index(alias: str, sql: str, tables: Sequence[str]) -> str:
+    """Composite index that would serve the WHERE clause, unless an existing index already leads with it."""
+    connection = connections[alias]
+    hints = []
+    for table in dict.fromkeys(tables):
+        columns = predicate_columns(sql, table)
+        if not columns:
+            continue
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        covered = any(
+            (c.get('index') or c.get('primary_key') or c.get('unique'))
+            and list(c.get('columns') or [])[:len(columns)] == columns
+            for c in constraints.values()
+        )
+        if not covered:
+            hints.append(f"{table}({', '.join(columns)})")
+    return '; '.join(hints)
+
+
+# --------------------------
+# Persistence
+# --------------------------
+
+def flush(captured: Sequence[CapturedQuery], view: str = '') -> None:
+    """Aggregate captured queries into `SlowQuery` rows by fingerprint."""
+    from .models import SlowQuery
+
+    rate = explain_rate()
+    now = timezone.now()
+    for query in captured:
+        normalized = normalize_sql(query.sql)
+        fp = fingerprint(normalized)
+        values = {
+            'count': F('count') + 1,
+            'total_ms': F('total_ms') + query.duration_ms,
+            'max_ms': Greatest(F('max_ms'), query.duration_ms),
+            'sample_sql': query.sql[:MAX_SQL_LENGTH],
+            'view': view[:200],
+            'source': query.source[:300],
+            'last_seen': now,
+        }
+        if not SlowQuery.objects.filter(fingerprint=fp).update(**values):
+            try:
+                SlowQuery.objects.create(
+                    fingerprint=fp, normalized_sql=normalized, sample_sql=query.sql[:MAX_SQL_LENGTH], view=view[:200],
+                    source=query.source[:300], count=1, total_ms=query.duration_ms, max_ms=query.duration_ms,
+                )
+            except IntegrityError:
+                # Another worker created it first
+                SlowQuery.objects.filter(fingerprint=fp).update(**values)
+            sample = True
+        else:
+            sample = random.random() < rate
+        if sample and query.params is not None and normalized.upper().startswith('SELECT'):
+            _store_explain(fp, query)
+
+
+def _store_explain(fp: str, query: CapturedQuery) -> None:
+    from .models import SlowQuery
+
+    try:
+        rows, full_scans = explain(query.alias, query.sql, query.params)
+        recommendation = recommend_index(query.alias, query.sql, full_scans) if full_scans else ''
+    except Exception:
+        logger.warning('EXPLAIN failed for slow query %s', fp, exc_info=True)
+        return
+    SlowQuery.objects.filter(fingerprint=fp).update(
+        explain=json.dumps(rows, default=str, ensure_ascii=False),
+        explained_at=timezone.now(),
+        full_scan=bool(full_scans),
+        recommendation=recommendation[:300],
+    )
@@ -0,0 +1,29 @@
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import msgpack
+    _HAS_MSGPACK = True
+except Exception:
+    msgpack = None
+    _HAS_MSGPACK = False
+
+
+class MsgPackRenderer(BaseRenderer):
+    """Binary alternative to JSON (`Accept: application/x-msgpack` or `?format=msgpack`).
+
+    Only usable when the optional `msgpack` package is installed; check
+    `MSGPACK_AVAILABLE` before adding it to `renderer_classes`.
+    """
+
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+MSGPACK_AVAILABLE = _HAS_MSGPACK
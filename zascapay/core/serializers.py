@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+from typing import Callable, Optional
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
+from rest_framework import serializers
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def split_param(value) -> list[str]:
+    """Split a comma separated query param (`a,b, c`) into a clean list."""
+    if not value:
+        return []
+    return [part.strip() for part in str(value).split(',') if part.strip()]
+
+
+class DynamicFieldsMixin:
+    """Sparse fieldsets (`?fields=`) and expansion (`?expand=`) for ModelSerializers.
+
+    - `fields`: comma separated list of fields to return. Without it every
+      default field is returned, so existing clients are unaffected.
+    - `expand`: comma separated names from `Meta.expandable_fields`. An
+      expanded field is always returned; when an expansion serializer is
+      configured it replaces the primary key with a nested object.
+
+    Both can also be passed as constructor kwargs (`fields=[...]`, `expand=[...]`).
+    Query params are only honoured on safe methods so a write never silently
+    drops a writable field.
+
+    Extra Meta options:
+      - expandable_fields: {name: SerializerClass | None}. `None` marks a heavy
+        field (e.g. nested items) that stays in the default output but is
+        opt-in once `fields` is given.
+      - field_sources: {name: (orm lookups, ...)} for SerializerMethodFields so
+        `optimize_queryset` knows which columns they read.
+      - prefetch_fields: {name: prefetch lookup} for reverse relations.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        if request is not None and request.method in SAFE_METHODS:
+            params = request.query_params
+            if fields is None and 'fields' in params:
+                fields = split_param(params.get('fields'))
+            if expand is None:
+                expand = split_param(params.get('expand'))
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        self._expanded = {name for name in (expand or []) if name in expandable}
+        for name in self._expanded:
+            nested = expandable[name]
+            if nested is not None:
+                self.fields[name] = nested(read_only=True)
+
+        if fields:
+            keep = set(fields) | self._expanded
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+
+    # ------------------------------------------------------------------
+    # Queryset trimming
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def optimize_queryset(cls, qs: QuerySet, request=None, **kwargs) -> QuerySet:
+        """Trim `qs` to what the selected fields actually read.
+
+        Applies `only()` on the columns behind each field, keeps `select_related`
+        to the relations that are still needed and adds `prefetch_related` only
+        for selected nested collections. Leaves columns and joins untouched when a
+        field's source cannot be resolved (e.g. an undeclared method field).
+        """
+        serializer = cls(context={'request': request}, **kwargs)
+        meta = serializer.Meta
+        field_sources = getattr(meta, 'field_sources', {})
+        prefetch_fields = getattr(meta, 'prefetch_fields', {})
+        model = qs.model
+
+        only: set[str] = set()
+        related: set[str] = set()
+        prefetch: set[str] = set()
+        trimmable = True
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in prefetch_fields:
+                lookup = prefetch_fields[name]
+                prefetch.add(lookup)
+                # Keep the forward part of the path (e.g. `order` in `order__items`)
+                head = _forward_path(model, lookup.split('__'))
+                if head:
+                    related.add(head)
+                    only.add(head)
+                continue
+            if name in field_sources:
+                lookups = field_sources[name]
+            elif isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+                trimmable = False
+                continue
+            else:
+                lookups = ('__'.join(field.source_attrs),)
+            for lookup in lookups:
+                resolved = _resolve_lookup(model, lookup, nested=isinstance(field, serializers.BaseSerializer))
+                if resolved is None:
+                    continue
+                columns, relation = resolved
+                only.update(columns)
+                if relation:
+                    related.add(relation)
+
+        if prefetch:
+            qs = qs.prefetch_related(*sorted(prefetch))
+        if not trimmable:
+            return qs
+        qs = qs.select_related(None)
+        if related:
+            qs = qs.select_related(*sorted(related))
+        if only:
+            qs = qs.only(*sorted(only))
+        return qs
+
+
+def _forward_path(model, parts: list[str]) -> str:
+    """Return the longest leading chain of forward FK/one-to-one names in `parts`."""
+    path = []
+    for part in parts:
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            break
+        if not (field.is_relation and (field.many_to_one or field.one_to_one) and field.concrete):
+            break
+        path.append(part)
+        model = field.related_model
+    return '__'.join(path)
+
+
+def _resolve_lookup(model, lookup: str, *, nested: bool = False) -> Optional[tuple[set[str], str]]:
+    """Map a serializer source (`category__name`) to `only()` columns and a select_related path.
+
+    Returns None for attributes that are not model fields (properties, the
+    `id` alias on Order, ...), which are then simply not restricted.
+    """
+    parts = lookup.split('__')
+    columns: set[str] = set()
+    path: list[str] = []
+    for index, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            if part == 'id' and path:
+                # `store.id` style sources only need the FK column itself
+                return columns, '__'.join(path)
+            return None
+        if not field.concrete:
+            return None
+        path.append(field.name)
+        columns.add('__'.join(path))
+        is_last = index == len(parts) - 1
+        if field.is_relation:
+            if not (field.many_to_one or field.one_to_one):
+                return None
+            if is_last and not nested:
+                # Plain FK output (primary key) - no join required
+                return columns, '__'.join(path[:-1])
+            model = field.related_model
+            if is_last:
+                # Nested serializer over the relation: load the whole related row. Listed
+                # explicitly, since another field's `category__name` would otherwise
+                # restrict the join to that column and defer the rest (one query per row).
+                prefix = '__'.join(path)
+                columns.update(f'{prefix}__{f.name}' for f in model._meta.concrete_fields)
+                return columns, prefix
+    relation = '__'.join(path[:-1])
+    return columns, relation
+
+
+# ----------------------------------------------------------------------
+# Compiled read path
+# ----------------------------------------------------------------------
+
+_SKIP = object()
+
+
+def choice_label(choices) -> Callable:
+    """Build a `value -> label` lookup equivalent to `get_<field>_display()`."""
+    labels = {value: str(label) for value, label in choices.choices}
+    return lambda value: labels.get(value, value)
+
+
+def full_name_or_username(first_name, last_name, username):
+    """Same output as the `get_user_name` serializer methods, from raw columns."""
+    if username is None:
+        return None
+    full_name = ('%s %s' % (first_name, last_name)).strip()
+    return full_name or username
+
+
+class CompiledPlan:
+    """Row -> dict renderer for one concrete field selection of a serializer."""
+
+    def __init__(self, model, keys, entries, nested):
+        self.model = model
+        self.keys = keys
+        self.entries = entries
+        self.nested = nested
+
+    def values(self, qs: QuerySet) -> QuerySet:
+        return qs.prefetch_related(None).values(*self.keys)
+
+    def render(self, rows) -> list[dict]:
+        entries = self.entries
+        out = []
+        append = out.append
+        for row in rows:
+            item = {}
+            for name, kind, key, arg in entries:
+                if kind == 0:  # plain column
+                    value = row[key]
+                    item[name] = None if value is None else arg(value)
+                elif kind == 1:  # column behind nullable relation(s)
+                    if any(row[guard] is None for guard in arg[0]):
+                        if arg[2] is not _SKIP:
+                            item[name] = arg[2]
+                        continue
+                    value = row[key]
+                    item[name] = None if value is None else arg[1](value)
+                elif kind == 2:  # computed from several columns
+                    item[name] = arg(*[row[k] for k in key])
+                elif kind == 3:  # nested collection, filled below
+                    if row[key] is not None:
+                        item[name] = []
+                else:  # constant (e.g. nullable attribute missing on the model)
+                    if arg is not _SKIP:
+                        item[name] = arg
+            append(item)
+        if self.nested and out:
+            self._render_nested(rows, out)
+        return out
+
+    def _render_nested(self, rows, out):
+        for name, parent_key, child_key, child_plan in self.nested:
+            parents = {row[parent_key] for row in rows if row[parent_key] is not None}
+            if not parents:
+                continue
+            children: dict = {}
+            child_rows = list(
+                child_plan.model.objects
+                .filter(**{f'{child_key}__in': parents})
+                .order_by('pk')
+                .values(*child_plan.keys, child_key)
+            )
+            for child_row, rendered in zip(child_rows, child_plan.render(child_rows)):
+                children.setdefault(child_row[child_key], []).append(rendered)
+            for row, item in zip(rows, out):
+                if name in item:
+                    item[name] = children.get(row[parent_key], [])
+
+
+class CompiledSerializer:
+    """Read-only, compiled counterpart of a ModelSerializer for hot list endpoints.
+
+    Builds output dicts straight from `.values()` rows instead of hydrating
+    model instances and walking DRF fields one by one. Each field is resolved
+    once per field selection into a column key plus a converter (the field's
+    own `to_representation`, so formatting is identical), method fields are
+    declared through `computed` and nested collections through `nested`.
+
+    `plan(serializer)` returns None when the selection contains something that
+    cannot be compiled (an undeclared method field, an expanded relation, ...);
+    callers then fall back to the regular serializer.
+
+    computed: {name: ((lookup, ...), func)} - func receives the column values.
+    nested:   {name: (CompiledSerializer, parent_key, child_key)} - children are
+              loaded in one query with `child_key__in` the parent key values.
+    """
+
+    def __init__(self, serializer_class, *, computed=None, nested=None):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.computed = computed or {}
+        self.nested = nested or {}
+        self._plans: dict[tuple, Optional[CompiledPlan]] = {}
+
+    def plan(self, serializer=None) -> Optional[CompiledPlan]:
+        if serializer is None:
+            serializer = self.serializer_class()
+        fields = serializer.fields
+        cache_key = tuple((name, type(field)) for name, field in fields.items())
+        try:
+            return self._plans[cache_key]
+        except KeyError:
+            pass
+        plan = self._compile(fields)
+        self._plans[cache_key] = plan
+        return plan
+
+    def _compile(self, fields) -> Optional[CompiledPlan]:
+        keys: list[str] = []
+        entries = []
+        nested = []
+
+        def use(key):
+            if key not in keys:
+                keys.append(key)
+            return key
+
+        for name, field in fields.items():
+            if field.write_only:
+                continue
+            if name in self.nested:
+                compiled, parent_key, child_key = self.nested[name]
+                child = getattr(field, 'child', None)
+                child_plan = compiled.plan(child) if child is not None else None
+                if child_plan is None:
+                    return None
+                entries.append((name, 3, use(parent_key), None))
+                nested.append((name, parent_key, child_key, child_plan))
+                continue
+            if name in self.computed:
+                lookups, func = self.computed[name]
+                entries.append((name, 2, tuple(use(k) for k in lookups), func))
+                continue
+            if (
+                isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer))
+                or field.source == '*'
+            ):
+                return None
+            resolved = _resolve_column(self.model, field.source_attrs)
+            if resolved is None:
+                return None
+            key, guards = resolved
+            if key is not None and not guards:
+                entries.append((name, 0, use(key), _converter(field)))
+                continue
+            # The attribute can be missing (nullable relation / no such column)
+            missing = _missing_value(field)
+            if missing is None:
+                return None
+            if key is None:
+                entries.append((name, 4, None, missing[0]))
+            else:
+                entries.append((name, 1, use(key), ([use(g) for g in guards], _converter(field), missing[0])))
+        return CompiledPlan(self.model, keys, entries, nested)
+
+
+def _missing_value(field) -> Optional[tuple]:
+    """What DRF outputs when the source attribute is missing (see Field.get_attribute)."""
+    if field.default is not serializers.empty:
+        return None  # defaults may be callables needing context - not compiled
+    if field.allow_null:
+        return (None,)
+    if not field.required:
+        return (_SKIP,)
+    return None
+
+
+def _resolve_column(model, attrs) -> Optional[tuple[Optional[str], list[str]]]:
+    """Map `source_attrs` to a `.values()` key and the FK keys guarding it.
+
+    Returns (None, []) for an attribute the model does not have at all
+    (DRF then skips the field), and None when the source is a property or
+    reverse relation that cannot be read from a values row.
+    """
+    path: list[str] = []
+    guards: list[str] = []
+    for index, attr in enumerate(attrs):
+        is_last = index == len(attrs) - 1
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            if hasattr(model, attr):
+                return None
+            return None, []
+        if not field.concrete:
+            return None
+        path.append(field.name)
+        if field.is_relation:
+            if not (field.many_to_one or field.one_to_one):
+                return None
+            if is_last:
+                break
+            guards.append('__'.join(path))
+            model = field.related_model
+    return '__'.join(path), guards
+
+
+def _converter(field) -> Callable:
+    field_type = type(field)
+    if field_type is serializers.IntegerField:
+        return int
+    if field_type is serializers.CharField:
+        return str
+    if isinstance(field, serializers.RelatedField):
+        # PrimaryKeyRelatedField renders the raw pk, which is what `.values()` returns
+        return _identity
+    return field.to_representation
+
+
+def _identity(value):
+    return value
@@ -0,0 +1,202 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .models import SlowQuery
+from .queryinspect import inspect_queries
+from .querylog import fingerprint, normalize_sql, predicate_columns
+
+
+class QueryLogHelperTests(TestCase):
+    def test_fingerprint_ignores_params_and_in_list_length(self):
+        a = normalize_sql('SELECT * FROM `store` WHERE `store`.`id` IN (%s, %s) AND `store`.`code` = %s')
+        b = normalize_sql("SELECT * FROM `store`  WHERE `store`.`id` IN (1, 2, 3) AND `store`.`code` = 'X'")
+        self.assertEqual(a, 'SELECT * FROM `store` WHERE `store`.`id` IN (...) AND `store`.`code` = ?')
+        self.assertEqual(fingerprint(a), fingerprint(b))
+
+    def test_predicate_columns_order(self):
+        sql = ('SELECT "store"."id" FROM "store" WHERE ("store"."owner_id" = %s AND NOT "store"."is_deleted" '
+               'AND "store"."status" = %s AND "store"."last_updated_at" > %s) ORDER BY "store"."name" ASC')
+        self.assertEqual(predicate_columns(sql, 'store'), ['owner_id', 'is_deleted', 'status', 'last_updated_at'])
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_RATE=1)
+class SlowQueryMiddlewareTests(TestCase):
+    def test_queries_are_aggregated_with_view_and_plan(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username='u1', password='secret123'))
+        client.get('/api/products/')
+        client.get('/api/products/')
+
+        row = SlowQuery.objects.filter(normalized_sql__startswith='SELECT', view='product-list').first()
+        self.assertIsNotNone(row)
+        self.assertEqual(row.count, 2)
+        self.assertTrue(row.explain)
+        self.assertIn('.py:', row.source)
+
+
+class QueryInspectorTests(TestCase):
+    def test_repeated_shapes_are_reported_with_origin(self):
+        users = get_user_model().objects
+        pks = [users.create_user(username=f'u{i}', password='secret123', email=f'u{i}@example.com').pk for i in range(6)]
+        with inspect_queries() as inspector:
+            list(users.filter(pk__in=pks))
+            for pk in pks:
+                users.get(pk=pk)
+        repeated = inspector.repeated(threshold=5)
+        self.assertEqual(inspector.count, 7)
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual(repeated[0].count, 6)
+        self.assertIn('core/tests.py', repeated[0].origins[0])
+
+    @override_settings(QUERY_INSPECTOR=True)
+    def test_middleware_is_quiet_without_repeated_queries(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username='u1', password='secret123'))
+        with self.assertNoLogs('core.middleware', level='WARNING'):
+            response = client.get('/api/products/')
+        self.assertTrue(int(response['X-Query-Count']) > 0)
+
+    @override_settings(QUERY_INSPECTOR=True, QUERY_INSPECTOR_REPEAT_THRESHOLD=5)
+    def test_middleware_logs_repeated_queries(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from product.models import Product, ProductCategory
+        from .middleware import QueryInspectorMiddleware
+
+        for i in range(6):
+            Product.objects.create(name=f'P{i}', sku=f'SKU{i}', category=ProductCategory.objects.create(name=f'C{i}'))
+
+        def view(request):
+            # N+1: one category query per product
+            return HttpResponse(', '.join(p.category.name for p in Product.objects.order_by('id')))
+
+        with self.assertLogs('core.middleware', level='WARNING') as logs:
+            response = QueryInspectorMiddleware(view)(RequestFactory().get('/products/'))
+        self.assertEqual(response['X-Query-Count'], '7')
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Repeated queries in GET /products/ (7 queries total)', logs.output[0])
+        self.assertIn('core/tests.py', logs.output[0])
+
+
+def seed_api_data(rows: int = 5, tag: str = ''):
+    """A system admin and an owner with `rows` stores, products, scans, orders and payments."""
+    from decimal import Decimal
+
+    from analytics.services import record_scan, run_rollups
+    from jobs.models import Job
+    from payment.models import Payment
+    from payment.services import OrderService
+    from product.models import Product, ProductCategory
+    from store.models import Store, StoreCategory, StoreInventory
+
+    User = get_user_model()
+    admin = User.objects.create_user(username=f'root{tag}', password='secret123', email=f'root{tag}@example.com',
+                                     is_staff=True, is_system_admin=True, is_approved=True)
+    owner = User.objects.create_user(username=f'owner{tag}', password='secret123', email=f'owner{tag}@example.com',
+                                     first_name='Lan', is_approved=True)
+    category = StoreCategory.objects.create(name=f'Tạp Hóa{tag}')
+    stores = [Store.objects.create(name=f'S{i}', code=f's{tag}{i}', owner=owner, category=category) for i in range(rows)]
+    product_categories = [ProductCategory.objects.create(name=f'C{tag}{i}') for i in range(2)]
+    products = [Product.objects.create(name=f'P{tag}{i}', sku=f'SKU{tag}{i}', category=product_categories[i % 2]) for i in range(rows)]
+    StoreInventory.objects.bulk_create([
+        StoreInventory(store=stores[0], product=p, price=Decimal('3.00'), quantity=100) for p in products
+    ])
+    for i in range(rows):
+        record_scan(stores[0].id, [{'product_id': products[i].id}])
+        order = OrderService.create_order(owner, [{'product_id': p.id, 'quantity': 1} for p in products[:2]])
+        Payment.objects.create(order=order, store=stores[0], status=Payment.Status.SUCCESS)
+    Job.objects.create(kind='store.bulk_restart', created_by=owner, total=rows)
+    with override_settings(ANALYTICS_SETTLE_LAG=0):
+        run_rollups()
+    return admin, owner, stores, products
+
+
+class QueryBudgetTests(TestCase):
+    """Fixed number of queries per API endpoint, whatever the number of rows.
+
+    Each endpoint is called with 2 and with 6 seeded rows: the count must be the
+    budget both times and no query shape may repeat (N+1). Raise a budget only
+    together with the change that needs it.
+    """
+
+    # (user, url, max queries); ids are filled from the seeded rows
+    BUDGETS = [
+        ('owner', '/api/products/', 3),
+        ('owner', '/api/products/?expand=category', 3),
+        ('owner', '/api/products/metrics/', 3),
+        ('owner', '/api/products/export/', 1),
+        ('owner', '/api/products/{product}/', 2),
+        ('owner', '/api/categories/', 3),
+        ('owner', '/api/sync/catalog/', 4),
+        ('owner', '/api/stores/', 3),
+        ('owner', '/api/stores/?expand=category', 3),
+        ('owner', '/api/stores/metrics/', 3),
+        ('owner', '/api/stores/export/', 1),
+        ('owner', '/api/stores/{store}/', 2),
+        ('owner', '/api/stores/{store}/inventory/', 2),
+        ('owner', '/api/orders/', 2),
+        ('owner', '/api/orders/?expand=items', 3),
+        ('owner', '/api/orders/{order}/', 2),
+        ('owner', '/api/payments/', 2),
+        ('owner', '/api/payments/?expand=items', 2),
+        ('owner', '/api/payments/{payment}/', 2),
+        ('owner', '/api/jobs/{job}/', 1),
+        ('owner', '/api/analytics/stores/{store}/series/', 2),
+        ('owner', '/api/analytics/stores/{store}/products/', 3),
+        ('admin', '/api/users/', 1),
+        ('admin', '/api/users/{owner}/', 1),
+        ('admin', '/api/orders/?status=pending&created_from=2020-01-01', 2),
+        ('admin', '/api/payments/?expand=items', 2),
+    ]
+
+    def _measure(self, client, url, method='get', **kwargs):
+        from store.pricebook import clear_price_books
+
+        clear_price_books()
+        with inspect_queries() as inspector:
+            response = getattr(client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 300, f'{url}: {response.status_code} {getattr(response, "data", "")}')
+        return inspector
+
+    def _client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def _urls(self, owner, stores, products):
+        from jobs.models import Job
+        from payment.models import Order, Payment
+
+        store, order = stores[0], Order.objects.filter(user=owner).first()
+        return {
+            'product': products[0].id, 'store': store.id, 'order': order.order_id,
+            'payment': Payment.objects.filter(order__user=owner).first().id, 'job': Job.objects.get(created_by=owner).id, 'owner': owner.id,
+        }
+
+    def _counts(self, rows, tag):
+        admin, owner, stores, products = seed_api_data(rows, tag)
+        ids = self._urls(owner, stores, products)
+        counts = {}
+        for user, url, budget in self.BUDGETS:
+            client = self._client(admin if user == 'admin' else owner)
+            inspector = self._measure(client, url.format(**ids))
+            repeated = inspector.repeated(threshold=3)
+            self.assertFalse(repeated, f'{url}: repeated queries (N+1?)\n' + '\n'.join(map(str, repeated)))
+            self.assertLessEqual(inspector.count, budget, f'{url}: {inspector.count} queries, budget {budget}')
+            counts[url] = inspector.count
+        return counts
+
+    def test_get_endpoints_within_budget(self):
+        small = self._counts(2, 'a')
+        self.assertEqual(self._counts(6, 'b'), small)
+
+    def test_create_order_within_budget(self):
+        admin, owner, stores, products = seed_api_data(2)
+        client = self._client(owner)
+        for size in (1, 5):
+            body = {'items': [{'product_id': p.id, 'quantity': 1} for p in products[:size]]}
+            inspector = self._measure(client, '/api/orders/', 'post', data=body, format='json')
+            # store + price book + stock UPDATE + catalog log + order + items, and the savepoints
+            self.assertLessEqual(inspector.count, 9)
+            self.assertFalse(inspector.repeated(threshold=3))
@@ -0,0 +1,125 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+class CompiledListMixin:
+    """Serve `list` through a `CompiledSerializer` when it can render the selection.
+
+    Set `compiled_serializer` on the viewset. Any selection the compiled path
+    does not support (e.g. `?expand=category`) falls back to the regular
+    DRF serializer, so the response body is the same either way.
+    """
+
+    compiled_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        plan = None
+        if self.compiled_serializer is not None:
+            plan = self.compiled_serializer.plan(self.get_serializer())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = plan.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(queryset))
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified support for `list` and `retrieve` of a viewset.
+
+    Validators are computed with one cheap query instead of rendering the
+    response: `MAX(<last_modified_field>)` and `COUNT(*)` over the filtered
+    queryset for lists, the row's own timestamp for details. They are mixed
+    with the request path, query string, user and media type, so an unchanged
+    poll answers `304 Not Modified` without serializing anything.
+
+    Writes that bypass `save()` (`QuerySet.update`) must set the timestamp
+    themselves, otherwise clients keep seeing the cached representation.
+    """
+
+    last_modified_field = 'last_updated_at'
+    # Timestamps of joined rows that are rendered too (e.g. `category__updated_at`
+    # for `category_name`)
+    related_modified_fields: tuple = ()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(request, self.collection_state(queryset),
+                                         super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        queryset = self.filter_queryset(self.get_queryset())
+        row = (
+            queryset.filter(**{self.lookup_field: lookup})
+            .order_by()
+            .values_list(self.last_modified_field, *self.related_modified_fields)
+            .first()
+        )
+        if row is None:
+            # Let the regular path answer 404
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(request, (lookup, *row), super().retrieve, *args, **kwargs)
+
+    def collection_state(self, queryset) -> tuple:
+        aggregates = {'last': Max(self.last_modified_field), 'count': Count('pk')}
+        for index, field in enumerate(self.related_modified_fields):
+            aggregates[f'related_{index}'] = Max(field)
+        state = queryset.order_by().aggregate(**aggregates)
+        return tuple(state.values())
+
+    def conditional_response(self, request, state: tuple, handler, *args, **kwargs):
+        etag = self._make_etag(request, state)
+        last_modified = _last_modified(state)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            _set_validators(not_modified, etag, last_modified)
+            return not_modified
+        response = handler(request, *args, **kwargs)
+        if 200 <= response.status_code < 300:
+            _set_validators(response, etag, last_modified)
+        return response
+
+    def _make_etag(self, request, state: tuple) -> str:
+        user = getattr(request, 'user', None)
+        parts = [
+            request.path,
+            '&'.join(sorted(f'{k}={v}' for k, values in request.query_params.lists() for v in values)),
+            str(getattr(user, 'pk', '') or ''),
+            getattr(request, 'accepted_media_type', '') or '',
+            *(_state_repr(value) for value in state),
+        ]
+        return quote_etag(hashlib.md5('|'.join(parts).encode('utf-8'), usedforsecurity=False).hexdigest())
+
+
+def _state_repr(value) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return '' if value is None else str(value)
+
+
+def _last_modified(state: tuple) -> Optional[int]:
+    stamps = [value for value in state if isinstance(value, datetime)]
+    if not stamps:
+        return None
+    latest = max(stamps)
+    if timezone.is_naive(latest):
+        latest = timezone.make_aware(latest)
+    return int(latest.timestamp())
+
+
+def _set_validators(response, etag: str, last_modified: Optional[int]) -> None:
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Always revalidate: the browser re-sends If-None-Match and gets a cheap 304
+    patch_cache_control(response, private=True, no_cache=True)
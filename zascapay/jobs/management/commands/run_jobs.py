@@ -0,0 +1,34 @@
+import os
+import signal
+import socket
+
+from django.core.management.base import BaseCommand
+
+from jobs.registry import registered_kinds
+from jobs.services import work
+
+
+class Command(BaseCommand):
+    help = "Chạy worker xử lý background job (queue trong DB). Có thể chạy nhiều process song song."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Xử lý hết job đang chờ rồi thoát')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Số giây chờ khi queue rỗng')
+        parser.add_argument('--worker-id', default='', help='Mặc định: <hostname>:<pid>')
+
+    def handle(self, *args, **opts):
+        worker_id = opts['worker_id'] or f'{socket.gethostname()}:{os.getpid()}'
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            # Finish the current job, then exit
+            stopping = True
+            self.stdout.write(self.style.WARNING(f'{worker_id}: stopping after current job'))
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f"{worker_id}: handling {', '.join(registered_kinds()) or '(no job kinds)'}")
+        ran = work(worker_id, once=opts['once'], poll_interval=opts['poll_interval'], should_stop=lambda: stopping)
+        self.stdout.write(self.style.SUCCESS(f'{worker_id}: {ran} job(s) processed'))
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Background job chạy bởi `manage.py run_jobs` (queue lưu trong DB, không cần broker).
+
+    `kind` là tên handler đã đăng ký (xem `jobs.registry`); `payload` là input
+    JSON. Tiến độ fan-out theo từng item (vd. từng store) nằm ở total/done/failed.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Đang Chờ'
+        RUNNING = 'running', 'Đang Chạy'
+        SUCCEEDED = 'succeeded', 'Thành Công'
+        FAILED = 'failed', 'Thất Bại'
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Not picked up before this time (retry backoff)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Worker holding the job; locked_at doubles as heartbeat for crash recovery
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    total = models.PositiveIntegerField(default=0)
+    done = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'jobs'
+        indexes = [
+            # Worker poll: status = queued AND run_after <= now ORDER BY run_after
+            models.Index(fields=['status', 'run_after'], name='idx_jobs_status_run_after'),
+        ]
+        ordering = ['-created_at']
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+
+    @property
+    def progress(self) -> float:
+        if not self.total:
+            return 100.0 if self.status in (self.Status.SUCCEEDED, self.Status.FAILED) else 0.0
+        return round((self.done + self.failed) * 100 / self.total, 1)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"Job #{self.pk} {self.kind} ({self.status})"
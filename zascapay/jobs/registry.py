@@ -0,0 +1,24 @@
+from typing import Callable, Dict, Optional
+
+_handlers: Dict[str, Callable] = {}
+
+
+def register(kind: str, handler: Optional[Callable] = None):
+    """Register `handler(job) -> result` for `kind`; usable as a decorator."""
+    def decorator(func: Callable) -> Callable:
+        if kind in _handlers and _handlers[kind] is not func:
+            raise ValueError(f'Job kind already registered: {kind}')
+        _handlers[kind] = func
+        return func
+    return decorator(handler) if handler is not None else decorator
+
+
+def get_handler(kind: str) -> Callable:
+    try:
+        return _handlers[kind]
+    except KeyError:
+        raise ValueError(f'Unknown job kind: {kind}')
+
+
+def registered_kinds():
+    return sorted(_handlers)
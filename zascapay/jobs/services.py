@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .registry import get_handler
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+# --------------------------
+# Queue
+# --------------------------
+
+def enqueue(kind: str, payload: Optional[dict] = None, *, user=None, total: int = 0,
+            max_attempts: Optional[int] = None) -> Job:
+    get_handler(kind)  # fail fast on typos
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        created_by=user if user is not None and user.is_authenticated else None,
+        total=total,
+        max_attempts=max_attempts or _setting('JOB_MAX_ATTEMPTS', 3),
+    )
+
+
+def claim_next_job(worker_id: str) -> Optional[Job]:
+    """Lock the next due job for this worker. SKIP LOCKED lets many workers poll the same table."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            Job.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Job.Status.QUEUED, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.Status.RUNNING
+        job.locked_by = worker_id[:100]
+        job.locked_at = now
+        job.attempts += 1
+        job.started_at = job.started_at or now
+        job.save(update_fields=['status', 'locked_by', 'locked_at', 'attempts', 'started_at'])
+    return job
+
+
+def _release(stale, now) -> int:
+    exhausted = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.Status.FAILED, error='Worker lost', locked_by='', finished_at=now,
+    )
+    return exhausted + stale.update(status=Job.Status.QUEUED, locked_by='', run_after=now)
+
+
+def requeue_stale_jobs() -> int:
+    """Hand jobs of workers that died back to the queue.
+
+    A running job heartbeats every JOB_HEARTBEAT_INTERVAL seconds (see
+    `fan_out`); its worker counts as dead once none of its running jobs has
+    heartbeated for JOB_LOCK_TIMEOUT seconds.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=_setting('JOB_LOCK_TIMEOUT', 600))
+    running = Job.objects.filter(status=Job.Status.RUNNING)
+    # Evaluated first: MySQL can't UPDATE a table filtered by a subquery on itself
+    alive = set(running.filter(locked_at__gte=cutoff).values_list('locked_by', flat=True))
+    return _release(running.filter(locked_at__lt=cutoff).exclude(locked_by__in=alive), now)
+
+
+def release_worker_jobs(worker_id: str) -> int:
+    """Re-queue jobs still locked by `worker_id` (left over by a previous process with the same id)."""
+    return _release(Job.objects.filter(status=Job.Status.RUNNING, locked_by=worker_id[:100]), timezone.now())
+
+
+def heartbeat(job: Job, **progress) -> bool:
+    """Refresh the job's lock (and progress counters); False if another worker has taken the job over."""
+    return Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(locked_at=timezone.now(), **progress) == 1
+
+
+def _save_if_owned(job: Job, owner: str, fields) -> None:
+    # A job re-queued while this worker was stalled belongs to its new worker
+    Job.objects.filter(pk=job.pk, locked_by=owner).update(**{name: getattr(job, name) for name in fields})
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter: base * 2^(attempt-1) * [1, 1.5)."""
+    base = float(_setting('JOB_RETRY_BACKOFF', 2.0))
+    return base * (2 ** max(attempt - 1, 0)) * (1 + random.random() / 2)
+
+
+def run_job(job: Job) -> Job:
+    """Run a claimed job and record the outcome.
+
+    A handler exception re-queues the job with backoff until `max_attempts`.
+    Per-item failures inside `fan_out` are retried there and do not fail the
+    job unless every item failed (retrying would repeat the items that worked).
+    """
+    owner = job.locked_by
+    try:
+        result = get_handler(job.kind)(job)
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed', job.pk, job.kind)
+        job.error = str(exc)[:2000]
+        job.locked_by = ''
+        if job.attempts < job.max_attempts:
+            job.status = Job.Status.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        else:
+            job.status = Job.Status.FAILED
+            job.finished_at = timezone.now()
+        _save_if_owned(job, owner, ['status', 'error', 'locked_by', 'run_after', 'finished_at'])
+        return job
+
+    job.refresh_from_db(fields=['total', 'done', 'failed'])
+    job.result = result
+    job.status = Job.Status.FAILED if job.failed and not job.done else Job.Status.SUCCEEDED
+    job.locked_by = ''
+    job.finished_at = timezone.now()
+    _save_if_owned(job, owner, ['result', 'status', 'locked_by', 'finished_at'])
+    return job
+
+
+# --------------------------
+# Fan-out helper for handlers
+# --------------------------
+
+def _call_with_retry(func: Callable, item, retries: int, threaded: bool):
+    try:
+        for attempt in range(retries + 1):
+            try:
+                return func(item)
+            except Exception:
+                if attempt == retries:
+                    raise
+                time.sleep(retry_delay(attempt + 1))
+    finally:
+        if threaded:
+            # Each pool thread opened its own DB connection
+            connections.close_all()
+
+
+def fan_out(job: Job, items: Iterable, func: Callable, *, concurrency: Optional[int] = None,
+            retries: Optional[int] = None) -> dict:
+    """Run `func(item)` for every item with at most `concurrency` in flight.
+
+    Each item is retried `retries` times with backoff. Progress (`done` /
+    `failed`) is written from the calling thread at most every half second,
+    and the heartbeat at least every JOB_HEARTBEAT_INTERVAL seconds while
+    items are in flight (sequentially, `concurrency=1`, between items only).
+    If the job has been re-queued to another worker meanwhile, items not yet
+    started are cancelled and RuntimeError is raised.
+    Returns `{'succeeded': [...], 'failed': {item: error}}`.
+    """
+    items = list(items)
+    concurrency = concurrency or _setting('JOB_CONCURRENCY', 8)
+    retries = _setting('JOB_ITEM_RETRIES', 2) if retries is None else retries
+    Job.objects.filter(pk=job.pk).update(total=len(items), done=0, failed=0)
+
+    interval = float(_setting('JOB_HEARTBEAT_INTERVAL', 30))
+    succeeded, failed = [], {}
+    last_flush = 0.0
+
+    def flush():
+        nonlocal last_flush
+        last_flush = time.monotonic()
+        return heartbeat(job, done=len(succeeded), failed=len(failed))
+
+    def record(item, error=None):
+        if error is None:
+            succeeded.append(item)
+        else:
+            failed[str(item)] = str(error)[:500]
+        if time.monotonic() - last_flush >= 0.5 or len(succeeded) + len(failed) == len(items):
+            flush()
+
+    if concurrency <= 1:
+        for item in items:
+            try:
+                _call_with_retry(func, item, retries, threaded=False)
+            except Exception as exc:
+                record(item, exc)
+            else:
+                record(item)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'job-{job.pk}') as pool:
+            futures = {pool.submit(_call_with_retry, func, item, retries, True): item for item in items}
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending, timeout=interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record(futures[future], future.exception())
+                if pending and time.monotonic() - last_flush >= interval and not flush():
+                    for future in pending:
+                        future.cancel()
+                    raise RuntimeError(f'Job {job.pk} was re-queued to another worker')
+    return {'succeeded': succeeded, 'failed': failed}
+
+
+# --------------------------
+# Worker loop
+# --------------------------
+
+def work(worker_id: str, *, once: bool = False, poll_interval: float = 1.0, should_stop: Callable[[], bool] = lambda: False) -> int:
+    """Claim and run jobs until `should_stop()` (or the queue is empty when `once`). Returns jobs run."""
+    ran = 0
+    last_reap = 0.0
+    release_worker_jobs(worker_id)
+    while not should_stop():
+        close_old_connections()
+        if time.monotonic() - last_reap > 60:
+            requeue_stale_jobs()
+            last_reap = time.monotonic()
+        job = claim_next_job(worker_id)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        ran += 1
+    return ran
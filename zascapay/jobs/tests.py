@@ -0,0 +1,109 @@
+import io
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from store.models import Store, StoreCategory
+from .models import Job
+from .registry import register
+from . import services
+from .services import claim_next_job, enqueue, fan_out, requeue_stale_jobs, run_job
+
+_calls = []
+
+
+@register('tests.flaky')
+def flaky_handler(job):
+    def action(item):
+        _calls.append(item)
+        if item == 'bad' or (item == 'retry' and _calls.count('retry') < 2):
+            raise RuntimeError(f'{item} failed')
+    return fan_out(job, job.payload['items'], action)
+
+
+@register('tests.slow')
+def slow_handler(job):
+    def action(item):
+        _calls.append(item)
+        time.sleep(0.3)
+    return fan_out(job, job.payload['items'], action, concurrency=2)
+
+
+@register('tests.broken')
+def broken_handler(job):
+    raise RuntimeError('boom')
+
+
+@override_settings(JOB_CONCURRENCY=1, JOB_RETRY_BACKOFF=0)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        _calls.clear()
+
+    def test_fan_out_retries_items_and_tracks_progress(self):
+        job = enqueue('tests.flaky', {'items': ['ok', 'retry', 'bad']})
+        job = run_job(claim_next_job('w1'))
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual((job.total, job.done, job.failed), (3, 2, 1))
+        self.assertEqual(job.result['succeeded'], ['ok', 'retry'])
+        self.assertIn('bad', job.result['failed'])
+        self.assertEqual(_calls.count('bad'), 3)  # 1 + JOB_ITEM_RETRIES
+
+    def test_handler_error_requeues_until_max_attempts(self):
+        job = enqueue('tests.broken', max_attempts=2)
+        self.assertEqual(run_job(claim_next_job('w1')).status, Job.Status.QUEUED)
+        job = run_job(claim_next_job('w1'))
+        self.assertEqual((job.status, job.attempts, job.error), (Job.Status.FAILED, 2, 'boom'))
+        self.assertIsNone(claim_next_job('w1'))
+
+    def test_store_bulk_action_returns_job(self):
+        user = get_user_model().objects.create_user(username='owner1', password='secret123')
+        client = APIClient()
+        client.force_authenticate(user)
+        store = Store.objects.create(name='Shop 1', code='S1', owner=user,
+                                     category=StoreCategory.objects.create(name='Tạp hóa'))
+
+        resp = client.post('/api/stores/bulk_restart/', {'ids': [store.id, 999]}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json()['count'], 1)
+
+        call_command('run_jobs', '--once', stdout=io.StringIO())
+        job = client.get(resp.json()['status_url']).json()
+        self.assertEqual((job['status'], job['done'], job['progress']), ('succeeded', 1, 100.0))
+
+    @override_settings(JOB_HEARTBEAT_INTERVAL=0.05)
+    def test_heartbeat_while_items_run(self):
+        enqueue('tests.slow', {'items': ['a']})
+        with mock.patch.object(services, 'heartbeat', wraps=services.heartbeat) as beat:
+            job = run_job(claim_next_job('w1'))
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        # Timer beats during the 0.3s item, plus the final progress flush
+        self.assertGreaterEqual(beat.call_count, 3)
+
+    @override_settings(JOB_HEARTBEAT_INTERVAL=0.05)
+    def test_job_taken_over_by_another_worker_stops(self):
+        enqueue('tests.slow', {'items': ['a', 'b', 'c', 'd', 'e']})
+        job = claim_next_job('w1')
+        Job.objects.filter(pk=job.pk).update(locked_by='w2')
+        with self.assertLogs('jobs.services', 'ERROR'):
+            run_job(job)
+        self.assertLess(len(_calls), 5)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.Status.RUNNING, 'w2'))
+
+    def test_requeue_only_jobs_of_dead_workers(self):
+        old = timezone.now() - timedelta(hours=1)
+        dead = enqueue('tests.flaky', {'items': []})
+        busy = enqueue('tests.flaky', {'items': []})
+        Job.objects.filter(pk=dead.pk).update(status=Job.Status.RUNNING, locked_by='dead', locked_at=old, attempts=1)
+        Job.objects.filter(pk=busy.pk).update(status=Job.Status.RUNNING, locked_by='busy', locked_at=timezone.now(), attempts=1)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        dead.refresh_from_db()
+        busy.refresh_from_db()
+        self.assertEqual((dead.status, dead.locked_by), (Job.Status.QUEUED, ''))
+        self.assertEqual((busy.status, busy.locked_by), (Job.Status.RUNNING, 'busy'))
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .views import JobDetailView
+
+urlpatterns = [
+    path('api/jobs/<int:pk>/', JobDetailView.as_view(), name='job-detail'),
+]
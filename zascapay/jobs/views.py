@@ -0,0 +1,17 @@
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+
+from .models import Job
+from .serializers import JobSerializer
+
+
+class JobDetailView(generics.RetrieveAPIView):
+    """Trạng thái / tiến độ của một background job (client poll sau khi nhận `job_id`)."""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_staff or getattr(user, 'is_system_admin', False):
+            return Job.objects.all()
+        return Job.objects.filter(created_by=user)
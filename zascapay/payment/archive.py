@@ -0,0 +1,175 @@
+"""Move finished orders (with their items and payments) to the archive tables.
+
+`archive_orders` works in chunks of order ids, each in its own transaction:
+
+    INSERT INTO <t>_archive (cols) SELECT cols FROM <t> WHERE order_id IN (...)
+    DELETE FROM <t> WHERE order_id IN (...)
+
+for `order_items`, `payments` and `orders`, so rows never travel through
+Python and a chunk is either fully moved or not at all. Candidates are locked
+with SKIP LOCKED; an order being updated right now is simply picked up by a
+later run.
+
+Reads: `GET /api/orders/?include_archived=1` (and the detail endpoint) also
+look in the archive; see `OrderViewSet`.
+
+`partition_archive_tables` (MySQL only) range-partitions the archive tables by
+year of `created_at`, so old years can be dropped with `ALTER TABLE ... DROP
+PARTITION`. The live tables are not partitioned: InnoDB does not allow
+partitioned tables with foreign keys, and archiving keeps them small anyway.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, ArchivedPayment, Order, OrderItem, Payment
+
+ARCHIVE_CHUNK_SIZE = 1000
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVABLE_STATUSES = (Order.Status.COMPLETED, Order.Status.CANCELLED, Order.Status.REFUNDED)
+
+# (live model, archive model, column holding the order id)
+_TABLES = (
+    (OrderItem, ArchivedOrderItem, 'order_id'),
+    (Payment, ArchivedPayment, 'order_id'),
+    (Order, ArchivedOrder, 'order_id'),
+)
+
+
+@dataclass
+class ArchiveResult:
+    orders: int = 0
+    items: int = 0
+    payments: int = 0
+    last_order_id: int = 0
+
+
+def archive_columns(live, archived) -> List[str]:
+    """Columns copied from `live` to `archived` (all of the live table's)."""
+    columns = [f.column for f in live._meta.concrete_fields]
+    missing = set(columns) - {f.column for f in archived._meta.concrete_fields}
+    if missing:
+        raise RuntimeError(f'{archived._meta.db_table} lacks columns {sorted(missing)}')
+    return columns
+
+
+def _move(ids: Sequence[int]) -> List[int]:
+    moved = []
+    placeholders = ', '.join(['%s'] * len(ids))
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for live, archived, key in _TABLES:
+            columns = ', '.join(qn(c) for c in archive_columns(live, archived))
+            where = f'{qn(key)} IN ({placeholders})'
+            cursor.execute(
+                f'INSERT INTO {qn(archived._meta.db_table)} ({columns}) '
+                f'SELECT {columns} FROM {qn(live._meta.db_table)} WHERE {where}',
+                list(ids),
+            )
+            cursor.execute(f'DELETE FROM {qn(live._meta.db_table)} WHERE {where}', list(ids))
+            moved.append(cursor.rowcount)
+    return moved
+
+
+def archivable_orders(before: datetime, statuses: Sequence[str] = ARCHIVABLE_STATUSES):
+    return Order.objects.filter(status__in=statuses, created_at__lt=before)
+
+
+def archive_orders(before: datetime, *, statuses: Sequence[str] = ARCHIVABLE_STATUSES,
+                   chunk_size: int = ARCHIVE_CHUNK_SIZE, max_chunks: Optional[int] = None,
+                   progress=None) -> ArchiveResult:
+    """Move orders in `statuses` created before `before`, oldest ids first."""
+    result = ArchiveResult()
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        with transaction.atomic():
+            ids = list(
+                archivable_orders(before, statuses)
+                .select_for_update(skip_locked=True)
+                .filter(order_id__gt=result.last_order_id)
+                .order_by('order_id')
+                .values_list('order_id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            items, payments, orders = _move(ids)
+        result.items += items
+        result.payments += payments
+        result.orders += orders
+        result.last_order_id = ids[-1]
+        chunks += 1
+        if progress is not None:
+            progress(result)
+    return result
+
+
+# --------------------------
+# MySQL partitioning
+# --------------------------
+
+def _partitioned(table: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COUNT(*) FROM information_schema.PARTITIONS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL',
+            [table],
+        )
+        return cursor.fetchone()[0] > 0
+
+
+def _partition_years(table: str, column: str, years_ahead: int) -> List[int]:
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN({qn(column)}) FROM {qn(table)}')
+        oldest = cursor.fetchone()[0]
+    current = timezone.now().year
+    first = oldest.year if oldest else current
+    return list(range(first, current + years_ahead + 1))
+
+
+def partition_statements(years_ahead: int = 1) -> List[str]:
+    """DDL that partitions (or extends the partitions of) the archive tables by YEAR(created_at)."""
+    qn = connection.ops.quote_name
+    statements = []
+    for archived in (ArchivedOrder, ArchivedOrderItem, ArchivedPayment):
+        table = archived._meta.db_table
+        pk = archived._meta.pk.column
+        years = _partition_years(table, 'created_at', years_ahead)
+        ranges = ', '.join(f'PARTITION p{y} VALUES LESS THAN ({y + 1})' for y in years)
+        if not _partitioned(table):
+            # Every unique key of a partitioned table must contain the partitioning column
+            statements.append(
+                f'ALTER TABLE {qn(table)} DROP PRIMARY KEY, ADD PRIMARY KEY ({qn(pk)}, {qn("created_at")}) '
+                f'PARTITION BY RANGE (YEAR({qn("created_at")})) ({ranges}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+            )
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+                    'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [table],
+                )
+                existing = {row[0] for row in cursor.fetchall()}
+            new = [y for y in years if f'p{y}' not in existing and y >= timezone.now().year]
+            if new:
+                parts = ', '.join(f'PARTITION p{y} VALUES LESS THAN ({y + 1})' for y in new)
+                statements.append(
+                    f'ALTER TABLE {qn(table)} REORGANIZE PARTITION pmax INTO '
+                    f'({parts}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+                )
+    return statements
+
+
+def partition_archive_tables(years_ahead: int = 1, execute: bool = True) -> List[str]:
+    if connection.vendor != 'mysql':
+        raise RuntimeError('Partitioning is only supported on MySQL')
+    statements = partition_statements(years_ahead)
+    if execute:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return statements
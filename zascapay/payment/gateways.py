@@ -0,0 +1,300 @@
+"""Payment provider gateways.
+
+`PaymentService.process_payment` talks to a provider in three steps so no DB
+lock is held during the network round-trip:
+
+1. reserve: in a short transaction, lock the order, check it, insert a
+   PENDING `Payment` with our own `reference` (a txid) and commit;
+2. charge: call the gateway outside any transaction, passing the reference
+   as idempotency key so a retried call is never charged twice;
+3. finalize: in a second short transaction, move the payment to
+   SUCCESS/FAILED and mark the order paid.
+
+If step 2 times out the outcome is unknown: the payment stays PENDING and is
+settled later from the provider's side (webhook / reconciliation).
+
+Webhooks are verified and parsed by the gateway (`verify_webhook`,
+`parse_webhook`), stored as `WebhookEvent` and applied in batches by
+`payment.webhooks`.
+
+Gateways are configured in `settings.PAYMENT_GATEWAYS` (like `DATABASES`) and
+selected with `PAYMENT_GATEWAY`.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .txid import new_txid
+
+try:
+    from geventhttpclient import HTTPClient
+    _HAS_GEVENTHTTPCLIENT = True
+except Exception:
+    HTTPClient = None
+    _HAS_GEVENTHTTPCLIENT = False
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """Transport failure (timeout, connection error, 5xx): the charge outcome is unknown."""
+
+
+@dataclass
+class ChargeRequest:
+    reference: str
+    amount: Decimal
+    currency: str
+    method: str
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class GatewayResult:
+    status: str  # 'succeeded' | 'failed' | 'pending'
+    provider_transaction_id: Optional[str] = None
+    error: str = ''
+    raw: dict = field(default_factory=dict)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == 'succeeded'
+
+
+@dataclass
+class GatewayEvent:
+    """Provider notification about one charge, as parsed from a webhook."""
+    event_id: str
+    type: str
+    status: str  # 'succeeded' | 'failed' | anything else is ignored
+    occurred_at: datetime
+    reference: Optional[str] = None
+    provider_transaction_id: Optional[str] = None
+    payload: dict = field(default_factory=dict)
+
+
+SIGNATURE_HEADER = 'X-Signature'
+
+
+def sign_webhook(secret: str, body: bytes) -> str:
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+class PaymentGateway:
+    name = ''
+
+    def __init__(self, name: str, **options):
+        self.name = name
+        self.options = options
+
+    def charge(self, request: ChargeRequest) -> GatewayResult:
+        raise NotImplementedError
+
+    def retrieve(self, reference: str) -> Optional[GatewayResult]:
+        """Provider-side state of the charge made with `reference`, None if the provider never saw it."""
+        raise NotImplementedError
+
+    def verify_webhook(self, body: bytes, headers) -> bool:
+        """HMAC-SHA256 of the raw body with `WEBHOOK_SECRET`; no secret configured means no webhooks."""
+        secret = self.options.get('WEBHOOK_SECRET')
+        if not secret:
+            return False
+        return hmac.compare_digest(sign_webhook(secret, body), headers.get(SIGNATURE_HEADER) or '')
+
+    def parse_webhook(self, payload: dict) -> GatewayEvent:
+        """Event in the `run_stub_provider` format; raises ValueError on a malformed payload.
+
+        `{"id", "type", "created": <unix seconds>, "data": {"id", "reference", "status"}}`.
+        Gateways for real providers override this.
+        """
+        if not isinstance(payload, dict):
+            raise ValueError('payload must be an object')
+        data = payload.get('data')
+        if not payload.get('id') or not payload.get('type') or not isinstance(data, dict):
+            raise ValueError('id, type and data are required')
+        if not data.get('reference') and not data.get('id'):
+            raise ValueError('data.reference or data.id is required')
+        try:
+            occurred_at = datetime.fromtimestamp(float(payload['created']), tz=dt_timezone.utc)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise ValueError('created must be a unix timestamp')
+        if not settings.USE_TZ:
+            occurred_at = timezone.make_naive(occurred_at)
+        return GatewayEvent(
+            event_id=str(payload['id'])[:255],
+            type=str(payload['type'])[:100],
+            status=str(data.get('status') or '')[:20],
+            occurred_at=occurred_at,
+            reference=str(data['reference'])[:40] if data.get('reference') else None,
+            provider_transaction_id=str(data['id'])[:255] if data.get('id') else None,
+            payload=payload,
+        )
+
+
+class SimulatedGateway(PaymentGateway):
+    """In-process provider for local use: every charge succeeds at once with a `SIM-` id."""
+
+    def charge(self, request: ChargeRequest) -> GatewayResult:
+        return GatewayResult('succeeded', f'SIM-{new_txid()}')
+
+    def retrieve(self, reference: str) -> Optional[GatewayResult]:
+        return None
+
+
+# --------------------------
+# HTTP
+# --------------------------
+
+class PooledHttpClient:
+    """JSON over HTTP with a bounded keep-alive connection pool and hard timeouts.
+
+    geventhttpclient pools are not shared across OS threads, so each thread
+    (gunicorn thread, job fan-out worker) gets its own pool of `pool_size`.
+    """
+
+    def __init__(self, base_url: str, *, timeout: float = 5.0, connect_timeout: float = 2.0,
+                 pool_size: int = 10, headers: Optional[Dict[str, str]] = None):
+        if not _HAS_GEVENTHTTPCLIENT:
+            raise ImproperlyConfigured('geventhttpclient is required for HTTP payment gateways')
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.headers = {'Content-Type': 'application/json', 'Accept': 'application/json', **(headers or {})}
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = HTTPClient.from_url(
+                self.base_url,
+                concurrency=self.pool_size,
+                connection_timeout=self.connect_timeout,
+                network_timeout=self.timeout,
+            )
+        return client
+
+    def request(self, method: str, path: str, body: Optional[dict] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, dict]:
+        """Returns (status code, decoded JSON body); raises GatewayError on transport errors."""
+        payload = json.dumps(body, default=str) if body is not None else None
+        try:
+            response = self._client().request(method, path, body=payload, headers={**self.headers, **(headers or {})})
+            try:
+                raw = response.read()
+            finally:
+                response.release()
+        except Exception as exc:
+            # Drop the pool: a timed-out connection may still receive the late response
+            self.close()
+            raise GatewayError(f'{method} {path}: {exc.__class__.__name__}: {exc}') from exc
+        try:
+            data = json.loads(raw) if raw else {}
+        except ValueError:
+            data = {'body': raw[:500].decode('utf-8', 'replace')}
+        return response.status_code, data
+
+    def close(self) -> None:
+        client = getattr(self._local, 'client', None)
+        if client is not None:
+            self._local.client = None
+            client.close()
+
+
+class HttpGateway(PaymentGateway):
+    """Provider speaking the small JSON protocol of `run_stub_provider`.
+
+    `POST /charges {reference, amount, currency, method, metadata}` with the
+    reference as `Idempotency-Key`, answered by `{id, status, error?}`;
+    `GET /charges/<reference>` returns the same document or 404.
+    """
+
+    def __init__(self, name: str, **options):
+        super().__init__(name, **options)
+        base_url = options.get('BASE_URL')
+        if not base_url:
+            raise ImproperlyConfigured(f'PAYMENT_GATEWAYS[{name!r}] needs BASE_URL')
+        headers = {}
+        if options.get('API_KEY'):
+            headers['Authorization'] = f"Bearer {options['API_KEY']}"
+        self.client = PooledHttpClient(
+            base_url,
+            timeout=float(options.get('TIMEOUT', 5)),
+            connect_timeout=float(options.get('CONNECT_TIMEOUT', 2)),
+            pool_size=int(options.get('POOL_SIZE', 10)),
+            headers=headers,
+        )
+
+    @staticmethod
+    def _result(data: dict) -> GatewayResult:
+        status = data.get('status') or 'pending'
+        if status not in ('succeeded', 'failed', 'pending'):
+            status = 'pending'
+        return GatewayResult(status, data.get('id'), data.get('error') or '', data)
+
+    def charge(self, request: ChargeRequest) -> GatewayResult:
+        status_code, data = self.client.request('POST', '/charges', {
+            'reference': request.reference,
+            'amount': str(request.amount),
+            'currency': request.currency,
+            'method': request.method,
+            'metadata': request.metadata,
+        }, headers={'Idempotency-Key': request.reference})
+        if status_code >= 500:
+            raise GatewayError(f'provider answered {status_code}')
+        if status_code >= 400:
+            return GatewayResult('failed', data.get('id'), data.get('error') or f'HTTP {status_code}', data)
+        return self._result(data)
+
+    def retrieve(self, reference: str) -> Optional[GatewayResult]:
+        status_code, data = self.client.request('GET', f'/charges/{reference}')
+        if status_code == 404:
+            return None
+        if status_code >= 400:
+            raise GatewayError(f'provider answered {status_code}')
+        return self._result(data)
+
+
+# --------------------------
+# Registry
+# --------------------------
+
+_gateways: Dict[str, PaymentGateway] = {}
+_lock = threading.Lock()
+
+DEFAULT_GATEWAYS = {'simulated': {'CLASS': 'payment.gateways.SimulatedGateway'}}
+
+
+def default_gateway_name() -> str:
+    return getattr(settings, 'PAYMENT_GATEWAY', 'simulated')
+
+
+def get_gateway(name: Optional[str] = None) -> PaymentGateway:
+    """Configured gateway instance (created once per process)."""
+    name = name or default_gateway_name()
+    with _lock:
+        gateway = _gateways.get(name)
+        if gateway is None:
+            config = dict(getattr(settings, 'PAYMENT_GATEWAYS', DEFAULT_GATEWAYS).get(name) or {})
+            if not config:
+                raise ImproperlyConfigured(f'Unknown payment gateway {name!r}')
+            gateway = _gateways[name] = import_string(config.pop('CLASS'))(name, **config)
+        return gateway
+
+
+def reset_gateways() -> None:
+    with _lock:
+        _gateways.clear()
@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payment.archive import (
+    ARCHIVABLE_STATUSES, ARCHIVE_AFTER_DAYS, ARCHIVE_CHUNK_SIZE, archivable_orders, archive_orders,
+    partition_archive_tables,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Chuyển đơn hàng đã xong (completed/cancelled/refunded) cũ hơn N ngày cùng order_items và payments "
+        "sang các bảng *_archive, mỗi lô một transaction. --partition chia partition bảng lưu trữ theo năm (MySQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--status', action='append', choices=ARCHIVABLE_STATUSES,
+                            help='Chỉ lưu trữ trạng thái này (lặp lại được); mặc định cả ba')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE, help='Số đơn mỗi transaction')
+        parser.add_argument('--max-chunks', type=int, help='Dừng sau số lô này')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ đếm số đơn sẽ được chuyển')
+        parser.add_argument('--partition', action='store_true', help='Tạo/mở rộng partition theo năm cho bảng lưu trữ (MySQL)')
+        parser.add_argument('--print-sql', action='store_true', help='Với --partition: chỉ in DDL, không chạy')
+
+    def handle(self, *args, **opts):
+        if opts['partition']:
+            try:
+                statements = partition_archive_tables(execute=not opts['print_sql'])
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            for sql in statements:
+                self.stdout.write(sql + ';')
+            self.stdout.write(self.style.SUCCESS(f'{len(statements)} partition statement(s)'))
+            return
+
+        if opts['older_than_days'] < 1:
+            raise CommandError('--older-than-days must be at least 1')
+        before = timezone.now() - timedelta(days=opts['older_than_days'])
+        statuses = opts['status'] or ARCHIVABLE_STATUSES
+        if opts['dry_run']:
+            count = archivable_orders(before, statuses).count()
+            self.stdout.write(self.style.SUCCESS(f'Would archive {count} order(s) created before {before:%Y-%m-%d}'))
+            return
+
+        def progress(result):
+            if opts['verbosity'] > 1:
+                self.stdout.write(f'  ... {result.orders} orders (up to #{result.last_order_id})')
+
+        result = archive_orders(before, statuses=statuses, chunk_size=opts['chunk_size'],
+                                max_chunks=opts['max_chunks'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {result.orders} order(s), {result.items} item(s), {result.payments} payment(s)'
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from payment.models import Payment
+from payment.services import simulated_provider_txid
+
+
+class Command(BaseCommand):
+    help = (
+        "Gán lại provider_transaction_id bị trùng (id mô phỏng cũ `SIM-<giây>-<store>`) để có thể "
+        "tạo unique index. Chạy một lần trước `migrate`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ đếm, không ghi')
+
+    def handle(self, *args, **opts):
+        duplicated = list(
+            Payment.objects.exclude(provider_transaction_id__isnull=True)
+            .values('provider_transaction_id').annotate(n=Count('id')).filter(n__gt=1)
+            .values_list('provider_transaction_id', flat=True)
+        )
+        rewritten = 0
+        with transaction.atomic():
+            for tx in duplicated:
+                # Keep the oldest payment on the original id, renumber the rest
+                ids = list(
+                    Payment.objects.filter(provider_transaction_id=tx).order_by('id').values_list('id', flat=True)[1:]
+                )
+                if not opts['dry_run']:
+                    for pk in ids:
+                        Payment.objects.filter(pk=pk).update(provider_transaction_id=simulated_provider_txid())
+                rewritten += len(ids)
+        verb = 'Would rewrite' if opts['dry_run'] else 'Rewrote'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {rewritten} payment(s) across {len(duplicated)} duplicated id(s)'))
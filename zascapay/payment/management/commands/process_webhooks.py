@@ -0,0 +1,33 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from payment.webhooks import WEBHOOK_BATCH_SIZE, process_webhook_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Áp dụng các webhook thanh toán đang chờ (bảng payment_webhook_events) theo lô: cập nhật "
+        "trạng thái Payment/Order. Mặc định chạy đến khi hết hàng đợi; --loop để chạy liên tục."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=WEBHOOK_BATCH_SIZE, help='Số event mỗi transaction')
+        parser.add_argument('--loop', action='store_true', help='Không dừng khi hết event, chờ event mới')
+        parser.add_argument('--interval', type=float, default=1.0, help='Số giây chờ khi hàng đợi rỗng (với --loop)')
+
+    def handle(self, *args, **opts):
+        totals = Counter()
+        try:
+            while True:
+                counts = process_webhook_events(batch_size=opts['batch_size'])
+                totals.update(counts)
+                if not counts:
+                    if not opts['loop']:
+                        break
+                    time.sleep(opts['interval'])
+        except KeyboardInterrupt:
+            pass
+        summary = ', '.join(f'{result}={count}' for result, count in sorted(totals.items())) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'Webhooks processed: {summary}'))
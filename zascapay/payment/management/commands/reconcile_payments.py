@@ -0,0 +1,52 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payment.reconcile import FIXABLE, RECONCILE_CHUNK_SIZE, reconcile_payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Đối soát Payment.status với Order.is_paid/Order.status theo từng lô order_id (keyset), bộ nhớ "
+        "không đổi. Mặc định chỉ báo cáo; --fix sửa các lệch có thể sửa tự động. Chạy hàng đêm."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help=f"Sửa: {', '.join(FIXABLE)}")
+        parser.add_argument('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE, help='Số order mỗi lô')
+        parser.add_argument('--start-after', type=int, default=0, help='Tiếp tục sau order_id này (last_order_id của lần trước)')
+        parser.add_argument('--max-minutes', type=float, help='Dừng sau khoảng thời gian này (hết cửa sổ chạy đêm)')
+        parser.add_argument('--stale-minutes', type=float, default=60, help='Payment PENDING lâu hơn mức này bị coi là treo')
+        parser.add_argument('--report', help='Ghi báo cáo JSON ra file này')
+
+    def handle(self, *args, **opts):
+        verbosity = opts['verbosity']
+
+        def progress(report):
+            if verbosity > 1:
+                self.stdout.write(f'  ... order_id <= {report.last_order_id}: {report.scanned_orders} orders, '
+                                  f'{sum(report.found.values())} issue(s)')
+
+        report = reconcile_payments(
+            chunk_size=opts['chunk_size'],
+            fix=opts['fix'],
+            start_after=opts['start_after'],
+            max_seconds=opts['max_minutes'] * 60 if opts['max_minutes'] else None,
+            stale_after=timedelta(minutes=opts['stale_minutes']),
+            progress=progress,
+        )
+        data = report.as_dict()
+        if opts['report']:
+            with open(opts['report'], 'w', encoding='utf-8') as fh:
+                json.dump(data, fh, indent=2)
+
+        self.stdout.write(f"Scanned {report.scanned_orders} orders / {report.scanned_payments} payments "
+                          f"in {data['elapsed_seconds']}s")
+        for category, count in sorted(report.found.items()):
+            fixed = f", fixed {report.fixed[category]}" if opts['fix'] and category in FIXABLE else ''
+            self.stdout.write(f"  {category}: {count}{fixed}  e.g. {report.samples[category][:5]}")
+        if not report.complete:
+            self.stdout.write(self.style.WARNING(f'Stopped early; resume with --start-after {report.last_order_id}'))
+        elif not report.found:
+            self.stdout.write(self.style.SUCCESS('No discrepancies'))
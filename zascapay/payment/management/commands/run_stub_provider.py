@@ -0,0 +1,164 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from payment.gateways import SIGNATURE_HEADER, sign_webhook
+from payment.txid import new_txid
+
+logger = logging.getLogger(__name__)
+
+_CHARGE_PATH = re.compile(r'^/charges/([\w-]+)/?$')
+
+
+class StubProvider:
+    """In-memory provider state; charges are keyed (and deduplicated) by our reference."""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, failure_rate=0.0, timeout_rate=0.0, error_rate=0.0, hang_seconds=30,
+                 webhook_url='', webhook_secret=''):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.error_rate = error_rate
+        self.hang_seconds = hang_seconds
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.charges = {}
+        self.lock = threading.Lock()
+
+    def delay(self):
+        ms = self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if ms:
+            time.sleep(ms / 1000)
+
+    def charge(self, body):
+        """(status code, document); None means "hang" (client should time out)."""
+        reference = str(body.get('reference') or '')
+        if not reference:
+            return 400, {'status': 'failed', 'error': 'reference is required'}
+        with self.lock:
+            existing = self.charges.get(reference)
+        if existing is not None:
+            return 200, existing
+        roll = random.random()
+        if roll < self.error_rate:
+            return 503, {'error': 'provider unavailable'}
+        roll -= self.error_rate
+        if roll < self.timeout_rate:
+            # The charge goes through but the answer never arrives in time
+            self._store(reference, 'succeeded', '')
+            return None
+        roll -= self.timeout_rate
+        if roll < self.failure_rate:
+            return 402, self._store(reference, 'failed', 'card_declined')
+        return 201, self._store(reference, 'succeeded', '')
+
+    def _store(self, reference, status, error):
+        document = {'id': f'STUB-{new_txid()}', 'reference': reference, 'status': status}
+        if error:
+            document['error'] = error
+        with self.lock:
+            # First writer wins if two requests for the same reference raced
+            stored = self.charges.setdefault(reference, document)
+        if stored is document and self.webhook_url:
+            threading.Thread(target=self.notify, args=(document,), daemon=True).start()
+        return stored
+
+    def notify(self, document):
+        """POST a signed `charge.<status>` event, like a real provider would after the charge."""
+        event = {'id': f'evt-{new_txid()}', 'type': f"charge.{document['status']}", 'created': time.time(), 'data': document}
+        body = json.dumps(event).encode('utf-8')
+        request = urllib.request.Request(self.webhook_url, data=body, method='POST', headers={
+            'Content-Type': 'application/json', SIGNATURE_HEADER: sign_webhook(self.webhook_secret, body),
+        })
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception as exc:
+            logger.warning('Webhook %s to %s failed: %s', event['id'], self.webhook_url, exc)
+
+    def retrieve(self, reference):
+        with self.lock:
+            return self.charges.get(reference)
+
+
+def make_handler(provider: StubProvider):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, so client pooling is exercised
+
+        def _send(self, code, document):
+            payload = json.dumps(document).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self._send(400, {'error': 'invalid JSON'})
+            if self.path.rstrip('/') != '/charges':
+                return self._send(404, {'error': 'not found'})
+            provider.delay()
+            result = provider.charge(body)
+            if result is None:
+                time.sleep(provider.hang_seconds)
+                self.close_connection = True
+                return
+            self._send(*result)
+
+        def do_GET(self):
+            match = _CHARGE_PATH.match(self.path)
+            document = provider.retrieve(match.group(1)) if match else None
+            if document is None:
+                return self._send(404, {'error': 'not found'})
+            provider.delay()
+            self._send(200, document)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        "Provider thanh toán giả lập qua HTTP (gateway `stub`) để thử tải: độ trễ, từ chối thẻ, webhook, "
+        "timeout và lỗi 5xx theo tỉ lệ. Dữ liệu chỉ nằm trong bộ nhớ."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument('--latency-ms', type=float, default=50, help='Độ trễ cố định mỗi request')
+        parser.add_argument('--jitter-ms', type=float, default=50, help='Cộng thêm ngẫu nhiên 0..jitter')
+        parser.add_argument('--failure-rate', type=float, default=0.05, help='Tỉ lệ thẻ bị từ chối (402)')
+        parser.add_argument('--timeout-rate', type=float, default=0.0, help='Tỉ lệ charge thành công nhưng không trả lời')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Tỉ lệ lỗi 503 (không tạo charge)')
+        parser.add_argument('--webhook-url', default='', help='Gửi webhook sau mỗi charge, vd. http://127.0.0.1:8000/api/payments/webhooks/stub/')
+        parser.add_argument('--webhook-secret', default='', help='Khóa HMAC, trùng PAYMENT_STUB_WEBHOOK_SECRET')
+
+    def handle(self, *args, **opts):
+        provider = StubProvider(
+            latency_ms=opts['latency_ms'], jitter_ms=opts['jitter_ms'], failure_rate=opts['failure_rate'],
+            timeout_rate=opts['timeout_rate'], error_rate=opts['error_rate'],
+            webhook_url=opts['webhook_url'], webhook_secret=opts['webhook_secret'],
+        )
+        server = ThreadingHTTPServer((opts['host'], opts['port']), make_handler(provider))
+        server.daemon_threads = True
+        self.stdout.write(self.style.SUCCESS(f"Stub provider on http://{opts['host']}:{opts['port']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
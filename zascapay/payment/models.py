@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Now
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from typing import TYPE_CHECKING
@@ -39,11 +40,21 @@ class Order(models.Model):
         blank=True,
         related_name='+',
     )
+    # Store the order was placed in (analytics rollups); null for older orders
+    store = models.ForeignKey(
+        'store.Store',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='orders',
+    )
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     currency = models.CharField(max_length=8, default='VND')
     shipping_address = models.TextField(blank=True, null=True)
     is_paid = models.BooleanField(default=False)
+    # Id generated by the POS for orders queued offline (`/api/orders/batch/`); makes replays idempotent
+    client_order_id = models.CharField(max_length=64, blank=True, null=True)
     metadata = models.JSONField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -52,9 +63,13 @@ class Order(models.Model):
         db_table = 'orders'
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['user'], name='idx_orders_user'),
+            # Order list: per-user history filtered/sorted by created_at
+            models.Index(fields=['user', 'created_at'], name='idx_orders_user_created'),
             models.Index(fields=['status'], name='idx_orders_status'),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'client_order_id'], name='uniq_orders_store_client_id'),
+        ]
         verbose_name = 'Đơn hàng'
         verbose_name_plural = 'Đơn hàng'
 
@@ -133,9 +148,15 @@ class Payment(models.Model):
     )
     currency = models.CharField(max_length=8, default='VND')
     method = models.CharField(max_length=30, choices=Method.choices, default=Method.CARD)
-    provider_transaction_id = models.CharField(max_length=255, blank=True, null=True)
+    # Unique (webhook / reconciliation lookups); simulated payments use `SIM-<txid>` (payment.txid)
+    provider_transaction_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    # Our own id for the charge, sent to the provider as idempotency key (see payment.gateways)
+    reference = models.CharField(max_length=40, blank=True, null=True, unique=True)
+    gateway = models.CharField(max_length=50, blank=True)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     processed_at = models.DateTimeField(blank=True, null=True)
+    # When the charge succeeded; unlike processed_at not moved by a refund (sales rollup)
+    paid_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     metadata = models.JSONField(blank=True, null=True)
 
@@ -144,6 +165,10 @@ class Payment(models.Model):
         indexes = [
             models.Index(fields=['order'], name='idx_payments_order'),
             models.Index(fields=['status'], name='idx_payments_status'),
+            # Refund rollup reads refunded payments in processed_at order
+            models.Index(fields=['status', 'processed_at'], name='idx_payments_status_processed'),
+            # Sales rollup reads successful payments in paid_at order
+            models.Index(fields=['paid_at'], name='idx_payments_paid'),
             models.Index(fields=['store'], name='idx_payments_store'),
         ]
         verbose_name = 'Thanh toán'
@@ -153,3 +178,142 @@ class Payment(models.Model):
         order_info = f"Order #{self.order.pk}" if self.order else "No-Order"
         store_info = f"Store #{self.store.pk}" if self.store else "No-Store"
         return f"Payment #{self.pk} - {order_info} - {store_info} - {self.status}"
+
+
+class WebhookEvent(models.Model):
+    """Provider notification as received (inbox); applied in batches by `payment.webhooks`."""
+
+    class Result(models.TextChoices):
+        APPLIED = 'applied', 'Đã áp dụng'
+        DUPLICATE = 'duplicate', 'Trùng trạng thái'
+        IGNORED = 'ignored', 'Bỏ qua'
+        UNMATCHED = 'unmatched', 'Không tìm thấy thanh toán'
+
+    gateway = models.CharField(max_length=50)
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100)
+    reference = models.CharField(max_length=40, blank=True, null=True)
+    provider_transaction_id = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(max_length=20, blank=True)
+    occurred_at = models.DateTimeField()
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    result = models.CharField(max_length=20, choices=Result.choices, blank=True)
+
+    class Meta:
+        db_table = 'payment_webhook_events'
+        constraints = [
+            # Providers redeliver; the same event is stored once
+            models.UniqueConstraint(fields=['gateway', 'event_id'], name='uniq_webhook_events_gateway_event'),
+        ]
+        indexes = [
+            # Consumer reads `processed_at IS NULL ORDER BY id`
+            models.Index(fields=['processed_at', 'id'], name='idx_webhook_events_pending'),
+        ]
+        verbose_name = 'Webhook thanh toán'
+        verbose_name_plural = 'Webhook thanh toán'
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.gateway}:{self.event_id} ({self.result or 'pending'})"
+
+
+# --------------------------
+# Archive (payment.archive / `archive_orders`)
+# --------------------------
+# Same columns as the live tables, plus `archived_at`. Relations are kept for
+# joins but without FK constraints, so rows can outlive users/products and the
+# tables can be range-partitioned by created_at on MySQL.
+
+def _archive_fk(to, related_name='+', **kwargs):
+    return models.ForeignKey(to, on_delete=models.DO_NOTHING, db_constraint=False, related_name=related_name,
+                             null=True, blank=True, **kwargs)
+
+
+class ArchivedOrder(models.Model):
+    """Đơn hàng đã lưu trữ."""
+
+    order_id = models.IntegerField(primary_key=True)
+
+    @property
+    def id(self):
+        return self.order_id
+
+    user = _archive_fk(settings.AUTH_USER_MODEL)
+    store = _archive_fk('store.Store')
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=8, default='VND')
+    shipping_address = models.TextField(blank=True, null=True)
+    is_paid = models.BooleanField(default=False)
+    client_order_id = models.CharField(max_length=64, blank=True, null=True)
+    metadata = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        db_table = 'orders_archive'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='idx_orders_arch_user_created'),
+            models.Index(fields=['created_at'], name='idx_orders_arch_created'),
+        ]
+        verbose_name = 'Đơn hàng (lưu trữ)'
+        verbose_name_plural = 'Đơn hàng (lưu trữ)'
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"Archived order #{self.pk} - {self.status}"
+
+
+class ArchivedOrderItem(models.Model):
+    """Mục đơn hàng đã lưu trữ."""
+
+    # Same type as the live BigAutoField key (DEFAULT_AUTO_FIELD), copied by INSERT ... SELECT
+    id = models.BigIntegerField(primary_key=True)
+    order = _archive_fk(ArchivedOrder, related_name='items')
+    product = _archive_fk('product.Product')
+    sku = models.CharField(max_length=50, blank=True)
+    name = models.CharField(max_length=255, blank=True)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2)
+    line_total = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        db_table = 'order_items_archive'
+        indexes = [
+            models.Index(fields=['order'], name='idx_order_items_arch_order'),
+        ]
+        verbose_name = 'Mục đơn hàng (lưu trữ)'
+        verbose_name_plural = 'Mục đơn hàng (lưu trữ)'
+
+
+class ArchivedPayment(models.Model):
+    """Thanh toán đã lưu trữ."""
+
+    # Same type as the live BigAutoField key (DEFAULT_AUTO_FIELD), copied by INSERT ... SELECT
+    id = models.BigIntegerField(primary_key=True)
+    order = _archive_fk(ArchivedOrder, related_name='payments')
+    store = _archive_fk('store.Store')
+    currency = models.CharField(max_length=8, default='VND')
+    method = models.CharField(max_length=30, choices=Payment.Method.choices)
+    # Plain indexes: partitioned tables can't have unique keys without created_at
+    provider_transaction_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    reference = models.CharField(max_length=40, blank=True, null=True, db_index=True)
+    gateway = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=20, choices=Payment.Status.choices)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    paid_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    metadata = models.JSONField(blank=True, null=True)
+    archived_at = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        db_table = 'payments_archive'
+        indexes = [
+            models.Index(fields=['order'], name='idx_payments_arch_order'),
+        ]
+        verbose_name = 'Thanh toán (lưu trữ)'
+        verbose_name_plural = 'Thanh toán (lưu trữ)'
@@ -0,0 +1,228 @@
+"""Consistency check between `Payment.status` and `Order.is_paid` / `Order.status`.
+
+`reconcile_payments` walks `orders` by primary key in keyset chunks
+(`order_id > last ORDER BY order_id LIMIT n`, no OFFSET) and streams the
+payments of each chunk's id range with `.iterator()`, already sorted by
+order, so memory stays constant whatever the table size. Only tuples are
+read, never model instances.
+
+Per order the payments decide what the order should look like:
+
+==========================  ===========================================  =========================
+category                    condition                                    `--fix`
+==========================  ===========================================  =========================
+unpaid_with_payment         SUCCESS payment, order not paid (and not     is_paid=1, pending ->
+                            cancelled/refunded)                          processing
+paid_without_payment        order paid, no SUCCESS payment               is_paid=0
+refund_not_applied          REFUNDED payment, no SUCCESS one, order      status=refunded, is_paid=0
+                            not refunded
+cancelled_with_payment      cancelled order with a SUCCESS payment       report only (needs refund)
+refunded_with_payment       refunded order with a SUCCESS payment        report only
+multiple_success            more than one SUCCESS payment                report only (double charge)
+stale_pending               payment PENDING for longer than              asks the gateway and
+                            `stale_after`                                finalizes the payment
+==========================  ===========================================  =========================
+
+Fixes are applied per chunk with one UPDATE per category that re-checks its
+condition in SQL, so rows changed by live traffic since they were read are
+left alone.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+from django.utils import timezone
+
+from .gateways import GatewayError, GatewayResult, get_gateway
+from .models import Order, Payment
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_CHUNK_SIZE = 5000
+SAMPLE_SIZE = 20
+
+UNPAID_WITH_PAYMENT = 'unpaid_with_payment'
+PAID_WITHOUT_PAYMENT = 'paid_without_payment'
+REFUND_NOT_APPLIED = 'refund_not_applied'
+CANCELLED_WITH_PAYMENT = 'cancelled_with_payment'
+REFUNDED_WITH_PAYMENT = 'refunded_with_payment'
+MULTIPLE_SUCCESS = 'multiple_success'
+STALE_PENDING = 'stale_pending'
+
+FIXABLE = (UNPAID_WITH_PAYMENT, PAID_WITHOUT_PAYMENT, REFUND_NOT_APPLIED, STALE_PENDING)
+
+
+@dataclass
+class ReconcileReport:
+    scanned_orders: int = 0
+    scanned_payments: int = 0
+    last_order_id: int = 0
+    complete: bool = False
+    elapsed: float = 0.0
+    found: Counter = field(default_factory=Counter)
+    fixed: Counter = field(default_factory=Counter)
+    # First ids per category (order ids; payment ids for stale_pending)
+    samples: Dict[str, List[int]] = field(default_factory=lambda: defaultdict(list))
+
+    def add(self, category: str, pk: int) -> None:
+        self.found[category] += 1
+        if len(self.samples[category]) < SAMPLE_SIZE:
+            self.samples[category].append(pk)
+
+    def as_dict(self) -> dict:
+        return {
+            'scanned_orders': self.scanned_orders,
+            'scanned_payments': self.scanned_payments,
+            'last_order_id': self.last_order_id,
+            'complete': self.complete,
+            'elapsed_seconds': round(self.elapsed, 1),
+            'found': dict(self.found),
+            'fixed': dict(self.fixed),
+            'samples': dict(self.samples),
+        }
+
+
+def classify(order_status: str, is_paid: bool, payment_statuses: List[str]) -> List[str]:
+    """Order-level categories for one order and the statuses of its payments."""
+    succeeded = payment_statuses.count(Payment.Status.SUCCESS)
+    refunded = payment_statuses.count(Payment.Status.REFUNDED)
+    found = []
+    if succeeded > 1:
+        found.append(MULTIPLE_SUCCESS)
+    if succeeded:
+        if order_status == Order.Status.CANCELLED:
+            found.append(CANCELLED_WITH_PAYMENT)
+        elif order_status == Order.Status.REFUNDED:
+            found.append(REFUNDED_WITH_PAYMENT)
+        elif not is_paid:
+            found.append(UNPAID_WITH_PAYMENT)
+    elif refunded and order_status != Order.Status.REFUNDED:
+        found.append(REFUND_NOT_APPLIED)
+    elif is_paid:
+        found.append(PAID_WITHOUT_PAYMENT)
+    return found
+
+
+def reconcile_payments(*, chunk_size: int = RECONCILE_CHUNK_SIZE, fix: bool = False, start_after: int = 0,
+                       max_seconds: Optional[float] = None, stale_after: timedelta = timedelta(hours=1),
+                       progress=None) -> ReconcileReport:
+    """Scan orders with `order_id > start_after`; stops early after `max_seconds` (resume from `last_order_id`)."""
+    report = ReconcileReport(last_order_id=start_after)
+    started = time.monotonic()
+    stale_before = timezone.now() - stale_after
+    while True:
+        orders = list(
+            Order.objects.filter(order_id__gt=report.last_order_id)
+            .order_by('order_id')
+            .values_list('order_id', 'status', 'is_paid')[:chunk_size]
+        )
+        if not orders:
+            report.complete = True
+            break
+        first_id, last_id = orders[0][0], orders[-1][0]
+
+        statuses = defaultdict(list)
+        stale = []
+        payments = (
+            Payment.objects.filter(order_id__gte=first_id, order_id__lte=last_id)
+            .order_by('order_id', 'id')
+            .values_list('order_id', 'id', 'status', 'created_at')
+            .iterator(chunk_size=chunk_size)
+        )
+        for order_id, payment_id, status, created_at in payments:
+            report.scanned_payments += 1
+            statuses[order_id].append(status)
+            if status == Payment.Status.PENDING and created_at < stale_before:
+                stale.append(payment_id)
+                report.add(STALE_PENDING, payment_id)
+
+        to_fix = defaultdict(list)
+        for order_id, status, is_paid in orders:
+            for category in classify(status, is_paid, statuses.get(order_id, [])):
+                report.add(category, order_id)
+                to_fix[category].append(order_id)
+
+        if fix:
+            for category, count in _apply_fixes(to_fix).items():
+                report.fixed[category] += count
+            if stale:
+                report.fixed[STALE_PENDING] += settle_pending(stale)
+
+        report.scanned_orders += len(orders)
+        report.last_order_id = last_id
+        if progress is not None:
+            progress(report)
+        if max_seconds is not None and time.monotonic() - started >= max_seconds:
+            break
+    report.elapsed = time.monotonic() - started
+    return report
+
+
+def _apply_fixes(to_fix: Dict[str, List[int]]) -> Dict[str, int]:
+    now = timezone.now()
+    payments = Payment.objects.filter(order=OuterRef('pk'))
+    has_success = Exists(payments.filter(status=Payment.Status.SUCCESS))
+    has_refund = Exists(payments.filter(status=Payment.Status.REFUNDED))
+    fixed = {}
+    if to_fix.get(UNPAID_WITH_PAYMENT):
+        fixed[UNPAID_WITH_PAYMENT] = (
+            Order.objects.filter(pk__in=to_fix[UNPAID_WITH_PAYMENT], is_paid=False)
+            .exclude(status__in=[Order.Status.CANCELLED, Order.Status.REFUNDED])
+            .filter(has_success)
+            .update(
+                is_paid=True,
+                status=Case(When(status=Order.Status.PENDING, then=Value(Order.Status.PROCESSING)), default=F('status')),
+                updated_at=now,
+            )
+        )
+    if to_fix.get(PAID_WITHOUT_PAYMENT):
+        fixed[PAID_WITHOUT_PAYMENT] = (
+            Order.objects.filter(pk__in=to_fix[PAID_WITHOUT_PAYMENT], is_paid=True)
+            .exclude(has_success)
+            .update(is_paid=False, updated_at=now)
+        )
+    if to_fix.get(REFUND_NOT_APPLIED):
+        fixed[REFUND_NOT_APPLIED] = (
+            Order.objects.filter(pk__in=to_fix[REFUND_NOT_APPLIED])
+            .exclude(status=Order.Status.REFUNDED)
+            .filter(has_refund).exclude(has_success)
+            .update(status=Order.Status.REFUNDED, is_paid=False, updated_at=now)
+        )
+    return fixed
+
+
+def settle_pending(payment_ids: List[int]) -> int:
+    """Ask each payment's gateway for the charge made with its reference and finalize it.
+
+    A charge the provider never saw is marked FAILED (nothing was taken).
+    Payments without a reference or with an unknown gateway (e.g. `offline`)
+    are left for a human. Returns how many payments were settled.
+    """
+    from .services import PaymentService
+
+    settled = 0
+    pending = Payment.objects.filter(pk__in=payment_ids, status=Payment.Status.PENDING).values_list('id', 'reference', 'gateway')
+    for payment_id, reference, gateway in pending:
+        if not reference:
+            continue
+        try:
+            result = get_gateway(gateway or None).retrieve(reference)
+        except ImproperlyConfigured:
+            continue
+        except GatewayError as exc:
+            logger.warning('Reconcile: payment %s still unknown at %s: %s', payment_id, gateway, exc)
+            continue
+        if result is None:
+            result = GatewayResult('failed', error='charge not found at provider')
+        if result.status == 'pending':
+            continue
+        PaymentService.finalize_payment(payment_id, result)
+        settled += 1
+    return settled
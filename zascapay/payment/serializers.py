@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from core.serializers import CompiledSerializer, DynamicFieldsMixin, full_name_or_username
 from .models import Order, OrderItem, Payment
 
 
@@ -19,7 +21,7 @@ class PaymentItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'name', 'unit_price', 'quantity']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # expose the primary key column named `order_id`
     order_id = serializers.IntegerField(read_only=True)
     items = OrderItemSerializer(many=True, read_only=True)
@@ -35,6 +37,10 @@ class OrderSerializer(serializers.ModelSerializer):
         # expose order_id instead of default `id`
         fields = ['order_id', 'user_id', 'user_name', 'status', 'total_amount', 'currency', 'shipping_address', 'is_paid', 'metadata', 'created_at', 'updated_at', 'items']
         read_only_fields = ['order_id', 'created_at', 'updated_at', 'is_paid', 'total_amount']
+        # items stay in the default output but become opt-in with ?fields= (use ?expand=items)
+        expandable_fields = {'items': None}
+        field_sources = {'user_name': ('user__first_name', 'user__last_name', 'user__username')}
+        prefetch_fields = {'items': 'items'}
 
     def get_user_name(self, obj):
         user = getattr(obj, 'user', None)
@@ -44,6 +50,27 @@ class OrderSerializer(serializers.ModelSerializer):
         return full_name or user.username
 
 
+class OrderListSerializer(OrderSerializer):
+    """Compact row for `GET /api/orders/`.
+
+    `item_count` and `user_name` are SQL annotations (see
+    `OrderService.summarize_orders`); items are left out unless `?expand=items`,
+    which loads them with one prefetch.
+    """
+    user_name = serializers.CharField(read_only=True, allow_null=True)
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta(OrderSerializer.Meta):
+        fields = ['order_id', 'user_id', 'user_name', 'status', 'total_amount', 'currency', 'is_paid', 'item_count', 'created_at', 'updated_at', 'items']
+        # Annotations, no model columns to load
+        field_sources = {'user_name': (), 'item_count': ()}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'items' not in self._expanded:
+            self.fields.pop('items', None)
+
+
 class OrderCreateItemSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
@@ -62,7 +89,19 @@ class OrderCreateSerializer(serializers.Serializer):
         return value
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class OrderBatchPaymentSerializer(serializers.Serializer):
+    # Amount is the order total, as for /api/orders/<id>/pay/
+    method = serializers.ChoiceField(choices=[(m.value, m.label) for m in Payment.Method], required=False, default=Payment.Method.CARD)
+    metadata = serializers.JSONField(required=False)
+
+
+class OrderBatchEntrySerializer(OrderCreateSerializer):
+    """One basket of `/api/orders/batch/`; validated one by one so a bad basket only fails itself."""
+    client_order_id = serializers.CharField(max_length=64)
+    payment = OrderBatchPaymentSerializer(required=False)
+
+
+class PaymentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # expose the related order's primary key under `order_id` (Order model uses `order_id`)
     order_id = serializers.IntegerField(source='order.order_id', read_only=True)
     store_id = serializers.IntegerField(source='store.id', read_only=True)
@@ -80,6 +119,13 @@ class PaymentSerializer(serializers.ModelSerializer):
         model = Payment
         fields = ['id', 'order_id', 'store_id', 'user_name', 'amount', 'items', 'currency', 'method', 'provider_transaction_id', 'status', 'processed_at', 'created_at', 'metadata']
         read_only_fields = ['id', 'status', 'processed_at', 'created_at']
+        # order items stay in the default output but become opt-in with ?fields= (use ?expand=items)
+        expandable_fields = {'items': None}
+        field_sources = {
+            'amount': ('order__total_amount',),
+            'user_name': ('order__user__first_name', 'order__user__last_name', 'order__user__username'),
+        }
+        prefetch_fields = {'items': 'order__items'}
 
     def get_amount(self, obj):
         if obj.order:
@@ -95,6 +141,17 @@ class PaymentSerializer(serializers.ModelSerializer):
         return full_name or user.username
 
 
+# Compiled read path for GET /api/payments/ (same output as PaymentSerializer)
+CompiledPaymentSerializer = CompiledSerializer(
+    PaymentSerializer,
+    computed={
+        'amount': (('order__total_amount',), lambda total: total),
+        'user_name': (('order__user__first_name', 'order__user__last_name', 'order__user__username'), full_name_or_username),
+    },
+    nested={'items': (CompiledSerializer(PaymentItemSerializer), 'order', 'order')},
+)
+
+
 class PaymentCreateSerializer(serializers.Serializer):
     # Client must provide order_id only; amount is derived from Order.total_amount on server
     order_id = serializers.IntegerField(required=True)
@@ -1,25 +1,75 @@
+from datetime import datetime, time, timedelta
+import logging
 from decimal import Decimal
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.shortcuts import get_object_or_404
-from typing import List, Dict, Optional
+from typing import List, Dict, Mapping, Optional
 
+from core.bulk import bulk_update_rows
 from .models import Order, OrderItem, Payment
-from product.models import Product
-from store.models import StoreInventory
+from .gateways import ChargeRequest, GatewayError, GatewayResult, get_gateway
+from .txid import new_txid
+from product.models import CatalogChange
+from product.services import record_catalog_changes
+from store.membership import owned_store
+from store.models import Store, StoreInventory
+from store.pricebook import get_price_book
+
+
+logger = logging.getLogger(__name__)
+
+
+def simulated_provider_txid() -> str:
+    return f'SIM-{new_txid()}'
 
 
 class PaymentService:
-    """Service that encapsulates payment operations (simulated).
+    """Service that encapsulates payment operations.
 
-    NOTE: This implements a simple, synchronous 'fake' payment processor for
-    local/dev use. Replace or extend with integration to actual payment
-    providers (Stripe, PayPal, etc.) in production.
+    Charges go through the configured gateway (`settings.PAYMENT_GATEWAY`,
+    `simulated` by default, see `payment.gateways`). Refunds are still
+    recorded locally only.
     """
 
+    @staticmethod
+    def process_payment(store, order: Optional[Order], amount: Decimal, currency: str, method: str,
+                        metadata: Optional[dict] = None, gateway: Optional[str] = None) -> Payment:
+        """Charge `amount` through a payment gateway (see `payment.gateways`).
+
+        Reserve (short transaction) -> provider call outside any transaction ->
+        finalize (short transaction). Returns the payment as SUCCESS or FAILED,
+        or PENDING when the provider could not be reached in time (settled
+        later by webhook / reconciliation). Raises ValueError when the order
+        can't be paid; nothing is written then.
+        """
+        gw = get_gateway(gateway)
+        payment = PaymentService._reserve_payment(store, order, amount, currency, method, metadata, gw.name)
+        if transaction.get_connection().in_atomic_block:
+            # Callers should not wrap this in a transaction: the reservation and
+            # the order lock would then be held for the whole provider call.
+            logger.warning('process_payment called inside a transaction; provider call holds DB locks')
+        try:
+            result = gw.charge(ChargeRequest(payment.reference, amount, currency, method, metadata or {}))
+        except GatewayError as exc:
+            logger.warning('Payment %s: %s gateway error, left pending: %s', payment.pk, gw.name, exc)
+            Payment.objects.filter(pk=payment.pk).update(
+                metadata={**(payment.metadata or {}), 'gateway_error': str(exc)[:500]},
+            )
+            payment.refresh_from_db()
+            return payment
+        return PaymentService.finalize_payment(payment.pk, result)
+
     @staticmethod
     @transaction.atomic
-    def process_payment(store, order: Optional[Order], amount: Decimal, currency: str, method: str, metadata: Optional[dict] = None) -> Payment:
+    def _reserve_payment(store, order: Optional[Order], amount: Decimal, currency: str, method: str,
+                         metadata: Optional[dict], gateway: str) -> Payment:
+        if order:
+            # Lock the order row so two concurrent payments can't both pass the is_paid check
+            order = Order.objects.select_for_update().get(pk=order.pk)
         # Basic validation
         if order and order.is_paid:
             raise ValueError('Order is already paid')
@@ -31,28 +81,46 @@ class PaymentService:
             order_total = order.total_amount
             if amount > order_total:
                 raise ValueError('Amount cannot exceed order total_amount')
-
-        # Simulate provider transaction id; prefer store id when available to make ids more informative
-        provider_tx = f"SIM-{int(timezone.now().timestamp())}-{getattr(store, 'id', 'anon')}"
+            if Payment.objects.filter(order=order, status=Payment.Status.PENDING).exists():
+                raise ValueError('A payment for this order is already in progress')
 
         # Create Payment record — store is linked instead of user
-        payment = Payment.objects.create(
+        return Payment.objects.create(
             order=order,
             store=store,
             currency=currency,
             method=method,
-            provider_transaction_id=provider_tx,
-            status=Payment.Status.SUCCESS,
-            processed_at=timezone.now(),
+            reference=new_txid(),
+            gateway=gateway,
+            status=Payment.Status.PENDING,
             metadata=metadata or {},
         )
 
+    @staticmethod
+    @transaction.atomic
+    def finalize_payment(payment_id: int, result: GatewayResult) -> Payment:
+        """Apply a provider outcome to a PENDING payment; no-op once it is settled (safe to repeat)."""
+        payment = Payment.objects.select_for_update().get(pk=payment_id)
+        if payment.status != Payment.Status.PENDING or result.status == 'pending':
+            return payment
+        payment.status = Payment.Status.SUCCESS if result.succeeded else Payment.Status.FAILED
+        payment.provider_transaction_id = result.provider_transaction_id or payment.provider_transaction_id
+        payment.processed_at = timezone.now()
+        update_fields = ['status', 'provider_transaction_id', 'processed_at']
+        if result.succeeded:
+            payment.paid_at = payment.processed_at
+            update_fields.append('paid_at')
+        if result.error:
+            payment.metadata = {**(payment.metadata or {}), 'gateway_error': result.error[:500]}
+            update_fields.append('metadata')
+        payment.save(update_fields=update_fields)
+
         # mark order paid when applicable
-        if order:
+        if result.succeeded and payment.order_id:
+            order = Order.objects.select_for_update().get(pk=payment.order_id)
             order.is_paid = True
             order.status = Order.Status.PROCESSING if order.status == Order.Status.PENDING else order.status
             order.save(update_fields=['is_paid', 'status', 'updated_at'])
-
         return payment
 
     @staticmethod
@@ -73,7 +141,9 @@ class PaymentService:
         # Mark the original payment refunded and record processed_at
         payment.status = Payment.Status.REFUNDED
         payment.processed_at = timezone.now()
-        payment.save(update_fields=['status', 'processed_at'])
+        # Payments have no amount column; kept for the refund rollup (partial refunds)
+        payment.metadata = {**(payment.metadata or {}), 'refund_amount': str(amount)}
+        payment.save(update_fields=['status', 'processed_at', 'metadata'])
 
         # If associated order exists, mark it unpaid / refunded
         if payment.order:
@@ -83,6 +153,17 @@ class PaymentService:
 
         return payment
 
+    @staticmethod
+    def get_by_provider_transaction_id(provider_transaction_id: str) -> Optional[Payment]:
+        """Payment for a provider's transaction id (webhooks, reconciliation); unique index lookup."""
+        if not provider_transaction_id:
+            return None
+        return (
+            Payment.objects.select_related('order', 'store')
+            .filter(provider_transaction_id=provider_transaction_id)
+            .first()
+        )
+
     @staticmethod
     def get_payment_status(payment_id: int) -> str:
         payment = get_object_or_404(Payment, pk=payment_id)
@@ -99,49 +180,51 @@ class OrderService:
     @staticmethod
     @transaction.atomic
     def create_order(user, items: List[Dict], shipping_address: Optional[str] = None, currency: str = 'VND', metadata: Optional[dict] = None) -> Order:
-        """Create an Order and its OrderItems.
+        """Create an Order and its OrderItems, and take the stock out of the store inventory.
 
         `items` is a list of dicts with keys: product_id (int), quantity (int).
-        Unit price is always resolved from StoreInventory for the user's store.
+        Unit price is always resolved from StoreInventory for the user's store,
+        through the store's cached price book. The number of queries does not
+        depend on the number of lines: one conditional stock UPDATE that also
+        enforces availability, one order insert and one bulk item insert.
+        Raises ValueError (nothing is written) when a product is unavailable or
+        out of stock.
         """
         if not items:
             raise ValueError('Order must contain at least one item')
 
-        # Lock selected products to avoid race conditions if needed
-        product_ids = [int(it['product_id']) for it in items]
-        products = {p.id: p for p in Product.objects.filter(id__in=product_ids)}
+        lines = []
+        needed: Dict[int, int] = {}
+        for it in items:
+            pid = int(it['product_id'])
+            qty = int(it.get('quantity', 1))
+            if qty <= 0:
+                raise ValueError('Quantity must be positive')
+            lines.append((pid, qty))
+            needed[pid] = needed.get(pid, 0) + qty
 
         # Determine the store of the user (assumes one active store per owner)
-        from store.models import Store
-        store = Store.objects.filter(owner=user, is_deleted=False, status=Store.Status.ACTIVE).first()
+        store = owned_store(user, active_only=True)
         if not store:
             raise ValueError('User does not own an active store to place orders from')
 
-        total = Decimal('0')
+        book = get_price_book(store)
         prepared = []
-
-        for it in items:
-            pid = int(it['product_id'])
-            qty = int(it.get('quantity', 1))
-            if qty <= 0:
-                raise ValueError('Quantity must be positive')
-            prod = products.get(pid)
-            if not prod:
-                raise ValueError(f'Product {pid} not found')
-
-            # Get price from StoreInventory for this store and product
-            try:
-                inventory = StoreInventory.objects.get(store=store, product=prod)
-            except StoreInventory.DoesNotExist:
+        total = Decimal('0')
+        for pid, qty in lines:
+            entry = book.get(pid)
+            if entry is None:
                 raise ValueError(f'Product {pid} is not available in the store inventory')
-
-            unit_price = inventory.price
-            line_total = unit_price * qty
+            line_total = entry.price * qty
             total += line_total
-            prepared.append((prod, qty, unit_price, line_total))
+            prepared.append((entry, qty, line_total))
+
+        # Take the stock first so a short basket fails before anything is inserted
+        OrderService._take_stock(store, needed)
 
         order = Order.objects.create(
             user=user,
+            store=store,
             status=Order.Status.PENDING,
             total_amount=total,
             currency=currency,
@@ -149,19 +232,287 @@ class OrderService:
             metadata=metadata or {},
         )
 
-        for prod, qty, unit_price, line_total in prepared:
-            OrderItem.objects.create(
+        # bulk_create skips OrderItem.save(), so line_total is computed above
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                product=prod,
-                sku=prod.sku,
-                name=prod.name,
+                product_id=entry.product_id,
+                sku=entry.sku,
+                name=entry.name,
                 quantity=qty,
-                unit_price=unit_price,
+                unit_price=entry.price,
                 line_total=line_total,
             )
-
+            for entry, qty, line_total in prepared
+        ])
         return order
 
+    @staticmethod
+    def _take_stock(store, needed: Dict[int, int]) -> None:
+        """Decrement stock with one `UPDATE ... SET quantity = quantity - n WHERE quantity >= n`.
+
+        The WHERE clause is the stock check: it keeps stock from going negative
+        without a prior locked read. If any product is short the whole order is
+        rolled back. `version` is bumped so an inventory PATCH based on a read
+        from before the sale is reported as a conflict instead of restoring the
+        sold units.
+        """
+        enough = Q()
+        decrement = []
+        for pid, qty in needed.items():
+            enough |= Q(product_id=pid, quantity__gte=qty)
+            decrement.append(When(product_id=pid, then=F('quantity') - qty))
+        updated = StoreInventory.objects.filter(enough, store=store).update(
+            quantity=Case(*decrement, default=F('quantity'), output_field=PositiveIntegerField()),
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        if updated != len(needed):
+            # Failure path only: name the first product that is short
+            stock = dict(store.inventory.filter(product_id__in=needed).values_list('product_id', 'quantity'))
+            for pid, qty in needed.items():
+                if stock.get(pid, 0) < qty:
+                    raise ValueError(f'Insufficient stock for product {pid}: {stock.get(pid, 0)} left, {qty} requested')
+            raise ValueError('Insufficient stock for one or more products')
+        # update() bypasses post_save; POS clients sync stock from the change log
+        record_catalog_changes(needed, kind=CatalogChange.Kind.INVENTORY, store_id=store.id)
+
+    @staticmethod
+    def _return_stock(order: Order) -> None:
+        """Put the order's items back into its store's stock with one `quantity = quantity + n` UPDATE."""
+        if order.store_id is None:
+            return
+        returned = dict(
+            OrderItem.objects.filter(order_id=order.pk).order_by()
+            .values('product_id').annotate(qty=Sum('quantity')).values_list('product_id', 'qty')
+        )
+        if not returned:
+            return
+        rows = StoreInventory.objects.filter(store_id=order.store_id, product_id__in=returned)
+        # Products removed from the store since the sale have no row to return to
+        present = list(rows.values_list('product_id', flat=True))
+        rows.update(
+            quantity=Case(
+                *(When(product_id=pid, then=F('quantity') + qty) for pid, qty in returned.items()),
+                default=F('quantity'), output_field=PositiveIntegerField(),
+            ),
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        record_catalog_changes(present, kind=CatalogChange.Kind.INVENTORY, store_id=order.store_id)
+
+    @staticmethod
+    @transaction.atomic
+    def create_orders_batch(user, entries: List[Dict]) -> List[Dict]:
+        """Create many orders (offline POS replay) with a fixed number of queries.
+
+        `entries` are validated baskets: `client_order_id`, `items`, optional
+        `payment` ({method, metadata}), currency, shipping_address, metadata.
+        Prices come from the store's price book and stock is read once with
+        the rows locked, then allocated basket by basket in order. A basket
+        with an unknown product or not enough stock is reported as an error and
+        skipped; the others are written with one stock UPDATE and bulk inserts
+        of orders, items and payments. A `client_order_id` already stored for
+        the store is reported as `duplicate` with the existing order id, so a
+        replayed batch creates nothing twice.
+
+        Batches of one store run one at a time (the store row is locked first),
+        so a replay that overlaps the original upload waits for it and then
+        sees its orders. If an order with one of the client ids is inserted by
+        another path anyway, the unique `(store, client_order_id)` error rolls
+        back this attempt and the batch is recomputed once.
+
+        Returns one result dict per entry, in input order.
+        """
+        store = owned_store(user, active_only=True)
+        if not store:
+            raise ValueError('User does not own an active store to place orders from')
+
+        list(Store.objects.select_for_update().filter(pk=store.pk).values_list('pk', flat=True))
+        try:
+            with transaction.atomic():
+                return OrderService._write_orders_batch(user, store, entries)
+        except IntegrityError:
+            with transaction.atomic():
+                return OrderService._write_orders_batch(user, store, entries)
+
+    @staticmethod
+    def _write_orders_batch(user, store, entries: List[Dict]) -> List[Dict]:
+        results: List[Optional[Dict]] = [None] * len(entries)
+        # Locking read: sees orders committed after this transaction's snapshot (InnoDB REPEATABLE READ)
+        existing = dict(
+            Order.objects.select_for_update()
+            .filter(store=store, client_order_id__in=[e['client_order_id'] for e in entries])
+            .values_list('client_order_id', 'order_id')
+        )
+        book = get_price_book(store)
+        seen = set()
+        priced = []  # (index, entry, [(price entry, qty, line_total)], total, needed)
+        for index, entry in enumerate(entries):
+            client_id = entry['client_order_id']
+            if client_id in existing:
+                results[index] = {'client_order_id': client_id, 'status': 'duplicate', 'order_id': existing[client_id]}
+                continue
+            if client_id in seen:
+                results[index] = {'client_order_id': client_id, 'status': 'error', 'detail': 'Duplicate client_order_id in batch'}
+                continue
+            seen.add(client_id)
+            lines, needed, total = [], {}, Decimal('0')
+            for it in entry['items']:
+                price = book.get(int(it['product_id']))
+                if price is None:
+                    break
+                qty = int(it['quantity'])
+                lines.append((price, qty, price.price * qty))
+                needed[price.product_id] = needed.get(price.product_id, 0) + qty
+                total += price.price * qty
+            else:
+                priced.append((index, entry, lines, total, needed))
+                continue
+            results[index] = {'client_order_id': client_id, 'status': 'error',
+                              'detail': f"Product {it['product_id']} is not available in the store inventory"}
+
+        # One locked read of every product the batch touches (in pk order to avoid deadlocks)
+        product_ids = {pid for *_, needed in priced for pid in needed}
+        stock = {
+            pid: [pk, qty, version]
+            for pk, pid, qty, version in StoreInventory.objects.select_for_update()
+            .filter(store=store, product_id__in=product_ids).order_by('pk')
+            .values_list('pk', 'product_id', 'quantity', 'version')
+        }
+        accepted = []
+        for index, entry, lines, total, needed in priced:
+            short = next((pid for pid, qty in needed.items() if stock.get(pid, [0, 0, 0])[1] < qty), None)
+            if short is not None:
+                results[index] = {'client_order_id': entry['client_order_id'], 'status': 'error',
+                                  'detail': f'Insufficient stock for product {short}: {stock.get(short, [0, 0, 0])[1]} left'}
+                continue
+            for pid, qty in needed.items():
+                stock[pid][1] -= qty
+            accepted.append((index, entry, lines, total, needed))
+        if not accepted:
+            return results
+
+        touched = {pid for *_, needed in accepted for pid in needed}
+        now = timezone.now()
+        # Bump version like _take_stock: inventory PATCHes based on pre-sale reads become conflicts
+        bulk_update_rows(
+            StoreInventory, ['quantity', 'version', 'updated_at'],
+            [(stock[pid][0], stock[pid][1], stock[pid][2] + 1, now) for pid in touched],
+        )
+        record_catalog_changes(touched, kind=CatalogChange.Kind.INVENTORY, store_id=store.id)
+
+        Order.objects.bulk_create([
+            Order(
+                user=user,
+                store=store,
+                client_order_id=entry['client_order_id'],
+                status=Order.Status.PROCESSING if entry.get('payment') else Order.Status.PENDING,
+                is_paid=bool(entry.get('payment')),
+                total_amount=total,
+                currency=entry.get('currency') or 'VND',
+                shipping_address=entry.get('shipping_address') or '',
+                metadata=entry.get('metadata') or {},
+            )
+            for _, entry, _, total, _ in accepted
+        ], batch_size=500)
+        # MySQL does not return ids from bulk inserts: read them back by client id
+        order_ids = dict(
+            Order.objects.filter(store=store, client_order_id__in=[entry['client_order_id'] for _, entry, *_ in accepted])
+            .values_list('client_order_id', 'order_id')
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order_id=order_ids[entry['client_order_id']],
+                product_id=price.product_id,
+                sku=price.sku,
+                name=price.name,
+                quantity=qty,
+                unit_price=price.price,
+                line_total=line_total,
+            )
+            for _, entry, lines, _, _ in accepted
+            for price, qty, line_total in lines
+        ], batch_size=1000)
+        Payment.objects.bulk_create([
+            Payment(
+                order_id=order_ids[entry['client_order_id']],
+                store=store,
+                currency=entry.get('currency') or 'VND',
+                method=entry['payment'].get('method') or Payment.Method.CARD,
+                # Captured offline at the POS; no provider call here
+                provider_transaction_id=simulated_provider_txid(),
+                gateway='offline',
+                status=Payment.Status.SUCCESS,
+                processed_at=now,
+                paid_at=now,
+                metadata=entry['payment'].get('metadata') or {},
+            )
+            for _, entry, *_ in accepted if entry.get('payment')
+        ], batch_size=500)
+
+        for index, entry, _, total, _ in accepted:
+            results[index] = {
+                'client_order_id': entry['client_order_id'],
+                'status': 'created',
+                'order_id': order_ids[entry['client_order_id']],
+                'total_amount': str(total),
+                'is_paid': bool(entry.get('payment')),
+            }
+        return results
+
+    @staticmethod
+    def filter_orders(qs, params: Mapping[str, str]):
+        """Apply list filters: `status` (comma separated), `created_from` / `created_to`.
+
+        Dates are `YYYY-MM-DD` (a `created_to` date includes the whole day) or ISO
+        datetimes. Raises ValueError for anything else, including well-formed but
+        impossible dates such as `2024-13-45`.
+        """
+        statuses = [s.strip() for s in str(params.get('status') or '').split(',') if s.strip()]
+        if statuses:
+            qs = qs.filter(status__in=statuses)
+        created_from = params.get('created_from')
+        if created_from:
+            qs = qs.filter(created_at__gte=OrderService._parse_moment('created_from', created_from))
+        created_to = params.get('created_to')
+        if created_to:
+            moment = OrderService._parse_moment('created_to', created_to)
+            if isinstance(moment, datetime):
+                qs = qs.filter(created_at__lte=moment)
+            else:
+                # `< next midnight` rather than `__date`, which would not use the index
+                qs = qs.filter(created_at__lt=datetime.combine(moment + timedelta(days=1), time.min))
+        return qs
+
+    @staticmethod
+    def _parse_moment(name: str, value: str):
+        """`date` for `YYYY-MM-DD`, `datetime` for ISO datetimes; ValueError otherwise."""
+        try:
+            moment = parse_date(value) or parse_datetime(value)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValueError(f'{name} must be a date (YYYY-MM-DD) or an ISO datetime')
+        return moment
+
+    @staticmethod
+    def summarize_orders(qs):
+        """Annotate `item_count` (correlated COUNT) and `user_name` (full name, else username) in SQL.
+
+        Works for `ArchivedOrder` querysets too (items come from the `items` relation's model).
+        """
+        item_model = qs.model._meta.get_field('items').related_model
+        items = (
+            item_model.objects.filter(order=OuterRef('pk')).order_by()
+            .values('order').annotate(n=Count('id')).values('n')
+        )
+        full_name = Trim(Concat('user__first_name', Value(' '), 'user__last_name'))
+        return qs.annotate(
+            item_count=Coalesce(Subquery(items), 0),
+            user_name=Coalesce(NullIf(full_name, Value('')), 'user__username'),
+        )
+
     @staticmethod
     def get_order_details(order_id: int, user=None) -> Order:
         qs = Order.objects.select_related('user').prefetch_related('items__product')
@@ -176,8 +527,16 @@ class OrderService:
         if order.status in (Order.Status.COMPLETED, Order.Status.REFUNDED):
             raise ValueError('Cannot cancel a completed or refunded order')
 
-        order.status = Order.Status.CANCELLED
-        # if paid, mark unpaid (refund should be handled separately)
-        order.is_paid = False
-        order.save(update_fields=['status', 'is_paid', 'updated_at'])
+        # Conditional on the transition, so a repeated (or concurrent) cancel returns the stock once
+        cancelled = Order.objects.filter(pk=order.pk).exclude(
+            status__in=(Order.Status.COMPLETED, Order.Status.REFUNDED, Order.Status.CANCELLED),
+        ).update(
+            status=Order.Status.CANCELLED,
+            # if paid, mark unpaid (refund should be handled separately)
+            is_paid=False,
+            updated_at=timezone.now(),
+        )
+        if cancelled:
+            OrderService._return_stock(order)
+        order.refresh_from_db(fields=['status', 'is_paid', 'updated_at'])
         return order
@@ -1,3 +1,698 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.idempotency import clear_idempotency_cache
+from core.models import IdempotencyKey
+from product.models import Product, ProductCategory
+from store.membership import get_membership
+from store.models import Store, StoreCategory
+from store.pricebook import clear_price_books, get_price_book
+from .gateways import GatewayError, GatewayResult, PaymentGateway, get_gateway, reset_gateways
+from .models import Order, OrderItem, Payment
+from .serializers import CompiledPaymentSerializer, PaymentSerializer
+
+User = get_user_model()
+
+
+class CompiledPaymentSerializerTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='owner', password='secret123', first_name='Lan', last_name='Anh')
+        store = Store.objects.create(name='Shop', code='shop', owner=user,
+                                     category=StoreCategory.objects.create(name='Khác'))
+        product = Product.objects.create(name='Coca', sku='CC-1', category=ProductCategory.objects.create(name='Đồ Uống'))
+        order = Order.objects.create(user=user, total_amount=Decimal('31.50'))
+        OrderItem.objects.create(order=order, product=product, name='Coca', quantity=3, unit_price=Decimal('10.50'))
+        Payment.objects.create(order=order, store=store, status=Payment.Status.SUCCESS, metadata={'terminal': 1})
+        # Payments without an order or store skip the related fields entirely
+        Payment.objects.create(status=Payment.Status.PENDING)
+
+    def test_output_matches_model_serializer(self):
+        qs = Payment.objects.select_related('order__user', 'store').prefetch_related('order__items').order_by('id')
+        expected = PaymentSerializer(qs, many=True).data
+        plan = CompiledPaymentSerializer.plan()
+        self.assertEqual(plan.render(plan.values(qs)), list(expected))
+
+
+class CreateOrderTests(TestCase):
+    def setUp(self):
+        from store.models import StoreInventory
+
+        self.user = User.objects.create_user(username='owner', password='secret123')
+        self.store = Store.objects.create(name='Shop', code='shop', owner=self.user,
+                                          category=StoreCategory.objects.create(name='Khác'))
+        category = ProductCategory.objects.create(name='Đồ Uống')
+        self.products = [Product.objects.create(name=f'P{i}', sku=f'SKU-{i}', category=category) for i in range(50)]
+        StoreInventory.objects.bulk_create([
+            StoreInventory(store=self.store, product=p, price=Decimal('2.50'), quantity=10) for p in self.products
+        ])
+
+        # Price books are process-wide; start each test from a cold cache
+        clear_price_books()
+
+    def _stock(self, product):
+        return self.store.inventory.get(product=product).quantity
+
+    def test_cancel_returns_stock_once(self):
+        from product.models import CatalogChange
+        from .services import OrderService
+
+        coca, pepsi = self.products[:2]
+        order = OrderService.create_order(self.user, [
+            {'product_id': coca.id, 'quantity': 3}, {'product_id': pepsi.id, 'quantity': 1},
+            {'product_id': coca.id, 'quantity': 2},
+        ])
+        self.assertEqual((self._stock(coca), self._stock(pepsi)), (5, 9))
+        version = self.store.inventory.get(product=coca).version
+        CatalogChange.objects.all().delete()
+
+        self.assertEqual(OrderService.cancel_order(order.pk).status, Order.Status.CANCELLED)
+        self.assertEqual((self._stock(coca), self._stock(pepsi)), (10, 10))
+        self.assertEqual(self.store.inventory.get(product=coca).version, version + 1)
+        self.assertEqual(sorted(CatalogChange.objects.values_list('product_id', flat=True)), sorted([coca.id, pepsi.id]))
+
+        OrderService.cancel_order(order.pk)
+        self.assertEqual((self._stock(coca), self._stock(pepsi)), (10, 10))
+
+    def test_query_count_does_not_depend_on_basket_size(self):
+        from .services import OrderService
+
+        # Warm the process-wide caches, as in a running worker
+        get_price_book(self.store)
+        get_membership(self.user)
+        with self.assertNumQueries(7) as small:
+            OrderService.create_order(self.user, [{'product_id': self.products[0].id, 'quantity': 1}])
+        with self.assertNumQueries(len(small.captured_queries)):
+            order = OrderService.create_order(self.user, [{'product_id': p.id, 'quantity': 2} for p in self.products])
+        self.assertEqual(order.items.count(), 50)
+        self.assertEqual(order.total_amount, Decimal('250.00'))
+        self.assertEqual(self._stock(self.products[0]), 7)
+        self.assertEqual(self._stock(self.products[1]), 8)
+
+    def test_insufficient_stock_rolls_back(self):
+        from .services import OrderService
+
+        items = [{'product_id': self.products[0].id, 'quantity': 6}, {'product_id': self.products[0].id, 'quantity': 5}]
+        with self.assertRaisesMessage(ValueError, 'Insufficient stock'):
+            OrderService.create_order(self.user, items)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self._stock(self.products[0]), 10)
+
+    def test_sale_invalidates_inventory_version(self):
+        from .services import OrderService
+
+        product = self.products[0]
+        version = self.store.inventory.get(product=product).version
+        OrderService.create_order(self.user, [{'product_id': product.id, 'quantity': 4}])
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        summary = client.patch(
+            f'/api/stores/{self.store.id}/inventory/',
+            {'items': [{'product_id': product.id, 'quantity': 12, 'version': version}]}, format='json',
+        ).json()
+        self.assertEqual(summary['conflicts'], [{'product_id': product.id, 'version': version + 1}])
+        self.assertEqual(self._stock(product), 6)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        from store.models import StoreInventory
+
+        self.user = User.objects.create_user(username='owner', password='secret123', is_staff=True)
+        self.store = Store.objects.create(name='Shop', code='shop', owner=self.user,
+                                          category=StoreCategory.objects.create(name='Khác'))
+        self.product = Product.objects.create(name='Coca', sku='CC-1', category=ProductCategory.objects.create(name='Đồ Uống'))
+        StoreInventory.objects.create(store=self.store, product=self.product, price=Decimal('10.00'), quantity=10)
+        clear_price_books()
+        clear_idempotency_cache()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.body = {'items': [{'product_id': self.product.id, 'quantity': 2}]}
+
+    def _create(self, key, body=None):
+        return self.client.post('/api/orders/', body or self.body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_without_creating_a_duplicate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._create('k-1')
+        self.assertEqual(first.status_code, 201)
+        # Replay from the in-process cache: no query at all
+        with self.assertNumQueries(0):
+            retry = self._create('k-1')
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        # Another worker (cold cache) replays from the table
+        clear_idempotency_cache()
+        with self.assertNumQueries(1):
+            retry = self._create('k-1')
+        self.assertEqual(retry.json()['order_id'], first.json()['order_id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.store.inventory.get().quantity, 8)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self._create('k-1')
+        other = self._create('k-1', {'items': [{'product_id': self.product.id, 'quantity': 1}]})
+        self.assertEqual(other.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_pay_is_idempotent(self):
+        order_id = self._create('k-order').json()['order_id']
+        url = f'/api/orders/{order_id}/pay/'
+        first = self.client.post(url, {'method': 'cash'}, format='json', HTTP_IDEMPOTENCY_KEY='k-pay')
+        retry = self.client.post(url, {'method': 'cash'}, format='json', HTTP_IDEMPOTENCY_KEY='k-pay')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(Payment.objects.count(), 1)
+        # Without the header the is_paid guard still applies
+        self.assertEqual(self.client.post(url, {'method': 'cash'}, format='json').status_code, 400)
+
+    def test_failed_request_does_not_keep_the_key(self):
+        from unittest import mock
+
+        with mock.patch('payment.views.OrderSerializer.to_representation', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self._create('k-1')
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self._create('k-1').status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class OrderBatchTests(TestCase):
+    def setUp(self):
+        from store.models import StoreInventory
+
+        self.user = User.objects.create_user(username='owner', password='secret123')
+        self.store = Store.objects.create(name='Shop', code='shop', owner=self.user,
+                                          category=StoreCategory.objects.create(name='Khác'))
+        category = ProductCategory.objects.create(name='Đồ Uống')
+        self.products = [Product.objects.create(name=f'P{i}', sku=f'SKU-{i}', category=category) for i in range(3)]
+        StoreInventory.objects.bulk_create([
+            StoreInventory(store=self.store, product=p, price=Decimal('2.50'), quantity=5) for p in self.products
+        ])
+        clear_price_books()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _basket(self, client_id, *lines, **extra):
+        return {'client_order_id': client_id, 'items': [{'product_id': p.id, 'quantity': q} for p, q in lines], **extra}
+
+    def _post(self, orders):
+        return self.client.post('/api/orders/batch/', {'orders': orders}, format='json')
+
+    def test_failures_are_isolated(self):
+        p0, p1, p2 = self.products
+        response = self._post([
+            self._basket('a', (p0, 2), (p1, 1), payment={'method': 'cash'}),
+            self._basket('b', (p0, 4)),          # only 3 left after `a`
+            self._basket('c', (p2, 1)),
+            {'client_order_id': 'd', 'items': []},
+            self._basket('e', (p0, 3)),
+        ])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([r['status'] for r in body['results']], ['created', 'error', 'created', 'error', 'created'])
+        self.assertEqual((body['created'], body['error']), (3, 2))
+        self.assertIn('Insufficient stock', body['results'][1]['detail'])
+
+        a = Order.objects.get(client_order_id='a')
+        self.assertEqual((a.total_amount, a.is_paid, a.items.count(), a.store_id), (Decimal('7.50'), True, 2, self.store.id))
+        self.assertEqual(Payment.objects.get().order_id, a.order_id)
+        self.assertEqual(self.store.inventory.get(product=p0).quantity, 0)
+
+    def test_query_count_is_independent_of_batch_size_and_replay_is_noop(self):
+        get_price_book(self.store)
+        get_membership(self.user)
+        # store lock + savepoint/release around the 10 batch queries
+        with self.assertNumQueries(13):
+            self._post([self._basket(f'o{i}', (self.products[i % 3], 1)) for i in range(3)])
+        with self.assertNumQueries(13):
+            self._post([self._basket(f'x{i}', (self.products[i % 3], 1)) for i in range(12)])
+        response = self._post([self._basket('o1', (self.products[1], 1))])
+        self.assertEqual(response.json()['results'][0]['status'], 'duplicate')
+        self.assertEqual(Order.objects.count(), 15)
+
+    def test_stock_write_bumps_inventory_version(self):
+        p0 = self.products[0]
+        self._post([self._basket('a', (p0, 2))])
+        row = self.store.inventory.get(product=p0)
+        self.assertEqual((row.quantity, row.version), (3, 2))
+
+    def test_replay_overlapping_a_batch_in_flight(self):
+        from unittest import mock
+
+        p0, p1, _ = self.products
+        # The original upload committed `a` after this replay checked for existing orders
+        Order.objects.create(user=self.user, store=self.store, client_order_id='a', total_amount=Decimal('5'))
+        reads = []
+        real_select_for_update = Order.objects.select_for_update
+
+        def first_check_misses(*args, **kwargs):
+            reads.append(1)
+            qs = real_select_for_update(*args, **kwargs)
+            return qs.none() if len(reads) == 1 else qs
+
+        with mock.patch.object(Order.objects, 'select_for_update', side_effect=first_check_misses):
+            response = self._post([self._basket('a', (p0, 2)), self._basket('b', (p1, 1))])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['duplicate', 'created'])
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(Order.objects.filter(client_order_id='a').count(), 1)
+        self.assertEqual(self.store.inventory.get(product=p0).quantity, 5)
+        self.assertEqual(self.store.inventory.get(product=p1).quantity, 4)
+
+
+class OrderListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='secret123', first_name='Lan', last_name='Anh')
+        product = Product.objects.create(name='Coca', sku='CC-1', category=ProductCategory.objects.create(name='Đồ Uống'))
+        self.orders = []
+        for status in (Order.Status.PENDING, Order.Status.COMPLETED, Order.Status.CANCELLED):
+            order = Order.objects.create(user=self.user, status=status, total_amount=Decimal('21.00'))
+            for qty in (1, 2):
+                OrderItem.objects.create(order=order, product=product, name='Coca', quantity=qty, unit_price=Decimal('7.00'))
+            self.orders.append(order)
+        Order.objects.filter(pk=self.orders[0].pk).update(created_at='2024-01-10 08:00:00')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_compact_rows_with_sql_annotations(self):
+        body = self.client.get('/api/orders/').json()
+        self.assertEqual(body['count'], 3)
+        row = body['results'][0]
+        self.assertEqual((row['item_count'], row['user_name']), (2, 'Lan Anh'))
+        self.assertNotIn('items', row)
+        self.assertNotIn('metadata', row)
+
+        row = self.client.get('/api/orders/?expand=items').json()['results'][0]
+        self.assertEqual([i['quantity'] for i in sorted(row['items'], key=lambda i: i['quantity'])], [1, 2])
+
+    def test_filters(self):
+        def ids(query):
+            return sorted(r['order_id'] for r in self.client.get('/api/orders/' + query).json()['results'])
+
+        first, completed, cancelled = (o.order_id for o in self.orders)
+        self.assertEqual(ids('?status=completed,cancelled'), [completed, cancelled])
+        self.assertEqual(ids('?created_to=2024-01-10'), [first])
+        self.assertEqual(ids('?created_from=2024-01-11'), [completed, cancelled])
+        self.assertEqual(ids('?created_to=2024-01-10T09:00:00'), [first])
+
+    def test_invalid_dates_are_rejected(self):
+        for query in ('?created_from=2024-13-45', '?created_to=2024-02-30', '?created_from=yesterday',
+                      '?created_to=2024-01-10T25:00:00', '?created_from=2024-13-45&include_archived=1'):
+            response = self.client.get('/api/orders/' + query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('must be a date', str(response.json()))
+
+
+class TxIdTests(TestCase):
+    def test_ids_are_unique_and_sorted_within_one_millisecond(self):
+        from .txid import TXID_LENGTH, TxIdGenerator, txid_datetime
+
+        now = [1_700_000_000_000]
+        generate = TxIdGenerator(clock=lambda: now[0])
+        ids = [generate() for _ in range(1000)]
+        now[0] -= 5  # clock stepping back must not break the order
+        ids.append(generate())
+        now[0] += 10
+        ids.append(generate())
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual({len(i) for i in ids}, {TXID_LENGTH})
+        self.assertEqual(txid_datetime('SIM-' + ids[0]).timestamp(), 1_700_000_000)
+
+    def test_payments_get_distinct_ids_and_can_be_looked_up(self):
+        from .services import PaymentService
+
+        user = User.objects.create_user(username='owner', password='secret123')
+        store = Store.objects.create(name='Shop', code='shop', owner=user, category=StoreCategory.objects.create(name='Khác'))
+        payments = [
+            PaymentService.process_payment(store, Order.objects.create(user=user, total_amount=Decimal('5')), Decimal('5'), 'VND', 'cash')
+            for _ in range(3)
+        ]
+        tx_ids = [p.provider_transaction_id for p in payments]
+        self.assertEqual(len(set(tx_ids)), 3)
+        self.assertEqual(PaymentService.get_by_provider_transaction_id(tx_ids[1]).pk, payments[1].pk)
+        self.assertIsNone(PaymentService.get_by_provider_transaction_id('SIM-unknown'))
+
+
+class ScriptedGateway(PaymentGateway):
+    """Test gateway: pops outcomes from `script` (a GatewayResult or an exception to raise)."""
+
+    script = []
+    seen_atomic = []
+
+    def charge(self, request):
+        from django.db import connection
+
+        self.seen_atomic.append(connection.in_atomic_block)
+        outcome = self.script.pop(0) if self.script else GatewayResult('succeeded', f'SCR-{request.reference}')
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def retrieve(self, reference):
+        return None
+
+
+@override_settings(PAYMENT_GATEWAY='scripted', PAYMENT_GATEWAYS={'scripted': {'CLASS': 'payment.tests.ScriptedGateway'}})
+class GatewayTests(TestCase):
+    def setUp(self):
+        reset_gateways()
+        ScriptedGateway.script = []
+        self.user = User.objects.create_user(username='owner', password='secret123', is_staff=True)
+        self.store = Store.objects.create(name='Shop', code='shop', owner=self.user,
+                                          category=StoreCategory.objects.create(name='Khác'))
+        self.order = Order.objects.create(user=self.user, total_amount=Decimal('25'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/orders/{self.order.id}/pay/'
+
+    def tearDown(self):
+        reset_gateways()
+
+    def test_declined_charge_is_failed_and_can_be_retried(self):
+        ScriptedGateway.script = [GatewayResult('failed', 'SCR-1', 'card_declined')]
+        declined = self.client.post(self.url, {'method': 'card'}, format='json')
+        self.assertEqual(declined.status_code, 402)
+        self.assertEqual(declined.json()['status'], Payment.Status.FAILED)
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_paid)
+
+        paid = self.client.post(self.url, {'method': 'card'}, format='json')
+        self.assertEqual(paid.status_code, 201)
+        payment = Payment.objects.get(pk=paid.json()['id'])
+        self.assertEqual((payment.gateway, payment.provider_transaction_id), ('scripted', f'SCR-{payment.reference}'))
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.is_paid)
+
+    def test_unknown_outcome_stays_pending_until_finalized(self):
+        from .services import PaymentService
+
+        ScriptedGateway.script = [GatewayError('timed out')]
+        response = self.client.post(self.url, {'method': 'card'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        payment = Payment.objects.get()
+        self.assertEqual(payment.status, Payment.Status.PENDING)
+        self.assertIn('timed out', payment.metadata['gateway_error'])
+        # The charge may have gone through: no second attempt while it is pending
+        self.assertEqual(self.client.post(self.url, {'method': 'card'}, format='json').status_code, 400)
+
+        PaymentService.finalize_payment(payment.pk, GatewayResult('succeeded', 'SCR-late'))
+        PaymentService.finalize_payment(payment.pk, GatewayResult('failed', 'SCR-other'))
+        payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((payment.status, payment.provider_transaction_id), (Payment.Status.SUCCESS, 'SCR-late'))
+        self.assertTrue(self.order.is_paid)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_retry_takes_over_an_abandoned_key(self):
+        import hashlib
+        import json
+        from datetime import timedelta
+        from django.utils import timezone
+
+        # Claimed by a request whose worker died during the provider call
+        claim = dict(user=self.user, endpoint=f'POST {self.url}',
+                     request_hash=hashlib.sha256(json.dumps({'method': 'card'}).encode()).hexdigest())
+        IdempotencyKey.objects.create(key='k-live', lease_expires_at=timezone.now() + timedelta(minutes=1), **claim)
+        IdempotencyKey.objects.create(key='k-dead', lease_expires_at=timezone.now() - timedelta(seconds=1), **claim)
+
+        busy = self.client.post(self.url, {'method': 'card'}, format='json', HTTP_IDEMPOTENCY_KEY='k-live')
+        self.assertEqual(busy.status_code, 409)
+        retry = self.client.post(self.url, {'method': 'card'}, format='json', HTTP_IDEMPOTENCY_KEY='k-dead')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get(key='k-dead').status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get(key='k-live').status_code, 0)
+        replay = self.client.post(self.url, {'method': 'card'}, format='json', HTTP_IDEMPOTENCY_KEY='k-dead')
+        self.assertEqual((replay.status_code, replay['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(Payment.objects.count(), 1)
+
+
+@override_settings(PAYMENT_GATEWAY='scripted', PAYMENT_GATEWAYS={'scripted': {'CLASS': 'payment.tests.ScriptedGateway'}})
+class GatewayTransactionTests(TransactionTestCase):
+    def setUp(self):
+        reset_gateways()
+        clear_idempotency_cache()
+        ScriptedGateway.script = []
+        ScriptedGateway.seen_atomic = []
+
+    def tearDown(self):
+        reset_gateways()
+
+    def test_provider_is_called_outside_any_transaction(self):
+        user = User.objects.create_user(username='owner', password='secret123', is_staff=True)
+        order = Order.objects.create(user=user, total_amount=Decimal('25'))
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f'/api/orders/{order.id}/pay/'
+        first = client.post(url, {'method': 'card'}, format='json', HTTP_IDEMPOTENCY_KEY='k-pay')
+        retry = client.post(url, {'method': 'card'}, format='json', HTTP_IDEMPOTENCY_KEY='k-pay')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(ScriptedGateway.seen_atomic, [False])
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+    def test_stub_provider_over_http(self):
+        import threading
+        from http.server import ThreadingHTTPServer
+        from .gateways import _HAS_GEVENTHTTPCLIENT
+        from .management.commands.run_stub_provider import StubProvider, make_handler
+        from .services import PaymentService
+
+        if not _HAS_GEVENTHTTPCLIENT:
+            self.skipTest('geventhttpclient not installed')
+        provider = StubProvider(failure_rate=0.0)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(provider))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        gateways = {'stub': {'CLASS': 'payment.gateways.HttpGateway', 'BASE_URL': f'http://127.0.0.1:{server.server_port}'}}
+        with override_settings(PAYMENT_GATEWAYS=gateways):
+            reset_gateways()
+            user = User.objects.create_user(username='owner', password='secret123')
+            order = Order.objects.create(user=user, total_amount=Decimal('25'))
+            payment = PaymentService.process_payment(None, order, Decimal('25'), 'VND', 'card', gateway='stub')
+            self.assertEqual(payment.status, Payment.Status.SUCCESS)
+            self.assertEqual(provider.retrieve(payment.reference)['id'], payment.provider_transaction_id)
+
+
+@override_settings(PAYMENT_GATEWAYS={'scripted': {'CLASS': 'payment.tests.ScriptedGateway', 'WEBHOOK_SECRET': 's3cret'}})
+class WebhookTests(TestCase):
+    def setUp(self):
+        reset_gateways()
+        self.user = User.objects.create_user(username='owner', password='secret123')
+        self.client = APIClient()
+        self.url = '/api/payments/webhooks/scripted/'
+        self.created = 1_700_000_000
+
+    def tearDown(self):
+        reset_gateways()
+
+    def _pending(self, n, prefix='REF'):
+        payments = []
+        for i in range(n):
+            order = Order.objects.create(user=self.user, total_amount=Decimal('10'))
+            payments.append(Payment.objects.create(order=order, reference=f'{prefix}-{i}', gateway='scripted'))
+        return payments
+
+    def _event(self, event_id, reference, status, delay=0):
+        return {'id': event_id, 'type': f'charge.{status}', 'created': self.created + delay,
+                'data': {'id': f'PRV-{reference}', 'reference': reference, 'status': status}}
+
+    def _post(self, event, secret='s3cret'):
+        import json
+        from .gateways import sign_webhook
+
+        body = json.dumps(event).encode('utf-8')
+        return self.client.generic('POST', self.url, body, content_type='application/json',
+                                   HTTP_X_SIGNATURE=sign_webhook(secret, body))
+
+    def test_endpoint_verifies_and_stores_each_event_once(self):
+        from .models import WebhookEvent
+
+        event = self._event('evt-1', 'REF-0', 'succeeded')
+        self.assertEqual(self._post(event, secret='wrong').status_code, 401)
+        self.assertEqual(self._post({'id': 'evt-2'}).status_code, 400)
+        with self.assertNumQueries(1):
+            self.assertEqual(self._post(event).status_code, 200)
+        self.assertEqual(self._post(event).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.get().reference, 'REF-0')
+        self.assertEqual(self.client.post('/api/payments/webhooks/nope/', {}).status_code, 404)
+
+    def test_batches_apply_in_event_order_with_constant_queries(self):
+        from .models import WebhookEvent
+        from .webhooks import process_webhook_events, record_webhook_event
+
+        gw = get_gateway('scripted')
+        for size in (3, 9):
+            payments = self._pending(size, prefix=f'B{size}')
+            for i, payment in enumerate(payments):
+                # Delivered out of order: the later "failed" must not win over the earlier "succeeded"
+                record_webhook_event('scripted', gw.parse_webhook(self._event(f'evt-{size}-{i}-b', payment.reference, 'failed', 5)))
+                record_webhook_event('scripted', gw.parse_webhook(self._event(f'evt-{size}-{i}-a', payment.reference, 'succeeded')))
+            record_webhook_event('scripted', gw.parse_webhook(self._event(f'evt-{size}-x', 'REF-unknown', 'succeeded')))
+            # savepoint, events, payments, 3 updates, release
+            with self.assertNumQueries(7):
+                counts = process_webhook_events()
+            self.assertEqual(counts, {'applied': size, 'ignored': size, 'unmatched': 1})
+
+        self.assertEqual(Payment.objects.filter(status=Payment.Status.SUCCESS).count(), 12)
+        self.assertEqual(Order.objects.filter(is_paid=True, status=Order.Status.PROCESSING).count(), 12)
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+        with self.assertNumQueries(3):
+            self.assertEqual(process_webhook_events(), {})
+
+    def test_transaction_id_of_another_payment_does_not_block_the_inbox(self):
+        from .models import WebhookEvent
+        from .webhooks import process_webhook_events, record_webhook_event
+
+        gw = get_gateway('scripted')
+        settled = Payment.objects.create(reference='OLD', provider_transaction_id='PRV-taken',
+                                         status=Payment.Status.SUCCESS, gateway='scripted')
+        taken, twin_a, twin_b, fine = self._pending(4)
+        events = [
+            (taken, 'PRV-taken'),  # already held by another payment
+            (twin_a, 'PRV-twin'), (twin_b, 'PRV-twin'),  # the same id for two payments in one batch
+            (fine, 'PRV-fine'),
+        ]
+        for i, (payment, tx_id) in enumerate(events):
+            event = self._event(f'evt-{i}', payment.reference, 'succeeded', i)
+            event['data']['id'] = tx_id
+            record_webhook_event('scripted', gw.parse_webhook(event))
+
+        with self.assertLogs('payment.webhooks', 'WARNING'):
+            self.assertEqual(process_webhook_events(), {'applied': 2, 'ignored': 2})
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+        statuses = dict(Payment.objects.values_list('reference', 'status'))
+        self.assertEqual([statuses[p.reference] for p in (taken, twin_a, twin_b, fine)],
+                         [Payment.Status.PENDING, Payment.Status.SUCCESS, Payment.Status.PENDING, Payment.Status.SUCCESS])
+        self.assertEqual(Payment.objects.get(provider_transaction_id='PRV-taken'), settled)
+
+
+@override_settings(PAYMENT_GATEWAYS={'scripted': {'CLASS': 'payment.tests.ScriptedGateway'}})
+class ReconcileTests(TestCase):
+    def setUp(self):
+        reset_gateways()
+        self.user = User.objects.create_user(username='owner', password='secret123')
+
+    def tearDown(self):
+        reset_gateways()
+
+    def _order(self, payment_status=None, **fields):
+        order = Order.objects.create(user=self.user, total_amount=Decimal('10'), **fields)
+        if payment_status:
+            Payment.objects.create(order=order, status=payment_status)
+        return order
+
+    def test_classifies_and_fixes_in_chunks(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .reconcile import reconcile_payments
+        from .services import OrderService
+
+        ok = self._order(Payment.Status.SUCCESS, is_paid=True, status=Order.Status.PROCESSING)
+        cancelled = self._order(Payment.Status.SUCCESS, is_paid=True)
+        OrderService.cancel_order(cancelled.pk)
+        unpaid = self._order(Payment.Status.SUCCESS)
+        paid = self._order(is_paid=True)
+        refunded = self._order(Payment.Status.REFUNDED, status=Order.Status.PROCESSING)
+        stale_order = self._order()
+        stale = Payment.objects.create(order=stale_order, reference='REF-stale', gateway='scripted')
+        Payment.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(hours=2))
+
+        report = reconcile_payments(chunk_size=2)
+        self.assertTrue(report.complete)
+        self.assertEqual((report.scanned_orders, report.scanned_payments, report.last_order_id), (6, 5, stale_order.pk))
+        self.assertEqual(dict(report.found), {
+            'cancelled_with_payment': 1, 'unpaid_with_payment': 1, 'paid_without_payment': 1,
+            'refund_not_applied': 1, 'stale_pending': 1,
+        })
+        self.assertEqual(report.samples['unpaid_with_payment'], [unpaid.pk])
+        self.assertFalse(report.fixed)
+
+        report = reconcile_payments(chunk_size=2, fix=True)
+        self.assertEqual(dict(report.fixed), {
+            'unpaid_with_payment': 1, 'paid_without_payment': 1, 'refund_not_applied': 1, 'stale_pending': 1,
+        })
+        unpaid.refresh_from_db()
+        paid.refresh_from_db()
+        refunded.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertEqual((unpaid.is_paid, unpaid.status), (True, Order.Status.PROCESSING))
+        self.assertFalse(paid.is_paid)
+        self.assertEqual(refunded.status, Order.Status.REFUNDED)
+        # The provider never saw the charge
+        self.assertEqual(stale.status, Payment.Status.FAILED)
+
+        # Resume after a given id; only the report-only case is left
+        report = reconcile_payments(start_after=ok.pk)
+        self.assertEqual(dict(report.found), {'cancelled_with_payment': 1})
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        self.user = User.objects.create_user(username='owner', password='secret123', first_name='An', last_name='Le')
+        product = Product.objects.create(name='Coca', sku='CC-1', category=ProductCategory.objects.create(name='Đồ Uống'))
+        old = timezone.now() - timedelta(days=400)
+        self.orders = {}
+        for name, status in [('done', Order.Status.COMPLETED), ('cancelled', Order.Status.CANCELLED),
+                             ('open', Order.Status.PROCESSING), ('recent', Order.Status.COMPLETED)]:
+            order = Order.objects.create(user=self.user, total_amount=Decimal('20'), status=status)
+            OrderItem.objects.create(order=order, product=product, quantity=2, unit_price=Decimal('10'))
+            Payment.objects.create(order=order, status=Payment.Status.SUCCESS, provider_transaction_id=f'SIM-{name}')
+            if name != 'recent':
+                Order.objects.filter(pk=order.pk).update(created_at=old)
+            self.orders[name] = order
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_archive_columns_have_the_live_types(self):
+        from django.db import connection
+        from .archive import _TABLES
+
+        for live, archived, _ in _TABLES:
+            archived_fields = {f.column: f for f in archived._meta.concrete_fields}
+            for field in live._meta.concrete_fields:
+                # rel_db_type: an AutoField key is stored like the IntegerField copying it
+                self.assertEqual(archived_fields[field.column].rel_db_type(connection), field.rel_db_type(connection),
+                                 f'{archived._meta.db_table}.{field.column}')
+
+    def test_moves_finished_old_orders_with_items_and_payments(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .archive import archive_orders
+        from .models import ArchivedOrder, ArchivedOrderItem, ArchivedPayment
+
+        result = archive_orders(timezone.now() - timedelta(days=365), chunk_size=1)
+        self.assertEqual((result.orders, result.items, result.payments), (2, 2, 2))
+        archived_ids = {self.orders['done'].pk, self.orders['cancelled'].pk}
+        self.assertEqual(set(ArchivedOrder.objects.values_list('order_id', flat=True)), archived_ids)
+        self.assertEqual(set(ArchivedOrderItem.objects.values_list('order_id', flat=True)), archived_ids)
+        self.assertEqual(ArchivedPayment.objects.get(provider_transaction_id='SIM-done').order_id, self.orders['done'].pk)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertEqual(archive_orders(timezone.now() - timedelta(days=365)).orders, 0)
+
+        # Reads include the archive only when asked
+        self.assertEqual(self.client.get('/api/orders/').json()['count'], 2)
+        rows = self.client.get('/api/orders/?include_archived=1').json()
+        self.assertEqual(rows['count'], 4)
+        archived_row = next(r for r in rows['results'] if r['order_id'] == self.orders['done'].pk)
+        self.assertEqual((archived_row['item_count'], archived_row['user_name']), (1, 'An Le'))
+        filtered = self.client.get('/api/orders/?include_archived=1&status=cancelled').json()
+        self.assertEqual([r['order_id'] for r in filtered['results']], [self.orders['cancelled'].pk])
+
+        url = f"/api/orders/{self.orders['done'].pk}/"
+        self.assertEqual(self.client.get(url).status_code, 404)
+        detail = self.client.get(url + '?include_archived=1').json()
+        self.assertEqual((detail['status'], len(detail['items'])), (Order.Status.COMPLETED, 1))
+        other = User.objects.create_user(username='other', password='secret123', email='o@example.com')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url + '?include_archived=1').status_code, 404)
@@ -1,48 +1,131 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from decimal import Decimal
 
 from rest_framework import viewsets, status
 from rest_framework import mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAdminUser, AllowAny, IsAuthenticated
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.authentication import SessionAuthentication
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.db.models import Q
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+from core.idempotency import idempotent
+from core.views import CompiledListMixin
 from .serializers import (
+    CompiledPaymentSerializer,
     OrderSerializer,
+    OrderListSerializer,
+    OrderBatchEntrySerializer,
     OrderCreateSerializer,
     PaymentSerializer,
     PaymentCreateSerializer,
 )
+from .gateways import get_gateway
 from .services import OrderService, PaymentService
-from .models import Order, Payment
+from .webhooks import record_webhook_event
+from .models import ArchivedOrder, Order, Payment
+from store.membership import get_membership, owned_store
 from store.models import Store
+from user.authentication import CachedTokenAuthentication
+
+
+# PENDING = provider outcome unknown (timeout), settled later; FAILED = declined
+_PAYMENT_STATUS_CODES = {
+    Payment.Status.SUCCESS: status.HTTP_201_CREATED,
+    Payment.Status.PENDING: status.HTTP_202_ACCEPTED,
+    Payment.Status.FAILED: status.HTTP_402_PAYMENT_REQUIRED,
+}
+
+
+def payment_response(payment: Payment) -> Response:
+    return Response(
+        PaymentSerializer(payment).data,
+        status=_PAYMENT_STATUS_CODES.get(payment.status, status.HTTP_201_CREATED),
+    )
+
+
+class OrderPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
 
 
 class OrderViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Orders of the current user (all orders for staff).
+
+    `GET /api/orders/` is paginated and compact (`OrderListSerializer`); filter
+    with `status=a,b`, `created_from`, `created_to`; `?expand=items` adds items.
+    `?include_archived=1` also reads the archive tables (`payment.archive`):
+    the list becomes a UNION of both (items are not expanded then) and the
+    detail endpoint falls back to the archive.
+    """
     serializer_class = OrderSerializer
+    pagination_class = OrderPagination
     # Require auth via DRF Token or Session
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]
     queryset = Order.objects.all().order_by('-created_at')
 
-    def get_queryset(self):
+    # Columns of a list row when live and archived orders are combined
+    LIST_VALUES = ('order_id', 'user_id', 'status', 'total_amount', 'currency', 'is_paid',
+                   'created_at', 'updated_at', 'item_count', 'user_name')
+
+    def include_archived(self) -> bool:
+        return str(self.request.query_params.get('include_archived', '')).lower() in {'1', 'true'}
+
+    def scope(self, qs):
         # Scope orders to the current user unless staff/system admin
-        qs = super().get_queryset()
         user = getattr(self.request, 'user', None)
         if user and (getattr(user, 'is_staff', False) or getattr(user, 'is_system_admin', False)):
             return qs
         return qs.filter(user=user)
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action == 'list':
+            try:
+                qs = OrderService.filter_orders(qs, self.request.query_params)
+            except ValueError as exc:
+                raise ValidationError({'detail': str(exc)})
+            if self.include_archived():
+                archived = OrderService.filter_orders(ArchivedOrder.objects.all(), self.request.query_params)
+                live = OrderService.summarize_orders(self.scope(qs)).values(*self.LIST_VALUES).order_by()
+                archived = OrderService.summarize_orders(self.scope(archived)).values(*self.LIST_VALUES).order_by()
+                return live.union(archived, all=True).order_by('-created_at', '-order_id')
+            qs = OrderService.summarize_orders(OrderListSerializer.optimize_queryset(qs, self.request))
+        elif self.action == 'retrieve':
+            # Only load the columns/relations needed by ?fields= / ?expand=
+            qs = OrderSerializer.optimize_queryset(qs, self.request)
+        return self.scope(qs)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            if not self.include_archived():
+                raise
+        qs = ArchivedOrder.objects.select_related('user').prefetch_related('items')
+        order = get_object_or_404(self.scope(qs), pk=kwargs.get('pk'))
+        return Response(OrderSerializer(order, context=self.get_serializer_context()).data)
+
     def get_serializer_class(self):
         if self.action == 'create':
             return OrderCreateSerializer
+        if self.action == 'list':
+            return OrderListSerializer
         return OrderSerializer
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = OrderCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -53,10 +136,46 @@ class OrderViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.Ge
         metadata = data.get('metadata')
         # Attach the authenticated user to the order
         user = request.user
-        order = OrderService.create_order(user, items=items, shipping_address=shipping_address, currency=currency, metadata=metadata)
+        try:
+            order = OrderService.create_order(user, items=items, shipping_address=shipping_address, currency=currency, metadata=metadata)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         out = OrderSerializer(order, context={'request': request}).data
         return Response(out, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Offline POS sync: `{"orders": [{client_order_id, items, payment?, ...}, ...]}`.
+
+        Each basket is validated and stocked independently; the response lists
+        `created` / `duplicate` / `error` per basket in input order.
+        """
+        orders = request.data.get('orders') if isinstance(request.data, dict) else None
+        if not isinstance(orders, list) or not orders:
+            return Response({'detail': '`orders` must be a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = getattr(settings, 'ORDER_BATCH_MAX_SIZE', 500)
+        if len(orders) > limit:
+            return Response({'detail': f'At most {limit} orders per batch.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results, valid, positions = [None] * len(orders), [], []
+        for index, entry in enumerate(orders):
+            serializer = OrderBatchEntrySerializer(data=entry)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                positions.append(index)
+            else:
+                client_id = entry.get('client_order_id') if isinstance(entry, dict) else None
+                results[index] = {'client_order_id': client_id, 'status': 'error', 'detail': serializer.errors}
+        if valid:
+            try:
+                created = OrderService.create_orders_batch(request.user, valid)
+            except ValueError as exc:
+                return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            for index, result in zip(positions, created):
+                results[index] = result
+        counts = {name: sum(r['status'] == name for r in results) for name in ('created', 'duplicate', 'error')}
+        return Response({**counts, 'results': results})
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def cancel(self, request, pk=None):
         """Staff-only cancel (store owner manages orders)."""
@@ -69,6 +188,7 @@ class OrderViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.Ge
         return Response(OrderSerializer(order).data)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
+    @idempotent(atomic=False)
     def pay(self, request, pk=None):
         """Staff-only pay action: store owner triggers payment for an order.
 
@@ -98,9 +218,8 @@ class OrderViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.Ge
         if store_id:
             store = get_object_or_404(Store, pk=store_id)
         else:
-            if request.user and request.user.is_authenticated:
-                # pick the first store owned by the user if any
-                store = Store.objects.filter(owner=request.user).first()
+            # pick the first store owned by the user if any
+            store = owned_store(request.user)
 
         try:
             payment = PaymentService.process_payment(
@@ -113,30 +232,35 @@ class OrderViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.Ge
             )
         except Exception as exc:
             return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
-        return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
+        return payment_response(payment)
 
 
-class PaymentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet, mixins.CreateModelMixin):
+class PaymentViewSet(CompiledListMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet, mixins.CreateModelMixin):
     """ViewSet for payments. Creation triggers payment processing via PaymentService.
 
     Now requires only `order_id` in create requests: amount will be derived server-side from the order's total_amount.
     Optionally accepts `store_id` to link the payment to a store.
     """
     serializer_class = PaymentSerializer
+    compiled_serializer = CompiledPaymentSerializer
     # Require auth via DRF Token or Session
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]
-    # optimize queries: include related order & store and prefetch order items used by serializer
-    queryset = Payment.objects.select_related('order', 'store').prefetch_related('order__items').order_by('-created_at')
+    # optimize queries: include related order & store; order items are prefetched in
+    # get_queryset only when the serializer actually renders them
+    queryset = Payment.objects.select_related('order', 'store').order_by('-created_at')
 
     def get_queryset(self):
         # Scope payments to user's orders or user's stores (owner)
         user = getattr(self.request, 'user', None)
         qs = self.queryset
+        if self.action in ('list', 'retrieve'):
+            qs = PaymentSerializer.optimize_queryset(qs, self.request)
         if user and (getattr(user, 'is_staff', False) or getattr(user, 'is_system_admin', False)):
             return qs
         return qs.filter(Q(order__user=user) | Q(store__owner=user))
 
+    @idempotent(atomic=False)
     def create(self, request, *args, **kwargs):
         # Log incoming request for debugging (payload and content type)
         try:
@@ -162,9 +286,9 @@ class PaymentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.
 
         order = get_object_or_404(Order, pk=order_id)
 
-        # Authorize: user must own the order or the store
+        # Authorize: user must own the order or the order's store (cached membership, no query)
         user = request.user
-        if not (order.user_id == user.id or Store.objects.filter(owner=user, payments__order=order).exists() or Store.objects.filter(owner=user).exists()):
+        if not (order.user_id == user.id or get_membership(user).owns(order.store_id)):
             return Response({'detail': 'Not allowed for this order.'}, status=status.HTTP_403_FORBIDDEN)
 
         # Derive amount from order total_amount
@@ -184,8 +308,7 @@ class PaymentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.
             if store_id:
                 store = get_object_or_404(Store, pk=store_id)
             else:
-                if request.user and request.user.is_authenticated:
-                    store = Store.objects.filter(owner=request.user).first()
+                store = owned_store(request.user)
 
             payment = PaymentService.process_payment(
                 store,
@@ -197,7 +320,7 @@ class PaymentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.
             )
         except Exception as exc:
             return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
-        return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
+        return payment_response(payment)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def refund(self, request, pk=None):
@@ -223,3 +346,29 @@ class PaymentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.
         except Exception as exc:
             return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(PaymentSerializer(payment).data)
+
+
+class PaymentWebhookView(APIView):
+    """Provider callbacks: verify the signature, store the event, answer at once.
+
+    Events are applied later, in batches, by `python manage.py process_webhooks`.
+    Redelivered events (same id) are accepted and dropped.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, gateway):
+        try:
+            gw = get_gateway(gateway)
+        except ImproperlyConfigured:
+            return Response({'detail': 'Unknown gateway.'}, status=status.HTTP_404_NOT_FOUND)
+        # Signature covers the raw bytes, so read them before DRF parses the body
+        body = request.body
+        if not gw.verify_webhook(body, request.headers):
+            return Response({'detail': 'Invalid signature.'}, status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            event = gw.parse_webhook(json.loads(body))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        record_webhook_event(gw.name, event)
+        return Response({'received': True}, status=status.HTTP_200_OK)
@@ -0,0 +1,136 @@
+"""Payment webhook inbox.
+
+The endpoint only verifies an event and appends it to `WebhookEvent` (one
+INSERT, redeliveries ignored by the unique `(gateway, event_id)` key).
+`process_webhook_events` applies the inbox in batches with a fixed number of
+queries per batch, whatever its size:
+
+- events are claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so several
+  consumers can run;
+- their payments are locked and read in one query (by `reference`, else by
+  `provider_transaction_id`);
+- per payment, events are replayed in `occurred_at` order: the first terminal
+  status settles a PENDING payment, like `PaymentService.finalize_payment`;
+  later or conflicting events are recorded but change nothing, and so is an
+  event whose `provider_transaction_id` already belongs to another payment
+  (it would break the unique key and roll back the whole batch);
+- payments, orders and events are written with one UPDATE each.
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter, defaultdict
+from typing import Dict
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from core.bulk import bulk_update_rows
+from .gateways import GatewayEvent
+from .models import Order, Payment, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_BATCH_SIZE = 500
+
+_TARGET_STATUS = {
+    'succeeded': Payment.Status.SUCCESS,
+    'failed': Payment.Status.FAILED,
+}
+
+
+def record_webhook_event(gateway: str, event: GatewayEvent) -> None:
+    """Append to the inbox; an event id already received is silently dropped."""
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(
+            gateway=gateway,
+            event_id=event.event_id,
+            event_type=event.type,
+            reference=event.reference,
+            provider_transaction_id=event.provider_transaction_id,
+            status=event.status,
+            occurred_at=event.occurred_at,
+            payload=event.payload,
+        )
+    ], ignore_conflicts=True)
+
+
+@transaction.atomic
+def process_webhook_events(batch_size: int = WEBHOOK_BATCH_SIZE) -> Dict[str, int]:
+    """Apply one batch of pending events; returns counts per `WebhookEvent.Result` (empty when idle)."""
+    events = list(
+        WebhookEvent.objects.select_for_update(skip_locked=True)
+        .filter(processed_at__isnull=True)
+        .order_by('id')
+        .only('id', 'gateway', 'event_id', 'reference', 'provider_transaction_id', 'status', 'occurred_at')[:batch_size]
+    )
+    if not events:
+        return {}
+
+    references = {e.reference for e in events if e.reference}
+    # All incoming tx ids, not only those used for matching: they are checked for conflicts too
+    tx_ids = {e.provider_transaction_id for e in events if e.provider_transaction_id}
+    payments = list(
+        Payment.objects.select_for_update()
+        .filter(Q(reference__in=references) | Q(provider_transaction_id__in=tx_ids))
+        .only('id', 'order_id', 'status', 'reference', 'provider_transaction_id', 'processed_at', 'paid_at')
+    )
+    by_reference = {p.reference: p for p in payments if p.reference}
+    by_tx_id = {p.provider_transaction_id: p for p in payments if p.provider_transaction_id}
+    tx_owner = {tx_id: p.pk for tx_id, p in by_tx_id.items()}
+
+    results = {}
+    grouped = defaultdict(list)
+    for event in events:
+        payment = by_reference.get(event.reference) if event.reference else by_tx_id.get(event.provider_transaction_id)
+        if payment is None:
+            results[event.pk] = WebhookEvent.Result.UNMATCHED
+        else:
+            grouped[payment.pk].append((payment, event))
+
+    now = timezone.now()
+    payment_rows, paid_order_ids = [], []
+    for group in grouped.values():
+        payment = group[0][0]
+        settled = False
+        for _, event in sorted(group, key=lambda pair: (pair[1].occurred_at, pair[1].pk)):
+            target = _TARGET_STATUS.get(event.status)
+            if target is None:
+                results[event.pk] = WebhookEvent.Result.IGNORED
+            elif payment.status == target:
+                # Already settled the same way (synchronous charge or an earlier event)
+                results[event.pk] = WebhookEvent.Result.DUPLICATE
+            elif payment.status != Payment.Status.PENDING:
+                logger.warning('Webhook %s:%s says %s but payment %s is %s; ignored',
+                               event.gateway, event.event_id, event.status, payment.pk, payment.status)
+                results[event.pk] = WebhookEvent.Result.IGNORED
+            elif (event.provider_transaction_id
+                  and tx_owner.setdefault(event.provider_transaction_id, payment.pk) != payment.pk):
+                logger.warning('Webhook %s:%s: transaction %s already belongs to payment %s, not %s; ignored',
+                               event.gateway, event.event_id, event.provider_transaction_id,
+                               tx_owner[event.provider_transaction_id], payment.pk)
+                results[event.pk] = WebhookEvent.Result.IGNORED
+            else:
+                payment.status = target
+                payment.provider_transaction_id = event.provider_transaction_id or payment.provider_transaction_id
+                payment.processed_at = now
+                if target == Payment.Status.SUCCESS:
+                    payment.paid_at = now
+                settled = True
+                results[event.pk] = WebhookEvent.Result.APPLIED
+        if settled:
+            payment_rows.append((payment.pk, payment.status, payment.provider_transaction_id,
+                                 payment.processed_at, payment.paid_at))
+            if payment.status == Payment.Status.SUCCESS and payment.order_id:
+                paid_order_ids.append(payment.order_id)
+
+    bulk_update_rows(Payment, ['status', 'provider_transaction_id', 'processed_at', 'paid_at'], payment_rows)
+    if paid_order_ids:
+        Order.objects.filter(pk__in=paid_order_ids).update(
+            is_paid=True,
+            status=Case(When(status=Order.Status.PENDING, then=Value(Order.Status.PROCESSING)), default=F('status')),
+            updated_at=now,
+        )
+    bulk_update_rows(WebhookEvent, ['processed_at', 'result'], [(pk, now, result) for pk, result in results.items()])
+    return dict(Counter(str(result) for result in results.values()))
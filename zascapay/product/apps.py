@@ -5,3 +5,5 @@ class ProductConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'product'
 
+    def ready(self):
+        import product.signals  # noqa: F401
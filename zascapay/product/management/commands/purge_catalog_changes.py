@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from product.services import catalog_retention, purge_catalog_changes
+
+
+class Command(BaseCommand):
+    help = "Xóa change log delta sync cũ hơn CATALOG_CHANGE_RETENTION_DAYS (chạy cron hằng ngày)."
+
+    def handle(self, *args, **opts):
+        deleted = purge_catalog_changes()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} catalog change(s) older than {catalog_retention()}'))
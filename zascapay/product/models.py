@@ -90,3 +90,33 @@ class Detection(models.Model):
     def __str__(self) -> str:  # pragma: no cover
         acc_display = f"{self.accuracy}%" if self.accuracy is not None else "n/a"
         return f"{self.name} ({acc_display})"
+
+
+class CatalogChange(models.Model):
+    """Change log cho delta sync của POS (`/api/sync/catalog/`).
+
+    Mỗi lần ghi Product hoặc StoreInventory thêm một dòng; `id` tự tăng chính là
+    sync token. Không dùng FK để dòng log vẫn còn sau khi sản phẩm bị xóa cứng.
+    """
+
+    class Kind(models.TextChoices):
+        PRODUCT = 'product', 'Product'
+        INVENTORY = 'inventory', 'Inventory'
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    product_id = models.BigIntegerField()
+    # Only set for inventory changes; product changes are visible to every store
+    store_id = models.BigIntegerField(blank=True, null=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'catalog_change'
+        indexes = [
+            models.Index(fields=['created_at'], name='idx_catalog_change_created'),
+        ]
+        verbose_name = 'Catalog change'
+        verbose_name_plural = 'Catalog changes'
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"#{self.pk} {self.kind} {self.product_id}"
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from core.serializers import CompiledSerializer, DynamicFieldsMixin, choice_label
 from .models import Product, ProductCategory, Detection
 
 
@@ -15,7 +17,7 @@ class ProductCategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     status_display = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(read_only=True)
@@ -40,6 +42,9 @@ class ProductSerializer(serializers.ModelSerializer):
             'is_deleted',
         ]
         read_only_fields = ['id', 'last_updated_at', 'created_at']
+        # ?expand=category -> nested category object instead of its id
+        expandable_fields = {'category': ProductCategorySerializer}
+        field_sources = {'status_display': ('status',)}
 
     def get_status_display(self, obj):
         try:
@@ -55,6 +60,13 @@ class ProductSerializer(serializers.ModelSerializer):
         return value
 
 
+# Compiled read path for GET /api/products/ (same output as ProductSerializer)
+CompiledProductSerializer = CompiledSerializer(
+    ProductSerializer,
+    computed={'status_display': (('status',), choice_label(Product.Status))},
+)
+
+
 # ------------------------------------------------------------------
 # Detection serializer used by the scan API
 # ------------------------------------------------------------------
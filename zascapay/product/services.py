@@ -1,11 +1,15 @@
 from __future__ import annotations
 
-from typing import Mapping
+from datetime import timedelta
+from typing import Iterable, Mapping, Optional
 
+from django.conf import settings
 from django.db import models
-from django.db.models import Avg, QuerySet
+from django.db.models import Avg, Count, Q, QuerySet
+from django.utils import timezone
 
-from .models import Product, ProductCategory
+from core.bulk import chunked_update
+from .models import CatalogChange, Product, ProductCategory
 
 
 # --------------------------
@@ -100,6 +104,51 @@ def restore_product(instance: Product) -> Product:
     return instance
 
 
+BULK_PRODUCT_ACTIONS = ('set_status', 'soft_delete', 'restore', 'set_category')
+
+
+def bulk_update_products(
+    *, action: str, value=None, ids: Optional[list] = None, filters: Optional[Mapping[str, str]] = None,
+) -> dict:
+    """Set-based status / soft-delete / restore / category change.
+
+    Rows are selected by `ids` or by `filters` (same params as `filter_products`)
+    and updated with one `UPDATE` per chunk. Returns `{'matched', 'updated'}`;
+    rows already in the target state are matched but not updated.
+    Raises ValueError for an unknown action or invalid value.
+    """
+    if ids is not None:
+        qs = Product.objects.filter(id__in=ids)
+    else:
+        filters = dict(filters or {})
+        if action == 'restore':
+            filters['include_deleted'] = 'true'
+        qs = filter_products(filters)
+
+    if action == 'set_status':
+        if value not in Product.Status.values:
+            raise ValueError(f'Invalid status: {value}')
+        target, values = qs.exclude(status=value), {'status': value}
+    elif action == 'soft_delete':
+        target, values = qs.filter(is_deleted=False), {'is_deleted': True}
+    elif action == 'restore':
+        target, values = qs.filter(is_deleted=True), {'is_deleted': False}
+    elif action == 'set_category':
+        if not ProductCategory.objects.filter(pk=value).exists():
+            raise ValueError(f'Category not found: {value}')
+        target, values = qs.exclude(category_id=value), {'category_id': value}
+    else:
+        raise ValueError(f'Unknown action: {action}')
+
+    matched = qs.count()
+    updated = chunked_update(
+        target, values,
+        # update() bypasses post_save, so feed the POS change log directly
+        on_chunk=lambda chunk: record_catalog_changes(chunk, kind=CatalogChange.Kind.PRODUCT),
+    )
+    return {'matched': matched, 'updated': updated}
+
+
 # --------------------------
 # Metrics
 # --------------------------
@@ -115,13 +164,14 @@ def compute_product_metrics() -> dict:
       - training_count
       - need_review (alias of review_count)
     """
-    qs = Product.objects.filter(is_deleted=False)
-    total = qs.count()
-    active = qs.filter(status=Product.Status.ACTIVE).count()
-    review = qs.filter(status=Product.Status.REVIEW).count()
-    training = qs.filter(status=Product.Status.TRAINING).count()
-
-    agg = qs.aggregate(avg_acc=Avg('accuracy_rate'))
+    agg = Product.objects.filter(is_deleted=False).aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(status=Product.Status.ACTIVE)),
+        review=Count('id', filter=Q(status=Product.Status.REVIEW)),
+        training=Count('id', filter=Q(status=Product.Status.TRAINING)),
+        avg_acc=Avg('accuracy_rate'),
+    )
+    total, active, review, training = agg['total'], agg['active'], agg['review'], agg['training']
     avg_acc = float(agg['avg_acc'] or 0)
 
     return {
@@ -132,3 +182,116 @@ def compute_product_metrics() -> dict:
         'training_count': training,
         'need_review': review,
     }
+
+
+# --------------------------
+# Catalog delta sync (POS)
+# --------------------------
+
+SYNC_PRODUCT_COLUMNS = ('id', 'name', 'sku', 'category_id', 'status', 'image_url', 'is_deleted')
+SYNC_INVENTORY_COLUMNS = ('product_id', 'price', 'quantity')
+SYNC_MAX_CHANGES = 5000
+
+
+def sync_settle_lag() -> timedelta:
+    # Change-log ids are allocated at INSERT, before the writer commits, so an
+    # entry may become visible after a higher id was already handed out. Only
+    # entries older than the lag are served; it must be much longer than the
+    # longest transaction that logs changes (order batches, bulk imports).
+    return timedelta(seconds=getattr(settings, 'CATALOG_SYNC_SETTLE_LAG', 60))
+
+
+def catalog_retention() -> timedelta:
+    return timedelta(days=getattr(settings, 'CATALOG_CHANGE_RETENTION_DAYS', 30))
+
+
+def record_catalog_changes(
+    product_ids: Iterable[int],
+    *,
+    kind: str = CatalogChange.Kind.PRODUCT,
+    store_id: Optional[int] = None,
+    deleted: bool = False,
+) -> None:
+    """Append change-log rows for writes that bypass model signals (`update()`, `bulk_update()`)."""
+    CatalogChange.objects.bulk_create(
+        [CatalogChange(kind=kind, product_id=pid, store_id=store_id, deleted=deleted) for pid in product_ids],
+        batch_size=1000,
+    )
+
+
+def catalog_delta(store, since: int = 0, *, limit: int = SYNC_MAX_CHANGES) -> dict:
+    """Products and `store` inventory rows changed after sync token `since`.
+
+    `since=0` returns a full snapshot, and so does a token the log can no
+    longer answer: newer than the log (e.g. after a DB restore) or whose entry
+    was purged (older than `CATALOG_CHANGE_RETENTION_DAYS`, see
+    `purge_catalog_changes`); the client then replaces its catalog. Otherwise
+    only rows touched by change-log entries after the token are returned, at
+    most `limit` entries per call (`has_more` tells the client to call again
+    with the new token). Rows are sent as compact column/row arrays;
+    hard-deleted rows are listed by product id.
+
+    Only entries older than `CATALOG_SYNC_SETTLE_LAG` are handed out, so that
+    an entry of a transaction still in flight cannot be skipped by a token.
+    """
+    settled = CatalogChange.objects.filter(created_at__lt=timezone.now() - sync_settle_lag())
+    head = settled.order_by('-id').values_list('id', flat=True).first() or 0
+    # Every token handed out is the id of an entry; if it is gone, so may be the entries after it
+    if since <= 0 or since > head or not CatalogChange.objects.filter(pk=since).exists():
+        products = Product.objects.filter(is_deleted=False).order_by('id')
+        inventory = store.inventory.order_by('product_id')
+        return _sync_payload(
+            token=head, full=True, has_more=False,
+            products=products.values_list(*SYNC_PRODUCT_COLUMNS),
+            inventory=inventory.values_list(*SYNC_INVENTORY_COLUMNS),
+        )
+
+    changes = list(
+        settled
+        .filter(id__gt=since)
+        .filter(models.Q(kind=CatalogChange.Kind.PRODUCT) | models.Q(store_id=store.id))
+        .order_by('id')
+        .values_list('id', 'kind', 'product_id')[:limit]
+    )
+    token = changes[-1][0] if changes else since
+    product_ids = {pid for _, kind, pid in changes if kind == CatalogChange.Kind.PRODUCT}
+    inventory_ids = {pid for _, kind, pid in changes if kind == CatalogChange.Kind.INVENTORY}
+
+    products = list(Product.objects.filter(id__in=product_ids).order_by('id').values_list(*SYNC_PRODUCT_COLUMNS))
+    inventory = list(
+        store.inventory.filter(product_id__in=inventory_ids).order_by('product_id').values_list(*SYNC_INVENTORY_COLUMNS)
+    )
+    payload = _sync_payload(token=token, full=False, has_more=len(changes) == limit,
+                            products=products, inventory=inventory)
+    # Anything logged but no longer present was hard-deleted
+    payload['deleted_products'] = sorted(product_ids - {row[0] for row in products})
+    payload['deleted_inventory'] = sorted(inventory_ids - {row[0] for row in inventory})
+    return payload
+
+
+def purge_catalog_changes(now=None) -> int:
+    """Delete change-log entries older than `CATALOG_CHANGE_RETENTION_DAYS`; returns the number deleted.
+
+    POS clients whose token is older get a full snapshot on their next sync.
+    The newest entry is always kept, so that tokens stay valid in a quiet period.
+    """
+    cutoff = (now or timezone.now()) - catalog_retention()
+    latest = CatalogChange.objects.order_by('-id').values_list('id', flat=True).first()
+    deleted, _ = CatalogChange.objects.filter(created_at__lt=cutoff).exclude(pk=latest).delete()
+    return deleted
+
+
+def _sync_payload(*, token: int, full: bool, has_more: bool, products, inventory) -> dict:
+    return {
+        'token': str(token),
+        'full': full,
+        'has_more': has_more,
+        'products': {'columns': SYNC_PRODUCT_COLUMNS, 'rows': [list(row) for row in products]},
+        'inventory': {
+            'columns': SYNC_INVENTORY_COLUMNS,
+            # Same decimal format as the REST API ('10.50')
+            'rows': [[pid, None if price is None else f'{price:.2f}', qty] for pid, price, qty in inventory],
+        },
+        'deleted_products': [],
+        'deleted_inventory': [],
+    }
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from store.models import StoreInventory
+from .models import CatalogChange, Product
+
+
+@receiver(post_save, sender=Product)
+def log_product_saved(sender, instance, **kwargs):
+    CatalogChange.objects.create(kind=CatalogChange.Kind.PRODUCT, product_id=instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def log_product_deleted(sender, instance, **kwargs):
+    CatalogChange.objects.create(kind=CatalogChange.Kind.PRODUCT, product_id=instance.pk, deleted=True)
+
+
+@receiver(post_save, sender=StoreInventory)
+def log_inventory_saved(sender, instance, **kwargs):
+    CatalogChange.objects.create(
+        kind=CatalogChange.Kind.INVENTORY, product_id=instance.product_id, store_id=instance.store_id,
+    )
+
+
+@receiver(post_delete, sender=StoreInventory)
+def log_inventory_deleted(sender, instance, **kwargs):
+    CatalogChange.objects.create(
+        kind=CatalogChange.Kind.INVENTORY, product_id=instance.product_id, store_id=instance.store_id, deleted=True,
+    )
@@ -1,3 +1,209 @@
+import io
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import Product, ProductCategory
+from .serializers import CompiledProductSerializer, ProductSerializer
+
+
+class CompiledProductSerializerTests(TestCase):
+    def setUp(self):
+        category = ProductCategory.objects.create(name='Đồ Uống')
+        Product.objects.create(name='Coca Cola 500ml', sku='CC-500-001', category=category,
+                               accuracy_rate=Decimal('98.5'), detection_count=12)
+        Product.objects.create(name='Pepsi', sku='PS-001', category=category, accuracy_rate=None,
+                               status=Product.Status.REVIEW, image_url='http://example.com/p.png')
+
+    def test_output_matches_model_serializer(self):
+        qs = Product.objects.select_related('category').order_by('name')
+        expected = ProductSerializer(qs, many=True).data
+        plan = CompiledProductSerializer.plan()
+        self.assertEqual(plan.render(plan.values(qs)), list(expected))
+
+    def test_sparse_fields_are_compiled(self):
+        plan = CompiledProductSerializer.plan(ProductSerializer(fields=['id', 'name', 'sku']))
+        self.assertEqual(plan.keys, ['id', 'name', 'sku'])
+
+    def test_expanded_relation_falls_back(self):
+        self.assertIsNone(CompiledProductSerializer.plan(ProductSerializer(expand=['category'])))
+
+
+class ProductDynamicFieldsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username='u1', password='secret123'))
+        self.category = ProductCategory.objects.create(name='Đồ Uống')
+        Product.objects.create(name='Coca', sku='CC-1', category=self.category)
+
+    def _rows(self, params):
+        res = self.client.get('/api/products/', params)
+        self.assertEqual(res.status_code, 200)
+        return res.json()['results']
+
+    def test_fields_narrow_the_output(self):
+        self.assertEqual(self._rows({'fields': 'id,name'}), [{'id': Product.objects.get().id, 'name': 'Coca'}])
+        self.assertIn('category_name', self._rows({})[0])
+
+    def test_unknown_fields_and_expansions_are_ignored(self):
+        self.assertEqual(list(self._rows({'fields': 'name,bogus', 'expand': 'bogus,items'})[0]), ['name'])
+        self.assertEqual(self._rows({'fields': 'bogus'}), [{}])
+
+    def test_expand_category_nests_without_extra_queries(self):
+        rows = self._rows({'fields': 'id', 'expand': 'category'})
+        self.assertEqual(rows[0]['category']['name'], 'Đồ Uống')
+        self.assertEqual(set(rows[0]), {'id', 'category'})
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as one:
+            self._rows({'expand': 'category'})
+        other = ProductCategory.objects.create(name='Bánh Kẹo')
+        for i in range(3):
+            Product.objects.create(name=f'Kẹo {i}', sku=f'KK-{i}', category=other)
+        with CaptureQueriesContext(connection) as many:
+            rows = self._rows({'expand': 'category'})
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['category']['name'] for row in rows}, {'Đồ Uống', 'Bánh Kẹo'})
+        self.assertEqual(len(many), len(one))
+
+    def test_query_params_are_ignored_on_writes(self):
+        res = self.client.post('/api/products/?fields=id', {
+            'name': 'Pepsi', 'sku': 'PS-1', 'category': self.category.id,
+        }, format='json')
+        self.assertEqual(res.status_code, 201, res.content)
+        self.assertIn('name', res.json())
+
+
+class ProductConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username='u1', password='secret123'))
+        self.category = ProductCategory.objects.create(name='Đồ Uống')
+        self.product = Product.objects.create(name='Coca', sku='CC-1', category=self.category)
+
+    def test_unchanged_list_returns_304(self):
+        res = self.client.get('/api/products/')
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, 304)
+
+    def test_product_or_category_change_invalidates(self):
+        etag = self.client.get('/api/products/').headers['ETag']
+        self.category.name = 'Nước Ngọt'
+        self.category.save()
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(f'/api/products/{self.product.id}/').headers['ETag']
+        self.product.name = 'Coca Zero'
+        self.product.save()
+        res = self.client.get(f'/api/products/{self.product.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['name'], 'Coca Zero')
+
+
+class CatalogSyncTests(TestCase):
+    def setUp(self):
+        from store.models import Store, StoreCategory, StoreInventory
+
+        user = get_user_model().objects.create_user(username='pos1', password='secret123')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.store = Store.objects.create(name='Shop 1', owner=user,
+                                          category=StoreCategory.objects.create(name='Tạp hóa'))
+        self.product = Product.objects.create(name='Coca', sku='CC-1',
+                                              category=ProductCategory.objects.create(name='Đồ Uống'))
+        self.inventory = StoreInventory.objects.create(store=self.store, product=self.product,
+                                                       price=Decimal('10000'), quantity=5)
+        self._settle()
+
+    def _settle(self):
+        # Sync only hands out change-log entries older than the settle lag
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import CatalogChange
+
+        CatalogChange.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+
+    def test_full_snapshot_then_delta(self):
+        full = self.client.get('/api/sync/catalog/').json()
+        self.assertTrue(full['full'])
+        self.assertEqual([row[0] for row in full['products']['rows']], [self.product.id])
+        self.assertEqual(full['inventory']['rows'], [[self.product.id, '10000.00', 5]])
+
+        self.inventory.price = Decimal('12000')
+        self.inventory.save()
+        self._settle()
+        delta = self.client.get('/api/sync/catalog/', {'since': full['token']}).json()
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['products']['rows'], [])
+        self.assertEqual(delta['inventory']['rows'], [[self.product.id, '12000.00', 5]])
+
+        again = self.client.get('/api/sync/catalog/', {'since': delta['token']}).json()
+        self.assertEqual(again['inventory']['rows'], [])
+
+    def test_invalid_token(self):
+        self.assertEqual(self.client.get('/api/sync/catalog/', {'since': 'abc'}).status_code, 400)
+
+    def test_purged_token_gets_full_snapshot(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import CatalogChange
+
+        old = self.client.get('/api/sync/catalog/').json()['token']
+        CatalogChange.objects.update(created_at=timezone.now() - timedelta(days=60))
+        self.inventory.quantity = 7
+        self.inventory.save()
+        self._settle()
+        current = self.client.get('/api/sync/catalog/', {'since': old}).json()
+        self.assertFalse(current['full'])
+
+        # Everything but the newest entry is past the retention window
+        CatalogChange.objects.update(created_at=timezone.now() - timedelta(days=60))
+        call_command('purge_catalog_changes', stdout=io.StringIO())
+        self.assertEqual(list(CatalogChange.objects.values_list('id', flat=True)), [int(current['token'])])
+        resync = self.client.get('/api/sync/catalog/', {'since': old}).json()
+        self.assertTrue(resync['full'])
+        self.assertEqual(resync['inventory']['rows'], [[self.product.id, '10000.00', 7]])
+        self.assertEqual(resync['token'], current['token'])
+        self.assertFalse(self.client.get('/api/sync/catalog/', {'since': current['token']}).json()['full'])
+
+
+class ProductBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username='u1', password='secret123'))
+        self.category = ProductCategory.objects.create(name='Đồ Uống')
+        self.products = [
+            Product.objects.create(name=f'Coca {i}', sku=f'CC-{i}', category=self.category) for i in range(3)
+        ]
+
+    def test_soft_delete_and_restore_by_ids(self):
+        ids = [p.id for p in self.products[:2]]
+        resp = self.client.post('/api/products/bulk/', {'action': 'soft_delete', 'ids': ids}, format='json')
+        self.assertEqual(resp.json(), {'matched': 2, 'updated': 2})
+        self.assertEqual(Product.objects.filter(is_deleted=True).count(), 2)
+
+        resp = self.client.post('/api/products/bulk/', {'action': 'restore', 'ids': ids + [self.products[2].id]},
+                                format='json')
+        self.assertEqual(resp.json(), {'matched': 3, 'updated': 2})
+        self.assertFalse(Product.objects.filter(is_deleted=True).exists())
+
+    def test_set_status_by_filter(self):
+        with self.assertNumQueries(4):
+            resp = self.client.post('/api/products/bulk/', {
+                'action': 'set_status', 'value': Product.Status.REVIEW, 'filter': {'search': 'Coca'},
+            }, format='json')
+        self.assertEqual(resp.json()['updated'], 3)
+        self.assertEqual(Product.objects.filter(status=Product.Status.REVIEW).count(), 3)
 
-# Create your tests here.
+    def test_invalid_request(self):
+        resp = self.client.post('/api/products/bulk/', {'action': 'set_status', 'value': 'nope', 'ids': [1]},
+                                format='json')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post('/api/products/bulk/', {'action': 'soft_delete', 'filter': {}}, format='json')
+        self.assertEqual(resp.status_code, 400)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import ProductPageView, ProductViewSet, ProductCategoryViewSet, ScanAPIView
+from .views import CatalogSyncView, ProductPageView, ProductViewSet, ProductCategoryViewSet, ScanAPIView
 
 urlpatterns = [
     # HTML page (Hybrid View-API): /product/
@@ -9,6 +9,7 @@ urlpatterns = [
     # Product API
     path('api/products/', ProductViewSet.as_view({'get': 'list', 'post': 'create'}), name='product-list'),
     path('api/products/metrics/', ProductViewSet.as_view({'get': 'metrics'}), name='product-metrics'),
+    path('api/products/bulk/', ProductViewSet.as_view({'post': 'bulk'}), name='product-bulk'),
     path('api/products/export/', ProductViewSet.as_view({'get': 'export'}), name='product-export'),
     path('api/products/scan/', ScanAPIView.as_view(), name='product-scan'),
     path('api/products/<int:pk>/', ProductViewSet.as_view({
@@ -19,6 +20,9 @@ urlpatterns = [
     }), name='product-detail'),
     path('api/products/<int:pk>/restore/', ProductViewSet.as_view({'post': 'restore'}), name='product-restore'),
 
+    # POS catalog delta sync
+    path('api/sync/catalog/', CatalogSyncView.as_view(), name='catalog-sync'),
+
     # Category API
     path('api/categories/', ProductCategoryViewSet.as_view({'get': 'list', 'post': 'create'}), name='category-list'),
     path('api/categories/<int:pk>/',  ProductCategoryViewSet.as_view({
@@ -13,6 +13,8 @@ from rest_framework.request import Request
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
+from django.views.decorators.gzip import gzip_page
 from typing import cast
 from django.conf import settings
 from django.core.files.base import ContentFile
@@ -23,8 +25,16 @@ import logging
 from django.utils import timezone
 
 from .models import ProductCategory, Product, Detection
-from .serializers import ProductSerializer, ProductCategorySerializer
+from core.bulk import parse_bulk_request
+from core.views import CompiledListMixin, ConditionalGetMixin
+from .serializers import CompiledProductSerializer, ProductSerializer, ProductCategorySerializer
+from core.renderers import MSGPACK_AVAILABLE, MsgPackRenderer
+from analytics.services import record_scan
+from store.pricebook import get_price_book
+from store.services import resolve_user_store
 from .services import (
+    bulk_update_products,
+    catalog_delta,
     compute_product_metrics,
     filter_products,
     filter_categories,
@@ -44,8 +54,8 @@ except Exception:
     _HAS_CV2 = False
 logger = logging.getLogger(__name__)
 
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
-from store.models import Store, StoreInventory
+from rest_framework.authentication import SessionAuthentication
+from user.authentication import CachedTokenAuthentication
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print("Device", device)
@@ -64,8 +74,11 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CompiledListMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
+    compiled_serializer = CompiledProductSerializer
+    # category_name is rendered too, so a renamed category must change the ETag
+    related_modified_fields = ('category__updated_at',)
     pagination_class = StandardResultsSetPagination
     permission_classes = [IsAuthenticated]
 
@@ -74,7 +87,11 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         request = cast(Request, cast(object, self.request))
-        return filter_products(request.query_params)
+        qs = filter_products(request.query_params)
+        if self.action in ('list', 'retrieve'):
+            # Only load the columns/relations needed by ?fields= / ?expand=
+            qs = self.get_serializer_class().optimize_queryset(qs, request)
+        return qs
 
     def create(self, request, *args, **kwargs):
         """Create product from limited fields (form) and handle optional image uploads.
@@ -145,10 +162,22 @@ class ProductViewSet(viewsets.ModelViewSet):
         product = restore_product(self.get_object())
         return Response(self.get_serializer(product).data)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """`{"action": "set_status"|"soft_delete"|"restore"|"set_category", "value"?, "ids"|"filter"}`."""
+        try:
+            operation, value, ids, filters = parse_bulk_request(request.data)
+            result = bulk_update_products(action=operation, value=value, ids=ids, filters=filters)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
     @action(detail=False, methods=['get'])
     def metrics(self, request):
-        data = compute_product_metrics()
-        return Response(data)
+        # Any product write bumps last_updated_at (or the row count), so the KPIs
+        # are only recomputed when something actually changed
+        state = self.collection_state(Product.objects.all())
+        return self.conditional_response(request, state, lambda request: Response(compute_product_metrics()))
 
     @action(detail=False, methods=['get'])
     def export(self, request):
@@ -196,10 +225,10 @@ class ScanAPIView(APIView):
     - Chỉ trả về sản phẩm thuộc store của user đó.
       + Nếu user.user.store không null -> dùng store này.
       + Nếu user không có store gắn trực tiếp thì thử tìm store mà user là owner.
-    - Không ghi vào DB, chỉ đọc Product / StoreInventory và trả về ảnh đã annotate.
+    - Chỉ ghi một ScanEvent (analytics); giá lấy từ price book, tồn kho 1 query cho mọi box.
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
     parser_classes = [JSONParser, MultiPartParser, FormParser]
     yolo_model = YOLO("retail2.pt").to(device)
 
@@ -207,21 +236,9 @@ class ScanAPIView(APIView):
         """Tìm store gắn với user.
 
         Ưu tiên user.store (FK trên model User). Nếu không có thì
-        tìm store mà user là owner, lấy cái đầu tiên.
+        tìm store mà user là owner, lấy cái đầu tiên (qua cache store.membership).
         """
-        if not user or not user.is_authenticated:
-            return None
-
-        # 1) nếu User có FK trực tiếp tới store
-        store = getattr(user, 'store', None)
-        if store is not None:
-            return store
-
-        # 2) fallback: tìm store mà user là owner
-        try:
-            return Store.objects.filter(owner=user).first()
-        except Exception:
-            return None
+        return resolve_user_store(user)
 
     def post(self, request, format=None):
         # Lấy store của user
@@ -264,30 +281,38 @@ class ScanAPIView(APIView):
             detections_data = []
             annotated = result.plot()
 
-            # Chỉ lấy product thuộc đúng store của user thông qua StoreInventory
+            # Chỉ lấy product thuộc đúng store của user, tra giá từ price book (cache theo store)
+            book = get_price_book(store)
             for cls_id, conf in zip(boxes.cls.tolist(), boxes.conf.tolist()):
                 cls_name = labels[int(cls_id)]
                 accuracy = round(float(conf) * 100, 2)
 
-                # Lấy inventory cho store hiện tại + tên class YOLO (match theo product.name)
-                inventory = (
-                    StoreInventory.objects
-                    .select_related('product', 'store')
-                    .filter(store=store, product__name__iexact=cls_name)
-                    .first()
-                )
-
-                if inventory and inventory.product:
+                # Match tên class YOLO với product.name (không phân biệt hoa thường)
+                entry = book.find_by_name(cls_name)
+                if entry is not None:
                     detections_data.append({
-                        'product_id': inventory.product.id,
-                        'product_name': inventory.product.name,
-                        'store_id': inventory.store.id,
-                        'store_name': inventory.store.name,
-                        'price': str(inventory.price) if inventory.price is not None else None,
-                        'quantity': inventory.quantity,
+                        'product_id': entry.product_id,
+                        'product_name': entry.name,
+                        'store_id': store.id,
+                        'store_name': store.name,
+                        'price': str(entry.price),
+                        'quantity': None,
                         'accuracy': accuracy,
                     })
 
+            # Tồn kho thay đổi theo từng đơn nên không nằm trong price book: đọc 1 query cho mọi detection
+            if detections_data:
+                stock = dict(
+                    store.inventory
+                    .filter(product_id__in={d['product_id'] for d in detections_data})
+                    .values_list('product_id', 'quantity')
+                )
+                for d in detections_data:
+                    d['quantity'] = stock.get(d['product_id'], 0)
+
+            # Raw event cho rollup analytics (scans/detections theo giờ)
+            record_scan(store.id, detections_data)
+
             if not _HAS_CV2:
                 return Response({'detail': 'OpenCV (cv2) không khả dụng trên server.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -307,8 +332,32 @@ class ScanAPIView(APIView):
             return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+@method_decorator(gzip_page, name='dispatch')
+class CatalogSyncView(APIView):
+    """Delta sync catalog cho máy POS.
+
+    `GET /api/sync/catalog/?since=<token>[&store=<id>]` trả về Product và
+    StoreInventory (của store hiện tại) đã thay đổi sau token, cùng token mới.
+    Không có `since` (hoặc `since=0`) => snapshot đầy đủ. Response được gzip;
+    gửi `Accept: application/x-msgpack` để nhận msgpack nếu server có cài.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, MsgPackRenderer] if MSGPACK_AVAILABLE else [JSONRenderer]
+
+    def get(self, request, format=None):
+        try:
+            since = int(request.query_params.get('since') or 0)
+        except (TypeError, ValueError):
+            return Response({'detail': 'Token `since` không hợp lệ.'}, status=status.HTTP_400_BAD_REQUEST)
+        store = resolve_user_store(request.user, request.query_params.get('store'))
+        if store is None:
+            return Response({'detail': 'User hiện tại không có store liên kết.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(catalog_delta(store, since))
+
+
+class ProductCategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = ProductCategorySerializer
+    last_modified_field = 'updated_at'
     queryset = ProductCategory.objects.all().order_by('name')
     pagination_class = StandardResultsSetPagination
     permission_classes = [IsAuthenticated]
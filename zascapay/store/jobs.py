@@ -0,0 +1,23 @@
+"""Background job handlers for store bulk actions (run by `manage.py run_jobs`)."""
+from jobs.registry import register
+from jobs.services import fan_out
+
+from .services import apply_store_config, push_model_update, restart_store, send_store_alert
+
+# Job kind -> per-store action; payload: {"store_ids": [...]}
+STORE_BULK_ACTIONS = {
+    'store.bulk_restart': restart_store,
+    'store.bulk_alert': send_store_alert,
+    'store.bulk_update_model': push_model_update,
+    'store.bulk_configure': apply_store_config,
+}
+
+
+def _fan_out_to_stores(action):
+    def handler(job):
+        return fan_out(job, job.payload.get('store_ids', []), action)
+    return handler
+
+
+for _kind, _action in STORE_BULK_ACTIONS.items():
+    register(_kind, _fan_out_to_stores(_action))
@@ -0,0 +1,166 @@
+"""Which stores a user works in, cached across requests.
+
+Scan, order and payment paths all need "the user's store" and some of them
+also check that the user owns a store. A `Membership` answers both from one
+query (`Store.objects.filter(owner=user)` as `(id, active)` pairs in the same
+order as `Store.objects.filter(owner=user).first()`), plus `user.store_id`
+(the store a staff member is linked to), which is already on the user row.
+
+- Per request it is memoized (thread-local, reset by the `request_started` /
+  `request_finished` signals), together with the `Store` rows loaded through
+  `get_store`, so the view and the services it calls share them. Outside a
+  request (commands, jobs) nothing is memoized.
+- Across requests the owned ids are kept in a process-local LRU for
+  `STORE_MEMBERSHIP_TTL` seconds. Store and user saves/deletes invalidate the
+  entries in the worker that made the change (`store.signals`); the TTL bounds
+  how long other workers may see the old list.
+
+Only ids are cached. `Store` rows are re-read once per request, because price
+books check `Store.price_version` on the row the caller passes.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from .models import Store
+
+_request = threading.local()
+
+
+def _as_id(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Membership(NamedTuple):
+    user_id: int
+    # (store id, active and not deleted), ordered like `Store.objects.filter(owner=user)`
+    owned: Tuple[Tuple[int, bool], ...]
+    staff_store_id: Optional[int]
+
+    @property
+    def owned_ids(self) -> Tuple[int, ...]:
+        return tuple(pk for pk, _ in self.owned)
+
+    def owns(self, store_id) -> bool:
+        store_id = _as_id(store_id)
+        return store_id is not None and any(pk == store_id for pk, _ in self.owned)
+
+    def can_access(self, store_id) -> bool:
+        """Owner of the store, or staff linked to it."""
+        return self.owns(store_id) or (self.staff_store_id is not None and self.staff_store_id == _as_id(store_id))
+
+    def first_owned_id(self, active_only: bool = False) -> Optional[int]:
+        for pk, active in self.owned:
+            if active or not active_only:
+                return pk
+        return None
+
+    def default_store_id(self) -> Optional[int]:
+        """The linked store (staff) first, then the first owned store."""
+        return self.staff_store_id or self.first_owned_id()
+
+
+_owned: "OrderedDict[int, Tuple[float, Tuple[Tuple[int, bool], ...]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _ttl() -> float:
+    return float(getattr(settings, 'STORE_MEMBERSHIP_TTL', 60))
+
+
+def _max_entries() -> int:
+    return int(getattr(settings, 'STORE_MEMBERSHIP_CACHE_SIZE', 10000))
+
+
+def _load_owned(user_id: int) -> Tuple[Tuple[int, bool], ...]:
+    rows = (
+        Store.objects.filter(owner_id=user_id)
+        .order_by('name', 'id')
+        .values_list('id', 'status', 'is_deleted')
+    )
+    return tuple((pk, status == Store.Status.ACTIVE and not deleted) for pk, status, deleted in rows)
+
+
+def _cached_owned(user_id: int) -> Tuple[Tuple[int, bool], ...]:
+    now = time.monotonic()
+    with _lock:
+        entry = _owned.get(user_id)
+        if entry is not None and entry[0] > now:
+            _owned.move_to_end(user_id)
+            return entry[1]
+    owned = _load_owned(user_id)
+    with _lock:
+        _owned[user_id] = (now + _ttl(), owned)
+        _owned.move_to_end(user_id)
+        while len(_owned) > _max_entries():
+            _owned.popitem(last=False)
+    return owned
+
+
+def begin_request(**kwargs) -> None:
+    _request.memo = {}
+
+
+def end_request(**kwargs) -> None:
+    _request.memo = None
+
+
+def _memoized(key, load):
+    memo = getattr(_request, 'memo', None)
+    if memo is None:
+        return load()
+    if key not in memo:
+        memo[key] = load()
+    return memo[key]
+
+
+def get_membership(user) -> Optional[Membership]:
+    """Membership of an authenticated user (None for anonymous users)."""
+    if not user or not getattr(user, 'is_authenticated', False):
+        return None
+    return _memoized(
+        ('membership', user.pk),
+        lambda: Membership(user.pk, _cached_owned(user.pk), getattr(user, 'store_id', None)),
+    )
+
+
+def get_store(user, store_id: Optional[int]) -> Optional[Store]:
+    """`Store` row by id, loaded at most once per request."""
+    if store_id is None:
+        return None
+    return _memoized(('store', store_id), lambda: Store.objects.filter(pk=store_id).first())
+
+
+def owned_store(user, active_only: bool = False) -> Optional[Store]:
+    """First store owned by the user (active and not deleted with `active_only`)."""
+    membership = get_membership(user)
+    store = get_store(user, membership.first_owned_id(active_only)) if membership else None
+    # The flags in the membership cache may be stale (saved in another worker); the row is not
+    if store is not None and active_only and (store.status != Store.Status.ACTIVE or store.is_deleted):
+        return None
+    return store
+
+
+def invalidate_memberships(user_ids: Iterable[Optional[int]], store_ids: Iterable[int] = ()) -> None:
+    """Drop cached memberships of these users (and memoized rows of these stores in this request)."""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    with _lock:
+        for user_id in user_ids:
+            _owned.pop(user_id, None)
+    memo = getattr(_request, 'memo', None)
+    if memo:
+        for key in [('membership', user_id) for user_id in user_ids] + [('store', pk) for pk in store_ids]:
+            memo.pop(key, None)
+
+
+def clear_memberships() -> None:
+    with _lock:
+        _owned.clear()
@@ -1,3 +1,5 @@
+import secrets
+
 from django.db import models
 from django.conf import settings
 from typing import TYPE_CHECKING
@@ -6,6 +8,10 @@ if TYPE_CHECKING:
     # Allow type checkers to resolve 'product' module used in string FKs
     import product  # noqa: F401
 
+def new_price_version() -> int:
+    """Random stamp rather than a counter, so a restored DB or a reused store id never matches a cached price book."""
+    return secrets.randbits(62)
+
 class StoreCategory(models.Model):
     name = models.CharField(max_length=150, unique=True)
     description = models.TextField(blank=True, null=True)
@@ -51,6 +57,8 @@ class Store(models.Model):
     last_updated_at = models.DateTimeField(auto_now=True)
     image_url = models.URLField(blank=True, null=True)
     is_deleted = models.BooleanField(default=False)
+    # Changes on every price/product write of this store's inventory (see store.pricebook)
+    price_version = models.BigIntegerField(default=new_price_version, editable=False)
 
     class Meta:
         db_table = 'store'
@@ -58,6 +66,8 @@ class Store(models.Model):
             models.Index(fields=['code'], name='idx_store_code'),
             models.Index(fields=['status'], name='idx_store_status'),
             models.Index(fields=['is_deleted'], name='idx_store_deleted'),
+            # filter_stores(): owner scope + soft-delete + status filter
+            models.Index(fields=['owner', 'is_deleted', 'status'], name='idx_store_owner_del_status'),
         ]
         ordering = ['name']
         verbose_name = 'Cửa hàng'
@@ -73,6 +83,9 @@ class StoreInventory(models.Model):
     quantity = models.PositiveIntegerField(default=0)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     added_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every API write; clients send it back for optimistic concurrency
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'store_inventory'
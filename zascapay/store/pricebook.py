@@ -0,0 +1,115 @@
+"""Process-local per-store price books.
+
+Scan, order and POS paths look up the same store's prices over and over. A
+`PriceBook` loads a store's whole inventory with one query into sorted arrays
+(product ids, prices in cents) and is kept in a bounded LRU across stores.
+
+Every book is tagged with `Store.price_version`. Callers pass the `Store` row
+they already loaded for the request, so checking freshness costs no extra
+query; any write that changes prices or product names replaces the stamp
+(`bump_price_version`) and the next lookup in every worker reloads the book.
+Stock levels are deliberately not part of the book: sales would invalidate it
+on every order.
+"""
+from __future__ import annotations
+
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Iterable, NamedTuple, Optional
+
+from django.conf import settings
+
+from .models import Store, StoreInventory, new_price_version
+
+
+class PriceEntry(NamedTuple):
+    product_id: int
+    price: Decimal
+    name: str
+    sku: str
+
+
+class PriceBook:
+    __slots__ = ('store_id', 'version', '_ids', '_cents', '_names', '_skus', '_by_name')
+
+    def __init__(self, store_id: int, version: int, rows: Iterable[tuple]):
+        # rows: (product_id, price, name, sku) ordered by product_id
+        self.store_id = store_id
+        self.version = version
+        self._ids = array('q')
+        self._cents = array('q')
+        self._names = []
+        self._skus = []
+        self._by_name = {}
+        for product_id, price, name, sku in rows:
+            self._by_name.setdefault((name or '').casefold(), len(self._ids))
+            self._ids.append(product_id)
+            self._cents.append(int(price * 100))
+            self._names.append(name or '')
+            self._skus.append(sku or '')
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _entry(self, index: int) -> PriceEntry:
+        return PriceEntry(self._ids[index], Decimal(self._cents[index]).scaleb(-2), self._names[index], self._skus[index])
+
+    def get(self, product_id: int) -> Optional[PriceEntry]:
+        index = bisect_left(self._ids, product_id)
+        if index < len(self._ids) and self._ids[index] == product_id:
+            return self._entry(index)
+        return None
+
+    def find_by_name(self, name: str) -> Optional[PriceEntry]:
+        """Case-insensitive lookup by product name (YOLO class names); lowest product id wins."""
+        index = self._by_name.get((name or '').casefold())
+        return None if index is None else self._entry(index)
+
+
+_books: "OrderedDict[int, PriceBook]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _max_books() -> int:
+    return int(getattr(settings, 'PRICE_BOOK_CACHE_SIZE', 128))
+
+
+def load_price_book(store_id: int, version: int) -> PriceBook:
+    rows = (
+        StoreInventory.objects
+        .filter(store_id=store_id)
+        .order_by('product_id')
+        .values_list('product_id', 'price', 'product__name', 'product__sku')
+    )
+    return PriceBook(store_id, version, rows.iterator(chunk_size=5000))
+
+
+def get_price_book(store: Store) -> PriceBook:
+    """Price book for `store`, reloaded when `store.price_version` differs from the cached one."""
+    with _lock:
+        book = _books.get(store.pk)
+        if book is not None and book.version == store.price_version:
+            _books.move_to_end(store.pk)
+            return book
+    book = load_price_book(store.pk, store.price_version)
+    with _lock:
+        _books[store.pk] = book
+        _books.move_to_end(store.pk)
+        while len(_books) > _max_books():
+            _books.popitem(last=False)
+    return book
+
+
+def bump_price_version(store_ids: Iterable[int]) -> None:
+    """Invalidate cached price books of these stores in every worker."""
+    store_ids = list(store_ids)
+    if store_ids:
+        Store.objects.filter(pk__in=store_ids).update(price_version=new_price_version())
+
+
+def clear_price_books() -> None:
+    with _lock:
+        _books.clear()
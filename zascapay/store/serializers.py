@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Store, StoreCategory
+
+from core.serializers import CompiledSerializer, DynamicFieldsMixin, choice_label
+from .models import Store, StoreCategory, StoreInventory
 
 
 class StoreCategorySerializer(serializers.ModelSerializer):
@@ -15,7 +17,7 @@ class StoreCategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class StoreSerializer(serializers.ModelSerializer):
+class StoreSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     status_display = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(read_only=True)
@@ -43,6 +45,9 @@ class StoreSerializer(serializers.ModelSerializer):
             'confidence',
         ]
         read_only_fields = ['id', 'last_updated_at', 'created_at']
+        # ?expand=category -> nested category object instead of its id
+        expandable_fields = {'category': StoreCategorySerializer}
+        field_sources = {'status_display': ('status',)}
 
     def get_status_display(self, obj):
         try:
@@ -73,3 +78,29 @@ class StoreSerializer(serializers.ModelSerializer):
             return StoreCategory.objects.get(pk=pk)
         except StoreCategory.DoesNotExist:
             raise serializers.ValidationError('Danh mục đã chọn không tồn tại.')
+
+
+# Compiled read path for GET /api/stores/ (same output as StoreSerializer)
+CompiledStoreSerializer = CompiledSerializer(
+    StoreSerializer,
+    computed={'status_display': (('status',), choice_label(Store.Status))},
+)
+
+
+class StoreInventorySerializer(serializers.ModelSerializer):
+    product_id = serializers.IntegerField(read_only=True)
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_sku = serializers.CharField(source='product.sku', read_only=True)
+
+    class Meta:
+        model = StoreInventory
+        fields = [
+            'product_id',
+            'product_name',
+            'product_sku',
+            'price',
+            'quantity',
+            'version',
+            'updated_at',
+        ]
+        read_only_fields = fields
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
-from typing import Mapping, Optional
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Mapping, Optional
 
-from django.db import models
-from django.db.models import Avg
+from django.db import models, transaction
+from django.db.models import Avg, Count, Q
 from django.db.models.query import QuerySet
 from django.utils import timezone
 
-from .models import Store, StoreCategory
+from core.bulk import bulk_update_rows, chunked_update
+from product.models import CatalogChange
+from product.services import record_catalog_changes
+from .membership import get_membership, get_store, invalidate_memberships
+from .models import Store, StoreCategory, StoreInventory
+from .pricebook import bump_price_version
 
 def filter_stores(params: Mapping[str, str], *, owner: Optional[object] = None) -> QuerySet[Store]:
     qs = Store.objects.select_related('category').all()
@@ -42,6 +48,20 @@ def filter_stores(params: Mapping[str, str], *, owner: Optional[object] = None)
 
     return qs
 
+def resolve_user_store(user, store_id: Optional[object] = None) -> Optional[Store]:
+    """Store the user works in.
+
+    An explicit `store_id` must be one of the user's own stores. Otherwise the
+    store linked on the user (`user.store`) wins, then the first owned store.
+    Resolved from the cached `store.membership`; the row is read once per request.
+    """
+    membership = get_membership(user)
+    if membership is None:
+        return None
+    if store_id:
+        return get_store(user, int(store_id)) if membership.owns(store_id) else None
+    return get_store(user, membership.default_store_id())
+
 def filter_store_categories(params: Mapping[str, str]) -> QuerySet[StoreCategory]:
     qs = StoreCategory.objects.all().order_by('name')
     search = params.get('search')
@@ -68,43 +88,186 @@ def restore_store(instance: Store) -> Store:
     instance.save(update_fields=['is_deleted', 'last_updated_at'])
     return instance
 
+BULK_STORE_ACTIONS = ('set_status', 'soft_delete', 'restore', 'set_category')
+
+def bulk_update_stores(
+    *, owner, action: str, value=None, ids: Optional[list] = None, filters: Optional[Mapping[str, str]] = None,
+) -> dict:
+    """Set-based status / soft-delete / restore / category change on `owner`'s stores.
+
+    Rows are selected by `ids` or `filters` (same params as `filter_stores`) and
+    updated with one `UPDATE` per chunk. Returns `{'matched', 'updated'}`.
+    Raises ValueError for an unknown action or invalid value.
+    """
+    if ids is not None:
+        qs = Store.objects.filter(owner=owner, id__in=ids)
+    else:
+        filters = dict(filters or {})
+        if action == 'restore':
+            filters['include_deleted'] = 'true'
+        qs = filter_stores(filters, owner=owner)
+
+    if action == 'set_status':
+        if value not in Store.Status.values:
+            raise ValueError(f'Invalid status: {value}')
+        target, values = qs.exclude(status=value), {'status': value}
+    elif action == 'soft_delete':
+        target, values = qs.filter(is_deleted=False), {'is_deleted': True}
+    elif action == 'restore':
+        target, values = qs.filter(is_deleted=True), {'is_deleted': False}
+    elif action == 'set_category':
+        if not StoreCategory.objects.filter(pk=value).exists():
+            raise ValueError(f'Category not found: {value}')
+        target, values = qs.exclude(category_id=value), {'category_id': value}
+    else:
+        raise ValueError(f'Unknown action: {action}')
+
+    matched = qs.count()
+    updated = chunked_update(target, values)
+    # update() sends no signals
+    invalidate_memberships([owner.pk])
+    return {'matched': matched, 'updated': updated}
+
+# --------------------------
+# Inventory (price / stock)
+# --------------------------
+
+INVENTORY_BATCH_SIZE = 1000
+_MAX_PRICE = Decimal('99999999.99')  # StoreInventory.price: max_digits=10, decimal_places=2
+_CENT = Decimal('0.01')
+
+def parse_inventory_entries(entries: Iterable[Mapping]) -> dict:
+    """`[{product_id, price?, quantity?, version?}]` -> `{product_id: (price, quantity, version)}`.
+
+    Missing/null price or quantity means "leave unchanged". When a product is
+    listed twice the last entry wins. Raises ValueError naming the bad entry.
+    """
+    parsed = {}
+    for i, entry in enumerate(entries):
+        try:
+            product_id = int(entry['product_id'])
+            price = entry.get('price')
+            if price is not None:
+                price = Decimal(str(price))
+                if not price.is_finite() or price < 0 or price > _MAX_PRICE:
+                    raise ValueError
+                price = price.quantize(_CENT)
+            quantity = entry.get('quantity')
+            if quantity is not None:
+                quantity = int(quantity)
+                if quantity < 0:
+                    raise ValueError
+            version = entry.get('version')
+            if version is not None:
+                version = int(version)
+        except (KeyError, TypeError, ValueError, AttributeError, InvalidOperation):
+            raise ValueError(f'items[{i}]: cần product_id, price >= 0, quantity >= 0 hợp lệ.')
+        parsed[product_id] = (price, quantity, version)
+    return parsed
+
+def bulk_update_inventory(store: Store, entries: Iterable[Mapping], *, batch_size: int = INVENTORY_BATCH_SIZE) -> dict:
+    """Apply price/stock changes to `store`'s inventory and return a diff summary.
+
+    Each batch of `batch_size` products is one transaction: rows are locked,
+    compared, and only the ones that actually change are written with a single
+    bulk UPDATE (`bulk_update_rows`). An entry carrying `version` that no longer matches the row is
+    skipped and reported under `conflicts` (optimistic concurrency). Products
+    that are not in the store's inventory are reported under `missing`.
+    """
+    parsed = parse_inventory_entries(entries)
+    summary = {
+        'received': len(parsed),
+        'updated': 0,
+        'unchanged': 0,
+        'price_increased': 0,
+        'price_decreased': 0,
+        'quantity_changed': 0,
+        'missing': [],
+        'conflicts': [],
+    }
+    product_ids = list(parsed)
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
+        now = timezone.now()
+        changed, changed_products, repriced = [], [], False
+        with transaction.atomic():
+            rows = (
+                StoreInventory.objects
+                .select_for_update()
+                .filter(store=store, product_id__in=chunk)
+                .values_list('id', 'product_id', 'price', 'quantity', 'version')
+            )
+            found = set()
+            for row_id, product_id, old_price, old_quantity, old_version in rows:
+                found.add(product_id)
+                price, quantity, version = parsed[product_id]
+                if version is not None and version != old_version:
+                    summary['conflicts'].append({'product_id': product_id, 'version': old_version})
+                    continue
+                if price is None or price == old_price:
+                    price = old_price
+                else:
+                    summary['price_increased' if price > old_price else 'price_decreased'] += 1
+                    repriced = True
+                if quantity is None or quantity == old_quantity:
+                    quantity = old_quantity
+                else:
+                    summary['quantity_changed'] += 1
+                if price == old_price and quantity == old_quantity:
+                    summary['unchanged'] += 1
+                    continue
+                # updated_at is auto_now, which a direct UPDATE doesn't apply
+                changed.append((row_id, price, quantity, old_version + 1, now))
+                changed_products.append(product_id)
+            if changed:
+                bulk_update_rows(StoreInventory, ['price', 'quantity', 'version', 'updated_at'], changed)
+                # Direct UPDATE bypasses post_save; keep POS delta sync in the loop
+                record_catalog_changes(
+                    changed_products, kind=CatalogChange.Kind.INVENTORY, store_id=store.id,
+                )
+            if repriced:
+                bump_price_version([store.id])
+        summary['updated'] += len(changed)
+        summary['missing'].extend(pid for pid in chunk if pid not in found)
+    return summary
+
 def compute_store_metrics(*, owner: Optional[object] = None) -> dict:
     qs = Store.objects.filter(is_deleted=False)
     if owner is not None:
         qs = qs.filter(owner=owner)
-    total = qs.count()
-    active = qs.filter(status=Store.Status.ACTIVE).count()
-    avg_acc = qs.aggregate(avg_acc=Avg('accuracy_rate'))['avg_acc'] or 0
+    agg = qs.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(status=Store.Status.ACTIVE)),
+        avg_acc=Avg('accuracy_rate'),
+    )
+    avg_acc = agg['avg_acc'] or 0
     return {
-        'total_stores': total,
-        'active_stores': active,
+        'total_stores': agg['total'],
+        'active_stores': agg['active'],
         'avg_accuracy_rate': round(float(avg_acc), 2),
         'review_count': 0, # Placeholder for now
     }
 
 
-def bulk_restart_stores(ids):
-    qs = Store.objects.filter(id__in=ids)
-    count = qs.count()
+# --------------------------
+# Per-store device actions (run by background jobs, see store/jobs.py)
+# --------------------------
+
+def restart_store(store_id: int) -> None:
     # Placeholder: update last_updated_at to now to simulate an action
-    qs.update(last_updated_at=timezone.now())
-    return count
+    Store.objects.filter(pk=store_id).update(last_updated_at=timezone.now())
 
 
-def bulk_send_alert(ids):
-    qs = Store.objects.filter(id__in=ids)
-    # Placeholder: increment a dummy field or just return count
-    return qs.count()
+def send_store_alert(store_id: int) -> None:
+    # Placeholder: nothing to deliver yet
+    return None
 
 
-def bulk_update_model(ids):
-    qs = Store.objects.filter(id__in=ids)
-    # Placeholder: flag stores for model update (no real field) — simply update last_updated_at
-    qs.update(last_updated_at=timezone.now())
-    return qs.count()
+def push_model_update(store_id: int) -> None:
+    # Placeholder: flag store for model update (no real field) — simply update last_updated_at
+    Store.objects.filter(pk=store_id).update(last_updated_at=timezone.now())
 
 
-def bulk_configure(ids):
-    qs = Store.objects.filter(id__in=ids)
+def apply_store_config(store_id: int) -> None:
     # Placeholder: pretend configuration applied
-    return qs.count()
+    return None
@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from product.models import Product
+from .membership import begin_request, end_request, invalidate_memberships
+from .models import Store, StoreInventory
+from .pricebook import bump_price_version
+
+# Product fields copied into price books (order item snapshots, scan lookup by name)
+_PRICE_BOOK_PRODUCT_FIELDS = {'name', 'sku'}
+
+
+@receiver(post_save, sender=StoreInventory)
+@receiver(post_delete, sender=StoreInventory)
+def invalidate_store_prices(sender, instance, **kwargs):
+    bump_price_version([instance.store_id])
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_prices(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not _PRICE_BOOK_PRODUCT_FIELDS & set(update_fields)):
+        return
+    bump_price_version(StoreInventory.objects.filter(product_id=instance.pk).values_list('store_id', flat=True))
+
+
+request_started.connect(begin_request, dispatch_uid='store_membership_begin')
+request_finished.connect(end_request, dispatch_uid='store_membership_end')
+
+# Fields that decide which of an owner's stores is "first" / active (store.membership)
+_MEMBERSHIP_STORE_FIELDS = {'owner', 'name', 'status', 'is_deleted'}
+
+
+@receiver(pre_save, sender=Store)
+def remember_store_owner(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and 'owner' not in update_fields):
+        return
+    # The previous owner loses the store when it changes hands
+    instance._previous_owner_id = Store.objects.filter(pk=instance.pk).values_list('owner_id', flat=True).first()
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_store_memberships(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not _MEMBERSHIP_STORE_FIELDS & set(update_fields):
+        return
+    invalidate_memberships([instance.owner_id, getattr(instance, '_previous_owner_id', None)], [instance.pk])
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_membership(sender, instance, **kwargs):
+    invalidate_memberships([instance.pk])
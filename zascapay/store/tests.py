@@ -0,0 +1,157 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from product.models import Product, ProductCategory
+from .models import Store, StoreCategory, StoreInventory
+from .pricebook import clear_price_books, get_price_book
+from .services import bulk_update_inventory
+
+
+class StoreInventoryApiTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='owner1', password='secret123')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.store = Store.objects.create(name='Shop 1', code='S1', owner=user,
+                                          category=StoreCategory.objects.create(name='Tạp hóa'))
+        category = ProductCategory.objects.create(name='Đồ Uống')
+        self.products = [Product.objects.create(name=f'P{i}', sku=f'SKU-{i}', category=category) for i in range(5)]
+        for p in self.products:
+            StoreInventory.objects.create(store=self.store, product=p, price=Decimal('10.00'), quantity=1)
+        self.url = f'/api/stores/{self.store.id}/inventory/'
+
+    def test_cursor_pagination(self):
+        first = self.client.get(self.url, {'page_size': 3}).json()
+        self.assertEqual([r['product_id'] for r in first['results']], [p.id for p in self.products[:3]])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([r['product_sku'] for r in second['results']], ['SKU-3', 'SKU-4'])
+        self.assertIsNone(second['next'])
+
+    def test_bulk_patch_summary(self):
+        p = self.products
+        items = [
+            {'product_id': p[0].id, 'price': '12.5'},
+            {'product_id': p[1].id, 'price': 8, 'quantity': 4},
+            {'product_id': p[2].id, 'price': '10.00', 'quantity': 1},
+            {'product_id': p[3].id, 'quantity': 9, 'version': 7},
+            {'product_id': 999999, 'price': 1},
+        ]
+        summary = self.client.patch(self.url, {'items': items}, format='json').json()
+        self.assertEqual(summary, {
+            'received': 5, 'updated': 2, 'unchanged': 1, 'price_increased': 1, 'price_decreased': 1,
+            'quantity_changed': 1, 'missing': [999999], 'conflicts': [{'product_id': p[3].id, 'version': 1}],
+        })
+        row = StoreInventory.objects.get(store=self.store, product=p[1])
+        self.assertEqual((row.price, row.quantity, row.version), (Decimal('8.00'), 4, 2))
+
+    def test_invalid_entry_rejected(self):
+        resp = self.client.patch(self.url, [{'product_id': self.products[0].id, 'price': -1}], format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(StoreInventory.objects.get(store=self.store, product=self.products[0]).price, Decimal('10.00'))
+
+
+class PriceBookTests(TestCase):
+    def setUp(self):
+        clear_price_books()
+        user = get_user_model().objects.create_user(username='owner1', password='secret123')
+        self.store = Store.objects.create(name='Shop 1', code='S1', owner=user,
+                                          category=StoreCategory.objects.create(name='Tạp hóa'))
+        self.product = Product.objects.create(name='Coca Cola', sku='CC-1',
+                                              category=ProductCategory.objects.create(name='Đồ Uống'))
+        self.inventory = StoreInventory.objects.create(store=self.store, product=self.product,
+                                                       price=Decimal('10.50'), quantity=3)
+
+    def _book(self):
+        # Callers pass the store row loaded for the request
+        return get_price_book(Store.objects.get(pk=self.store.pk))
+
+    def test_cached_until_price_changes(self):
+        book = self._book()
+        self.assertEqual(book.get(self.product.id).price, Decimal('10.50'))
+        self.assertEqual(book.find_by_name('coca cola').sku, 'CC-1')
+        store = Store.objects.get(pk=self.store.pk)
+        with self.assertNumQueries(0):
+            self.assertIs(get_price_book(store), book)
+
+        self.inventory.price = Decimal('11.00')
+        self.inventory.save()
+        self.assertEqual(self._book().get(self.product.id).price, Decimal('11.00'))
+
+    def test_stock_only_patch_keeps_book(self):
+        book = self._book()
+        bulk_update_inventory(self.store, [{'product_id': self.product.id, 'quantity': 9}])
+        self.assertIs(self._book(), book)
+        bulk_update_inventory(self.store, [{'product_id': self.product.id, 'price': 12}])
+        self.assertEqual(self._book().get(self.product.id).price, Decimal('12.00'))
+
+    def test_product_rename_invalidates(self):
+        self._book()
+        self.product.name = 'Coca Zero'
+        self.product.save()
+        self.assertIsNotNone(self._book().find_by_name('COCA ZERO'))
+
+
+class MembershipTests(TestCase):
+    def setUp(self):
+        from .membership import clear_memberships
+
+        clear_memberships()
+        User = get_user_model()
+        self.category = StoreCategory.objects.create(name='Khác')
+        self.owner = User.objects.create_user(username='owner', password='secret123', email='owner@example.com')
+        self.b = Store.objects.create(name='B', code='b', owner=self.owner, category=self.category)
+        self.a = Store.objects.create(name='A', code='a', owner=self.owner, category=self.category,
+                                      status=Store.Status.INACTIVE)
+        self.staff = User.objects.create_user(username='staff', password='secret123', email='staff@example.com', store=self.b)
+
+    def test_cached_across_requests_and_invalidated_by_writes(self):
+        from .membership import get_membership, owned_store
+        from .services import bulk_update_stores, resolve_user_store
+
+        with self.assertNumQueries(1):
+            membership = get_membership(self.owner)
+        self.assertEqual(membership.owned_ids, (self.a.pk, self.b.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(get_membership(self.owner).owns(str(self.b.pk)))
+        self.assertEqual(owned_store(self.owner).pk, self.a.pk)
+        self.assertEqual(owned_store(self.owner, active_only=True).pk, self.b.pk)
+        self.assertEqual(resolve_user_store(self.staff).pk, self.b.pk)
+        self.assertTrue(get_membership(self.staff).can_access(self.b.pk))
+        self.assertIsNone(resolve_user_store(self.staff, self.b.pk))
+
+        # Set-based updates send no signals; the service invalidates explicitly
+        bulk_update_stores(owner=self.owner, action='set_status', value=Store.Status.ACTIVE, ids=[self.a.pk])
+        self.assertEqual(owned_store(self.owner, active_only=True).pk, self.a.pk)
+
+        # Deactivated in another worker: the cached flags are stale, the reloaded row is not
+        Store.objects.filter(pk=self.a.pk).update(status=Store.Status.INACTIVE)
+        self.assertIsNone(owned_store(self.owner, active_only=True))
+
+        other = get_user_model().objects.create_user(username='other', password='secret123', email='other@example.com')
+        self.a.owner = other
+        self.a.save()
+        self.assertEqual(get_membership(self.owner).owned_ids, (self.b.pk,))
+        self.assertEqual(get_membership(other).owned_ids, (self.a.pk,))
+
+    def test_payment_authorization_uses_membership(self):
+        from payment.models import Order
+
+        order = Order.objects.create(user=self.staff, store=self.b, total_amount=Decimal('10'))
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.post('/api/payments/', {'order_id': order.pk, 'method': 'cash'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['store_id'], self.a.pk)
+
+        stranger = get_user_model().objects.create_user(username='x', password='secret123', email='x@example.com')
+        client.force_authenticate(stranger)
+        response = client.post('/api/payments/', {'order_id': order.pk, 'method': 'cash'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        # Owning another shop does not authorize payments on this shop's orders
+        Store.objects.create(name='X', code='x', owner=stranger, category=self.category)
+        response = client.post('/api/payments/', {'order_id': order.pk, 'method': 'cash'}, format='json')
+        self.assertEqual(response.status_code, 403)
@@ -16,9 +16,14 @@ urlpatterns = [
         'put': 'update',
         'delete': 'destroy',
     }), name='store-detail'),
+    path('api/stores/<int:pk>/inventory/', StoreViewSet.as_view({
+        'get': 'inventory',
+        'patch': 'inventory',
+    }), name='store-inventory'),
     path('api/stores/<int:pk>/restore/', StoreViewSet.as_view({'post': 'restore'}), name='store-restore'),
 
     # Bulk action endpoints
+    path('api/stores/bulk/', StoreViewSet.as_view({'post': 'bulk'}), name='store-bulk'),
     path('api/stores/bulk_restart/', StoreViewSet.as_view({'post': 'bulk_restart'}), name='store-bulk-restart'),
     path('api/stores/bulk_alert/', StoreViewSet.as_view({'post': 'bulk_alert'}), name='store-bulk-alert'),
     path('api/stores/bulk_update_model/', StoreViewSet.as_view({'post': 'bulk_update_model'}), name='store-bulk-update-model'),
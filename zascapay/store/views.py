@@ -1,12 +1,13 @@
 from django.db.models.deletion import ProtectedError
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.http import HttpResponse
+from django.urls import reverse
 from django.views.generic import TemplateView
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.permissions import IsAuthenticated
@@ -14,7 +15,15 @@ from typing import cast
 import logging
 
 from .models import StoreCategory, Store
-from .serializers import StoreSerializer, StoreCategorySerializer
+from core.bulk import parse_bulk_request
+from core.views import CompiledListMixin, ConditionalGetMixin
+from jobs.services import enqueue
+from .serializers import (
+    CompiledStoreSerializer,
+    StoreSerializer,
+    StoreCategorySerializer,
+    StoreInventorySerializer,
+)
 from .services import (
     compute_store_metrics,
     filter_stores,
@@ -23,10 +32,8 @@ from .services import (
     update_store,
     soft_delete_store,
     restore_store,
-    bulk_restart_stores,
-    bulk_send_alert,
-    bulk_update_model,
-    bulk_configure,
+    bulk_update_stores,
+    bulk_update_inventory,
 )
 
 logger = logging.getLogger(__name__)
@@ -41,15 +48,29 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class StoreViewSet(viewsets.ModelViewSet):
+class InventoryCursorPagination(CursorPagination):
+    # Stable under concurrent repricing, no COUNT(*) over large inventories
+    page_size = 200
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'product_id'
+
+class StoreViewSet(ConditionalGetMixin, CompiledListMixin, viewsets.ModelViewSet):
     serializer_class = StoreSerializer
+    compiled_serializer = CompiledStoreSerializer
+    # category_name is rendered too, so a renamed category must change the ETag
+    related_modified_fields = ('category__updated_at',)
     pagination_class = StandardResultsSetPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         request = cast(Request, cast(object, self.request))
         # Only show stores of the current authenticated user
-        return filter_stores(request.query_params, owner=request.user)
+        qs = filter_stores(request.query_params, owner=request.user)
+        if self.action in ('list', 'retrieve'):
+            # Only load the columns/relations needed by ?fields= / ?expand=
+            qs = self.get_serializer_class().optimize_queryset(qs, request)
+        return qs
 
     def perform_create(self, serializer):
         data = dict(serializer.validated_data)
@@ -78,11 +99,39 @@ class StoreViewSet(viewsets.ModelViewSet):
         store = restore_store(self.get_object())
         return Response(self.get_serializer(store).data)
 
+    @action(detail=True, methods=['get', 'patch'])
+    def inventory(self, request, pk=None):
+        """GET: inventory của store (cursor pagination). PATCH: cập nhật giá/tồn kho hàng loạt.
+
+        PATCH body: `{"items": [{"product_id", "price"?, "quantity"?, "version"?}, ...]}`
+        (hoặc list trực tiếp). Trả về tóm tắt thay đổi, xem `bulk_update_inventory`.
+        """
+        store = self.get_object()
+        if request.method == 'PATCH':
+            items = request.data.get('items') if isinstance(request.data, dict) else request.data
+            if not isinstance(items, list):
+                return Response({'detail': 'items must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                summary = bulk_update_inventory(store, items)
+            except ValueError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(summary)
+
+        # `store` stays loaded: the related manager sets it on every row it returns
+        qs = store.inventory.select_related('product').only(
+            'store', 'product_id', 'price', 'quantity', 'version', 'updated_at', 'product__name', 'product__sku',
+        )
+        paginator = InventoryCursorPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(StoreInventorySerializer(page, many=True).data)
+
     @action(detail=False, methods=['get'])
     def metrics(self, request):
-        # Metrics only for the current user's stores
-        data = compute_store_metrics(owner=request.user)
-        return Response(data)
+        # Metrics only for the current user's stores; recomputed only when one of them changed
+        state = self.collection_state(Store.objects.filter(owner=request.user))
+        return self.conditional_response(
+            request, state, lambda request: Response(compute_store_metrics(owner=request.user))
+        )
 
     @action(detail=False, methods=['get'])
     def export(self, request):
@@ -116,62 +165,51 @@ class StoreViewSet(viewsets.ModelViewSet):
         resp['Content-Disposition'] = 'attachment; filename="stores_export.csv"'
         return resp
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """`{"action": "set_status"|"soft_delete"|"restore"|"set_category", "value"?, "ids"|"filter"}`."""
+        try:
+            operation, value, ids, filters = parse_bulk_request(request.data)
+            result = bulk_update_stores(owner=request.user, action=operation, value=value, ids=ids, filters=filters)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
     def _filter_ids_owned_by_user(self, ids):
         # Limit bulk operations to stores owned by the current user
         return list(Store.objects.filter(owner=self.request.user, id__in=ids).values_list('id', flat=True))
 
-    @action(detail=False, methods=['post'])
-    def bulk_restart(self, request):
+    def _enqueue_bulk(self, request, kind):
         ids = request.data.get('ids') or []
         if not isinstance(ids, (list, tuple)):
             return Response({'detail': 'ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
         owned_ids = self._filter_ids_owned_by_user(ids)
-        count = 0
-        try:
-            count = bulk_restart_stores(owned_ids)
-        except Exception as e:
-            logger.exception('bulk_restart failed')
-            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response({'count': count})
+        # Device actions can take minutes across many stores; run them in a worker
+        job = enqueue(kind, {'store_ids': owned_ids}, user=request.user, total=len(owned_ids))
+        return Response(
+            {'job_id': job.id, 'count': len(owned_ids), 'status_url': reverse('job-detail', args=[job.id])},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @action(detail=False, methods=['post'])
+    def bulk_restart(self, request):
+        return self._enqueue_bulk(request, 'store.bulk_restart')
 
     @action(detail=False, methods=['post'])
     def bulk_alert(self, request):
-        ids = request.data.get('ids') or []
-        if not isinstance(ids, (list, tuple)):
-            return Response({'detail': 'ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            count = bulk_send_alert(self._filter_ids_owned_by_user(ids))
-        except Exception as e:
-            logger.exception('bulk_alert failed')
-            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response({'count': count})
+        return self._enqueue_bulk(request, 'store.bulk_alert')
 
     @action(detail=False, methods=['post'])
     def bulk_update_model(self, request):
-        ids = request.data.get('ids') or []
-        if not isinstance(ids, (list, tuple)):
-            return Response({'detail': 'ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            count = bulk_update_model(self._filter_ids_owned_by_user(ids))
-        except Exception as e:
-            logger.exception('bulk_update_model failed')
-            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response({'count': count})
+        return self._enqueue_bulk(request, 'store.bulk_update_model')
 
     @action(detail=False, methods=['post'])
     def bulk_configure(self, request):
-        ids = request.data.get('ids') or []
-        if not isinstance(ids, (list, tuple)):
-            return Response({'detail': 'ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            count = bulk_configure(self._filter_ids_owned_by_user(ids))
-        except Exception as e:
-            logger.exception('bulk_configure failed')
-            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response({'count': count})
+        return self._enqueue_bulk(request, 'store.bulk_configure')
 
-class StoreCategoryViewSet(viewsets.ModelViewSet):
+class StoreCategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = StoreCategorySerializer
+    last_modified_field = 'updated_at'
     queryset = StoreCategory.objects.all().order_by('name')
     pagination_class = StandardResultsSetPagination
     permission_classes = [IsAuthenticated]
@@ -0,0 +1,170 @@
+"""Token authentication without a database round-trip per request.
+
+DRF's `TokenAuthentication` runs `Token.objects.select_related('user')` on
+every API call. Terminals send the same token many times a second, so
+`CachedTokenAuthentication` keeps a process-local LRU of token key -> the
+token's user row (id, `is_active`, `is_approved`, `is_system_admin` and the
+other columns) for `TOKEN_AUTH_CACHE_TTL` seconds, and rebuilds the `User`
+from it on a hit.
+
+- Deleting a token, or saving/deleting its user, drops the entries in the
+  worker that made the change (`user.signals`). `QuerySet.update()` sends no
+  signals: callers that bulk-update users call `invalidate_user_tokens`.
+  The TTL bounds how long other workers may accept a revoked token.
+- Approval is checked here as well: `ApprovalRequiredMiddleware` only sees
+  session users, the token user is resolved later by DRF.
+- `token_cache_stats()` reports hits/misses of this process
+  (`GET /api/auth/token-cache/` for system admins).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+NOT_APPROVED_MESSAGE = 'Tài khoản của bạn chưa được admin duyệt.'
+
+
+class CachedToken(NamedTuple):
+    expires: float
+    user_id: int
+    is_active: bool
+    is_approved: bool
+    is_system_admin: bool
+    created: object
+    # attname -> value of every concrete field of the user row
+    user_values: Tuple[Tuple[str, object], ...]
+
+
+_tokens: "OrderedDict[str, CachedToken]" = OrderedDict()
+_by_user: Dict[int, Set[str]] = {}
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+
+def _ttl() -> float:
+    return float(getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60))
+
+
+def _max_entries() -> int:
+    return int(getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 10000))
+
+
+def _forget(key: str) -> Optional[CachedToken]:
+    """Remove one entry; caller holds `_lock`."""
+    entry = _tokens.pop(key, None)
+    if entry is not None:
+        keys = _by_user.get(entry.user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _by_user[entry.user_id]
+    return entry
+
+
+def _lookup(key: str) -> Optional[CachedToken]:
+    now = time.monotonic()
+    with _lock:
+        entry = _tokens.get(key)
+        if entry is None:
+            _stats['misses'] += 1
+            return None
+        if entry.expires <= now:
+            _forget(key)
+            _stats['expired'] += 1
+            _stats['misses'] += 1
+            return None
+        _tokens.move_to_end(key)
+        _stats['hits'] += 1
+        return entry
+
+
+def _store(token: Token) -> None:
+    user = token.user
+    entry = CachedToken(
+        expires=time.monotonic() + _ttl(),
+        user_id=user.pk,
+        is_active=user.is_active,
+        is_approved=getattr(user, 'is_approved', False),
+        is_system_admin=getattr(user, 'is_system_admin', False),
+        created=token.created,
+        user_values=tuple((f.attname, getattr(user, f.attname)) for f in user._meta.concrete_fields),
+    )
+    with _lock:
+        _forget(token.key)
+        _tokens[token.key] = entry
+        _by_user.setdefault(entry.user_id, set()).add(token.key)
+        while len(_tokens) > _max_entries():
+            _forget(next(iter(_tokens)))
+            _stats['evictions'] += 1
+
+
+def _rebuild(key: str, entry: CachedToken) -> Tuple[object, Token]:
+    User = get_user_model()
+    values = dict(entry.user_values)
+    user = User.from_db(User.objects.db, list(values), list(values.values()))
+    token = Token.from_db(Token.objects.db, ['key', 'user_id', 'created'], [key, entry.user_id, entry.created])
+    return user, token
+
+
+def invalidate_tokens(keys: Iterable[str]) -> None:
+    with _lock:
+        for key in keys:
+            if _forget(key) is not None:
+                _stats['invalidations'] += 1
+
+
+def invalidate_user_tokens(user_ids: Iterable[Optional[int]]) -> None:
+    """Drop cached tokens of these users (call after `User.objects.filter(...).update(...)`)."""
+    with _lock:
+        for user_id in user_ids:
+            for key in list(_by_user.get(user_id, ())):
+                _forget(key)
+                _stats['invalidations'] += 1
+
+
+def clear_token_cache() -> None:
+    with _lock:
+        _tokens.clear()
+        _by_user.clear()
+        for name in _stats:
+            _stats[name] = 0
+
+
+def token_cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats, size=len(_tokens), max_size=_max_entries(), ttl=_ttl())
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """`TokenAuthentication` backed by the process-local token cache."""
+
+    def authenticate_credentials(self, key):
+        entry = _lookup(key)
+        if entry is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+            _store(token)
+            user = token.user
+        else:
+            if not entry.is_active:
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+            user, token = _rebuild(key, entry)
+
+        if not getattr(user, 'is_system_admin', False) and not getattr(user, 'is_approved', False):
+            raise exceptions.PermissionDenied(NOT_APPROVED_MESSAGE)
+        return user, token
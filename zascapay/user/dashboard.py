@@ -0,0 +1,159 @@
+"""Header counts of the admin dashboard without a `COUNT(*)` per page load.
+
+`refresh_dashboard_counters` computes the counts and stores them in
+`dashboard_counters`:
+
+- users / pending users: exact counts (the pending count uses
+  `idx_user_approved_id`);
+- orders / payments: on MySQL, InnoDB's row estimate from
+  `information_schema.TABLES` once it is above `DASHBOARD_ESTIMATE_MIN_ROWS`
+  (the estimate can be off by tens of percent, which only matters on small
+  tables); an exact count otherwise.
+
+It runs from cron (`manage.py refresh_dashboard_counters`) and, when the
+stored rows are older than `DASHBOARD_COUNTERS_MAX_AGE`, in a background
+thread started by the page load that noticed it. The page itself reads the
+table at most once per `DASHBOARD_COUNTERS_CACHE_SECONDS` per worker, so it
+renders in constant time whatever the size of the tables.
+
+The counters are not maintained by signals: onboarding (`bulk_create`),
+bulk approval (`update()`) and archiving (`INSERT ... SELECT`) bypass them.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import DashboardCounter
+
+logger = logging.getLogger(__name__)
+
+
+class Count(NamedTuple):
+    value: int
+    exact: bool
+
+
+def table_estimate(model) -> Optional[int]:
+    """InnoDB's estimated row count of the model's table (None when not on MySQL)."""
+    if connection.vendor != 'mysql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+def _table_count(model) -> Count:
+    estimate = table_estimate(model)
+    if estimate is not None and estimate >= int(getattr(settings, 'DASHBOARD_ESTIMATE_MIN_ROWS', 100000)):
+        return Count(estimate, False)
+    return Count(model.objects.count(), True)
+
+
+def _users() -> Count:
+    return Count(get_user_model().objects.filter(is_staff=False, is_superuser=False).count(), True)
+
+
+def _pending_users() -> Count:
+    return Count(get_user_model().objects.filter(is_approved=False, is_staff=False, is_superuser=False).count(), True)
+
+
+def _orders() -> Count:
+    from payment.models import Order
+    return _table_count(Order)
+
+
+def _payments() -> Count:
+    from payment.models import Payment
+    return _table_count(Payment)
+
+
+COUNTERS: Dict[str, Callable[[], Count]] = {
+    'users': _users,
+    'pending_users': _pending_users,
+    'orders': _orders,
+    'payments': _payments,
+}
+
+_cache: Dict[str, object] = {'counts': None, 'expires': 0.0}
+_lock = threading.Lock()
+_refreshing = False
+
+
+def refresh_dashboard_counters() -> Dict[str, Count]:
+    counts = {name: compute() for name, compute in COUNTERS.items()}
+    now = timezone.now()
+    with transaction.atomic():
+        for name, count in counts.items():
+            DashboardCounter.objects.update_or_create(
+                name=name, defaults={'value': count.value, 'exact': count.exact, 'refreshed_at': now},
+            )
+    clear_dashboard_cache()
+    return counts
+
+
+def refresh_in_background() -> bool:
+    """Start one refresh thread per process; False if one is already running."""
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return False
+        _refreshing = True
+
+    def run():
+        global _refreshing
+        try:
+            refresh_dashboard_counters()
+        except Exception:
+            logger.exception('Dashboard counter refresh failed')
+        finally:
+            # The thread has its own DB connection
+            connection.close()
+            with _lock:
+                _refreshing = False
+
+    threading.Thread(target=run, name='dashboard-counters', daemon=True).start()
+    return True
+
+
+def _load() -> Tuple[Dict[str, Count], bool]:
+    """Stored counts and whether they are older than DASHBOARD_COUNTERS_MAX_AGE."""
+    rows = list(DashboardCounter.objects.filter(name__in=list(COUNTERS)))
+    if len(rows) < len(COUNTERS):
+        # First load ever: nothing to show yet
+        return refresh_dashboard_counters(), False
+    max_age = timedelta(seconds=float(getattr(settings, 'DASHBOARD_COUNTERS_MAX_AGE', 300)))
+    stale = min(row.refreshed_at for row in rows) < timezone.now() - max_age
+    return {row.name: Count(row.value, row.exact) for row in rows}, stale
+
+
+def get_dashboard_counts() -> Dict[str, Count]:
+    now = time.monotonic()
+    with _lock:
+        if _cache['counts'] is not None and _cache['expires'] > now:
+            return _cache['counts']
+    counts, stale = _load()
+    if stale and getattr(settings, 'DASHBOARD_COUNTERS_BACKGROUND', True):
+        refresh_in_background()
+    with _lock:
+        _cache['counts'] = counts
+        _cache['expires'] = now + float(getattr(settings, 'DASHBOARD_COUNTERS_CACHE_SECONDS', 30))
+    return counts
+
+
+def clear_dashboard_cache() -> None:
+    with _lock:
+        _cache['counts'] = None
+        _cache['expires'] = 0.0
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.onboarding import ONBOARDING_COLUMNS, onboard, read_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Tạo hàng loạt chủ cửa hàng và cửa hàng từ file CSV (mỗi dòng một cửa hàng, các dòng cùng email là "
+        f"một chủ). Cột: {', '.join(ONBOARDING_COLUMNS)}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File CSV (UTF-8)')
+        parser.add_argument('--approve', action='store_true', help='Duyệt luôn các tài khoản được tạo')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ kiểm tra, không tạo gì')
+        parser.add_argument('--workers', type=int, help='Số thread băm mật khẩu (mặc định ONBOARDING_HASH_WORKERS)')
+        parser.add_argument('--report', help='Ghi kết quả từng dòng (JSON) ra file này')
+
+    def handle(self, *args, **opts):
+        try:
+            with open(opts['path'], encoding='utf-8-sig', newline='') as handle:
+                rows = read_csv(handle)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        result = onboard(rows, approve=opts['approve'], dry_run=opts['dry_run'], workers=opts['workers'])
+        for entry in result.results:
+            if entry['status'] == 'error':
+                self.stderr.write(f"line {entry['line']} ({entry['email']}): {' '.join(entry['errors'])}")
+        if opts['report']:
+            with open(opts['report'], 'w', encoding='utf-8') as handle:
+                json.dump(result.as_dict(), handle, ensure_ascii=False, indent=2)
+        if opts['dry_run']:
+            summary = f'Dry run: {len(result.results) - result.errors} valid line(s)'
+        else:
+            summary = f'Created {result.users} user(s), {result.stores} store(s)'
+        self.stdout.write(self.style.SUCCESS(f'{summary}; {result.errors} line(s) with errors'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.dashboard import refresh_dashboard_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Tính lại các số liệu đầu trang admin dashboard (user, chờ duyệt, đơn hàng, thanh toán) vào bảng "
+        "dashboard_counters. Chạy bằng cron vài phút một lần, hoặc --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Chạy liên tục')
+        parser.add_argument('--interval', type=float, default=60.0, help='Số giây giữa hai lần (với --loop)')
+
+    def handle(self, *args, **opts):
+        try:
+            while True:
+                counts = refresh_dashboard_counters()
+                summary = ', '.join(f"{name}={'' if c.exact else '~'}{c.value}" for name, c in counts.items())
+                self.stdout.write(self.style.SUCCESS(f'Dashboard counters: {summary}'))
+                if not opts['loop']:
+                    break
+                time.sleep(opts['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -31,5 +31,29 @@ class User(AbstractUser):
         related_name='staff'
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Admin user list: prefix search on phone (username/email are unique, hence indexed)
+            models.Index(fields=['phone'], name='idx_user_phone'),
+            # Admin user list filters, read in id order
+            models.Index(fields=['is_approved', 'id'], name='idx_user_approved_id'),
+            models.Index(fields=['account_type', 'id'], name='idx_user_type_id'),
+        ]
+
     def __str__(self) -> str:
         return self.username
+
+
+class DashboardCounter(models.Model):
+    """Header counts of the admin dashboard, refreshed by `user.dashboard`."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    # False when the value is InnoDB's row estimate (information_schema.TABLES)
+    exact = models.BooleanField(default=True)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'dashboard_counters'
+
+    def __str__(self) -> str:
+        return f'{self.name}={self.value}'
@@ -0,0 +1,223 @@
+"""Create many owners and their stores from one CSV.
+
+One line per store; lines that share an email belong to one owner (an
+enterprise with many stores), whose profile is taken from its first line::
+
+    email,first_name,last_name,phone,account_type,password,store_name,address
+
+Compared with one `UserService.register` per line, `onboard` needs a fixed
+number of queries per batch: one for taken emails, one prefix query per
+distinct username/store-code base, one `get_or_create` of the default store
+category and the `bulk_create`s. Passwords are hashed by a thread pool
+(`ONBOARDING_HASH_WORKERS`); PBKDF2 runs in OpenSSL without the GIL, so this
+scales with cores.
+
+An owner with an invalid line is skipped entirely (all of its lines are
+reported as errors); the other owners are still created. Users are created
+unapproved unless `approve=True`. A blank password leaves the account with an
+unusable password (to be set with a password reset).
+"""
+from __future__ import annotations
+
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .service import DEFAULT_STORE_CATEGORY, UserService
+
+User = get_user_model()
+
+ONBOARDING_COLUMNS = ('email', 'first_name', 'last_name', 'phone', 'account_type', 'password', 'store_name', 'address')
+ONBOARDING_MAX_ROWS = 5000
+ACCOUNT_TYPES = (User.ACCOUNT_STORE, User.ACCOUNT_ENTERPRISE, User.ACCOUNT_INDIVIDUAL)
+# Another registration may take a generated username/code or an email between validation and insert
+_INSERT_ATTEMPTS = 3
+
+
+@dataclass
+class _Owner:
+    email: str
+    first_name: str
+    last_name: str
+    phone: str
+    account_type: str
+    password: str
+    lines: List[int] = field(default_factory=list)
+    # (line, store name, address)
+    stores: List[tuple] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class OnboardingResult:
+    users: int = 0
+    stores: int = 0
+    errors: int = 0
+    # One entry per CSV line, in input order
+    results: List[dict] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {'users': self.users, 'stores': self.stores, 'errors': self.errors, 'results': self.results}
+
+
+def read_csv(source) -> List[Dict[str, str]]:
+    """Rows of an onboarding CSV (text, bytes or a file object); raises ValueError."""
+    if isinstance(source, bytes):
+        source = source.decode('utf-8-sig')
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    reader = csv.DictReader(source)
+    columns = {(name or '').strip().lower() for name in reader.fieldnames or ()}
+    missing = {'email', 'first_name', 'last_name'} - columns
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    rows = []
+    for row in reader:
+        rows.append({(key or '').strip().lower(): (value or '').strip() for key, value in row.items() if key})
+        if len(rows) > ONBOARDING_MAX_ROWS:
+            raise ValueError(f'At most {ONBOARDING_MAX_ROWS} rows per file')
+    return rows
+
+
+def _group(rows: Iterable[Mapping[str, str]]) -> List[_Owner]:
+    owners: Dict[str, _Owner] = {}
+    for line, row in enumerate(rows, start=2):  # line 1 is the header
+        email = row.get('email', '')
+        owner = owners.get(email.lower())
+        if owner is None:
+            owner = owners[email.lower()] = _Owner(
+                email=email,
+                first_name=row.get('first_name', ''),
+                last_name=row.get('last_name', ''),
+                phone=row.get('phone', ''),
+                account_type=row.get('account_type') or User.ACCOUNT_STORE,
+                password=row.get('password', ''),
+            )
+        owner.lines.append(line)
+        if row.get('store_name'):
+            owner.stores.append((line, row['store_name'], row.get('address', '')))
+        elif owner.account_type == User.ACCOUNT_STORE:
+            owner.errors.append(f'Dòng {line}: tên cửa hàng là bắt buộc.')
+    return list(owners.values())
+
+
+def _validate(owners: List[_Owner]) -> None:
+    # A plain IN on the column keeps the unique email index usable (no LOWER(email) scan);
+    # the lowercased spelling is looked up too, MySQL's collation matches the other cases
+    emails = {spelling for owner in owners if owner.email for spelling in (owner.email, owner.email.lower())}
+    taken = {
+        email.lower() for email in User.objects.filter(email__in=emails).values_list('email', flat=True)
+    } if emails else set()
+    for owner in owners:
+        try:
+            validate_email(owner.email)
+        except ValidationError:
+            owner.errors.append('Email không hợp lệ.')
+        if owner.email.lower() in taken:
+            owner.errors.append('Email đã được sử dụng.')
+        if not owner.first_name or not owner.last_name:
+            owner.errors.append('Họ tên là bắt buộc.')
+        if owner.account_type not in ACCOUNT_TYPES:
+            owner.errors.append('Loại tài khoản không hợp lệ.')
+        if owner.password and len(owner.password) < 8:
+            owner.errors.append('Mật khẩu phải có ít nhất 8 ký tự.')
+
+
+def hash_passwords(passwords: List[str], workers: Optional[int] = None) -> List[str]:
+    """`make_password` for each password (unusable for blanks), in a thread pool."""
+    workers = workers or int(getattr(settings, 'ONBOARDING_HASH_WORKERS', 4))
+    plain = [password or None for password in passwords]
+    if workers <= 1 or len(plain) <= 1:
+        return [make_password(password) for password in plain]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='onboard-hash') as pool:
+        return list(pool.map(make_password, plain))
+
+
+def _insert(owners: List[_Owner], hashes: List[str], approve: bool) -> Dict[str, tuple]:
+    """Create users and stores; returns email -> (username, [store codes])."""
+    from store.models import Store, StoreCategory
+
+    usernames = UserService.allocate_usernames([owner.email for owner in owners])
+    store_names = [name for owner in owners for _, name, _ in owner.stores]
+    codes = iter(UserService.allocate_store_codes(store_names))
+
+    User.objects.bulk_create([
+        User(
+            username=username, email=owner.email, password=password,
+            first_name=owner.first_name, last_name=owner.last_name, phone=owner.phone,
+            account_type=owner.account_type, is_staff=False, is_superuser=False, is_approved=approve,
+        )
+        for owner, username, password in zip(owners, usernames, hashes)
+    ])
+    # Primary keys are not returned by bulk_create on MySQL
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    category, _ = StoreCategory.objects.get_or_create(name=DEFAULT_STORE_CATEGORY)
+    stores, created = [], {}
+    for owner, username in zip(owners, usernames):
+        owner_codes = []
+        for _, name, address in owner.stores:
+            code = next(codes)
+            owner_codes.append(code)
+            stores.append(Store(
+                name=name, address=address, code=code, owner_id=user_ids[username],
+                category=category, status=Store.Status.ACTIVE,
+            ))
+        created[owner.email] = (username, owner_codes)
+    Store.objects.bulk_create(stores)
+    return created
+
+
+def onboard(rows: Iterable[Mapping[str, str]], *, approve: bool = False, dry_run: bool = False,
+            workers: Optional[int] = None) -> OnboardingResult:
+    """Validate the rows and create every valid owner with its stores (nothing with `dry_run`)."""
+    owners = _group(rows)
+    _validate(owners)
+    valid = [owner for owner in owners if not owner.errors]
+
+    created: Dict[str, tuple] = {}
+    if valid and not dry_run:
+        hashes = hash_passwords([owner.password for owner in valid], workers)
+        for attempt in range(_INSERT_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    created = _insert(valid, hashes, approve)
+                break
+            except IntegrityError:
+                if attempt == _INSERT_ATTEMPTS - 1:
+                    raise
+                # An email registered meanwhile becomes a line error; usernames/codes are re-allocated
+                _validate(valid)
+                retry = [(owner, hashed) for owner, hashed in zip(valid, hashes) if not owner.errors]
+                valid, hashes = [owner for owner, _ in retry], [hashed for _, hashed in retry]
+                if not valid:
+                    break
+
+    result = OnboardingResult()
+    by_line = {}
+    for owner in owners:
+        username, codes = created.get(owner.email, (None, []))
+        store_codes = dict(zip([line for line, _, _ in owner.stores], codes))
+        for line in owner.lines:
+            entry = {'line': line, 'email': owner.email}
+            if owner.errors:
+                entry.update(status='error', errors=owner.errors)
+                result.errors += 1
+            elif dry_run:
+                entry['status'] = 'valid'
+            else:
+                entry.update(status='created', username=username, store_code=store_codes.get(line))
+            by_line[line] = entry
+    result.results = [by_line[line] for line in sorted(by_line)]
+    result.users = len(created)
+    result.stores = sum(len(codes) for _, codes in created.values())
+    return result
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import IntegrityError, transaction
@@ -7,6 +7,11 @@ import re
 
 User = get_user_model()
 
+DEFAULT_STORE_CATEGORY = 'Khác'
+# Room left for the numeric suffix of generated usernames/store codes
+_SUFFIX_ROOM = 6
+EXPORT_CHUNK_SIZE = 2000
+
 
 class UserService:
     """Service layer for managing non-admin users (no staff/superuser)."""
@@ -18,8 +23,40 @@ class UserService:
             raise ValidationError('Admin flags are not allowed for this resource.')
 
     @staticmethod
-    def list_users() -> list[User]:
-        return list(User.objects.filter(is_staff=False, is_superuser=False).order_by('id'))
+    def list_users(*, approved: Optional[bool] = None, account_types: Sequence[str] = (), search: str = ''):
+        """Non-admin users ordered by id, as a lazy queryset.
+
+        `search` is a prefix match on username, email or phone, so each branch
+        of the OR can use the index on its column (`LIKE 'abc%'`; a contains
+        search would scan the table).
+        """
+        qs = User.objects.filter(is_staff=False, is_superuser=False)
+        if approved is not None:
+            qs = qs.filter(is_approved=approved)
+        if account_types:
+            qs = qs.filter(account_type__in=list(account_types))
+        search = (search or '').strip()
+        if search:
+            qs = qs.filter(
+                Q(username__istartswith=search) | Q(email__istartswith=search) | Q(phone__startswith=search)
+            )
+        return qs.order_by('id')
+
+    @staticmethod
+    def export_rows(qs, fields: Sequence[str], chunk_size: Optional[int] = None) -> Iterator[tuple]:
+        """Value tuples of `qs` (`fields[0]` must be 'id'), read in keyset chunks by id.
+
+        MySQL drivers buffer a whole result set, even with `.iterator()`; `id > last
+        LIMIT n` keeps memory flat and each query short.
+        """
+        chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+        last = 0
+        while True:
+            rows = list(qs.filter(id__gt=last).order_by('id').values_list(*fields)[:chunk_size])
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1][0]
 
     @staticmethod
     def get_user(user_id: int) -> User:
@@ -74,6 +111,19 @@ class UserService:
         user.save()
         return user
 
+    @staticmethod
+    def approve_users(user_ids: Iterable[int]) -> Dict[str, int]:
+        """Approve many non-admin users with one UPDATE; `matched` counts those found."""
+        from .authentication import invalidate_user_tokens
+
+        user_ids = list(user_ids)
+        qs = User.objects.filter(id__in=user_ids, is_staff=False, is_superuser=False)
+        matched = qs.count()
+        updated = qs.filter(is_approved=False).update(is_approved=True)
+        # update() sends no post_save: drop "not approved" entries of the token cache
+        invalidate_user_tokens(user_ids)
+        return {'matched': matched, 'updated': updated}
+
     @staticmethod
     @transaction.atomic
     def delete_user(user_id: int) -> None:
@@ -118,16 +168,64 @@ class UserService:
         s = s.strip('._-')
         return s or 'user'
 
+    @staticmethod
+    def _allocate(bases: Iterable[str], taken_with_prefix: Callable[[str], Iterable[str]],
+                  fold: Callable[[str], str] = str) -> List[str]:
+        """First free `base`, `base2`, `base3`... for each base, in order.
+
+        Instead of one `exists()` per candidate, the names already taken are
+        read with one prefix query per distinct base; names handed out earlier
+        in the same call count as taken too.
+        """
+        used: Set[str] = set()
+        loaded: Set[str] = set()
+        names = []
+        for base in bases:
+            if base not in loaded:
+                loaded.add(base)
+                used.update(fold(name) for name in taken_with_prefix(base))
+            candidate, idx = base, 1
+            while fold(candidate) in used:
+                idx += 1
+                candidate = f"{base}{idx}"
+            used.add(fold(candidate))
+            names.append(candidate)
+        return names
+
+    @staticmethod
+    def username_base(email: str) -> str:
+        base = UserService._sanitize_base_username((email or '').split('@')[0])
+        return base[:User._meta.get_field('username').max_length - _SUFFIX_ROOM]
+
+    @staticmethod
+    def allocate_usernames(emails: Iterable[str]) -> List[str]:
+        """Unique usernames (case-insensitive) derived from the local part of each email."""
+        return UserService._allocate(
+            [UserService.username_base(email) for email in emails],
+            lambda base: User.objects.filter(username__istartswith=base).values_list('username', flat=True),
+            fold=str.lower,
+        )
+
+    @staticmethod
+    def store_code_base(store_name: str) -> str:
+        from store.models import Store
+
+        base = re.sub(r'[^a-zA-Z0-9]', '', store_name or '').lower() or 'store'
+        return base[:Store._meta.get_field('code').max_length - _SUFFIX_ROOM]
+
+    @staticmethod
+    def allocate_store_codes(store_names: Iterable[str]) -> List[str]:
+        """Unique store codes derived from each store name."""
+        from store.models import Store
+
+        return UserService._allocate(
+            [UserService.store_code_base(name) for name in store_names],
+            lambda base: Store.objects.filter(code__startswith=base).order_by().values_list('code', flat=True),
+        )
+
     @staticmethod
     def generate_username_from_email(email: str) -> str:
-        base = (email or '').split('@')[0]
-        base = UserService._sanitize_base_username(base)
-        candidate = base
-        idx = 1
-        while User.objects.filter(username__iexact=candidate).exists():
-            idx += 1
-            candidate = f"{base}{idx}"
-        return candidate
+        return UserService.allocate_usernames([email])[0]
 
     @staticmethod
     @transaction.atomic
@@ -190,22 +288,14 @@ class UserService:
         user.save()
         if account_type == 'store':
             from store.models import Store, StoreCategory
-            def generate_store_code(store_name: str) -> str:
-                base_code = re.sub(r'[^a-zA-Z0-9]', '', store_name).lower()
-                candidate = base_code
-                idx = 1
-                while Store.objects.filter(code=candidate).exists():
-                    idx += 1
-                    candidate = f"{base_code}{idx}"
-                return candidate
 
             # Ví dụ: gán category mặc định nếu chưa chọn
-            default_category, _ = StoreCategory.objects.get_or_create(name='Khác')
+            default_category, _ = StoreCategory.objects.get_or_create(name=DEFAULT_STORE_CATEGORY)
             Store.objects.create(
                 name=store_name,
                 address=address,
                 owner=user,
-                code=generate_store_code(store_name),
+                code=UserService.allocate_store_codes([store_name])[0],
                 category=default_category,
                 status=Store.Status.ACTIVE
             )
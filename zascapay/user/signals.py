@@ -1,6 +1,9 @@
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.contrib.auth import get_user_model
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens, invalidate_user_tokens
 
 
 @receiver(post_migrate)
@@ -21,4 +24,16 @@ def create_default_admin(sender, **kwargs):
         admin.is_approved = True
         admin.is_system_admin = True
         admin.save()
-        print("✅ Default system admin created: username=admin, password=admin")
\ No newline at end of file
+        print("✅ Default system admin created: username=admin, password=admin")
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_user_tokens(sender, instance, **kwargs):
+    """Duyệt/khóa/xóa user có hiệu lực ngay với token đang dùng (trong worker này)."""
+    invalidate_user_tokens([instance.pk])
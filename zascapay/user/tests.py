@@ -43,7 +43,7 @@ class UserApiTests(TestCase):
         admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpass')
         res = self.client.get(self.list_url)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        usernames = [u['username'] for u in res.data]
+        usernames = [u['username'] for u in res.data['results']]
         self.assertIn('u1', usernames)
         self.assertIn('u2', usernames)
         self.assertNotIn('admin', usernames)
@@ -198,3 +198,330 @@ class RegisterViewTests(TestCase):
         res = self.client.post(self.register_url, payload)
         self.assertEqual(res.status_code, 400)
         self.assertContains(res, 'đồng ý với điều khoản', status_code=400)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        from rest_framework.authtoken.models import Token
+        from user.authentication import clear_token_cache
+
+        clear_token_cache()
+        self.addCleanup(clear_token_cache)
+        self.user = User.objects.create_user(
+            username='terminal', email='terminal@example.com', password='secret123', is_approved=True
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def authenticate(self, key=None):
+        from rest_framework.test import APIRequestFactory
+        from user.authentication import CachedTokenAuthentication
+
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {key or self.token.key}')
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_second_request_hits_cache(self):
+        from user.authentication import token_cache_stats
+
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, 'terminal')
+        self.assertTrue(user.is_authenticated)
+        self.assertEqual(token.key, self.token.key)
+        self.assertEqual(token.user_id, self.user.pk)
+        stats = token_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_deleted_token_is_rejected(self):
+        from rest_framework.exceptions import AuthenticationFailed
+
+        self.authenticate()
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_user_save_invalidates(self):
+        from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
+
+        self.authenticate()
+        self.user.is_approved = False
+        self.user.save()
+        with self.assertRaises(PermissionDenied):
+            self.authenticate()
+        self.user.is_approved = True
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_bulk_update_needs_explicit_invalidation(self):
+        from rest_framework.exceptions import PermissionDenied
+        from user.authentication import invalidate_user_tokens
+
+        self.authenticate()
+        User.objects.filter(pk=self.user.pk).update(is_approved=False)
+        self.authenticate()  # still cached
+        invalidate_user_tokens([self.user.pk])
+        with self.assertRaises(PermissionDenied):
+            self.authenticate()
+
+    def test_unapproved_user_rejected_but_admin_allowed(self):
+        from rest_framework.authtoken.models import Token
+
+        pending = User.objects.create_user(username='pending', email='pending@example.com', password='x')
+        admin = User.objects.create_user(username='boss', email='boss@example.com', password='x', is_system_admin=True)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=pending).key}')
+        self.assertEqual(client.get(reverse('token-cache-stats')).status_code, 403)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=admin).key}')
+        res = client.get(reverse('token-cache-stats'))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('hit_rate', res.data)
+
+    def test_lru_is_bounded(self):
+        from django.test import override_settings
+        from rest_framework.authtoken.models import Token
+        from user.authentication import token_cache_stats
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='x', is_approved=True)
+        other_token = Token.objects.create(user=other)
+        with override_settings(TOKEN_AUTH_CACHE_SIZE=1):
+            self.authenticate()
+            self.authenticate(other_token.key)
+            stats = token_cache_stats()
+        self.assertEqual((stats['size'], stats['evictions']), (1, 1))
+
+
+class OnboardingTests(TestCase):
+    CSV = (
+        'email,first_name,last_name,phone,account_type,password,store_name,address\n'
+        'an@example.com,An,Nguyen,0900,enterprise,Secret123!,Chi nhanh 1,HN\n'
+        'an@example.com,,,,,,Chi nhanh 2,HCM\n'
+        'bao@other.com,Bao,Tran,0901,store,,Shop Bao,\n'
+        'an@else.com,An,Le,0902,store,Secret123!,Chi-nhanh 1,\n'
+        'bad-email,X,Y,,store,Secret123!,Shop X,\n'
+        'taken@example.com,T,K,,store,Secret123!,Shop T,\n'
+    )
+
+    def setUp(self):
+        from store.models import Store, StoreCategory
+
+        self.admin = User.objects.create_user(username='boss', email='boss@example.com', password='x', is_system_admin=True)
+        User.objects.create_user(username='an', email='taken@example.com', password='x')
+        Store.objects.create(name='Old', code='chinhanh1', category=StoreCategory.objects.create(name='Khác'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_allocate_with_prefix_queries(self):
+        from user.service import UserService
+
+        with self.assertNumQueries(3):  # one per distinct base
+            names = UserService.allocate_usernames(['an@x.com', 'AN@y.com', 'an2@z.com', 'bob@x.com'])
+        self.assertEqual(names, ['an2', 'an3', 'an22', 'bob'])
+        self.assertEqual(UserService.generate_username_from_email('an@q.com'), 'an2')
+
+    def test_onboard_csv(self):
+        from user.onboarding import onboard, read_csv
+        from store.models import Store
+
+        with self.assertNumQueries(12):
+            # emails, savepoint, 2 username + 3 store code prefixes, user insert, user ids, category,
+            # store insert, release
+            result = onboard(read_csv(self.CSV), approve=True, workers=2)
+        self.assertEqual((result.users, result.stores, result.errors), (3, 4, 2))
+        self.assertEqual([r['status'] for r in result.results], ['created'] * 4 + ['error'] * 2)
+        self.assertEqual([r['username'] for r in result.results[:4]], ['an2', 'an2', 'bao', 'an3'])
+        self.assertEqual([r['store_code'] for r in result.results[:4]], ['chinhanh12', 'chinhanh2', 'shopbao', 'chinhanh13'])
+        self.assertEqual(result.results[5]['errors'], ['Email đã được sử dụng.'])
+
+        an = User.objects.get(email='an@example.com')
+        self.assertTrue(an.is_approved)
+        self.assertTrue(an.check_password('Secret123!'))
+        self.assertEqual(an.account_type, 'enterprise')
+        self.assertEqual(sorted(Store.objects.filter(owner=an).values_list('name', flat=True)), ['Chi nhanh 1', 'Chi nhanh 2'])
+        self.assertFalse(User.objects.get(email='bao@other.com').has_usable_password())
+
+    def test_email_registered_during_onboarding_is_a_line_error(self):
+        from unittest import mock
+        from user import onboarding
+
+        validate = onboarding._validate
+        calls = []
+
+        def racing_validate(owners):
+            # The first check runs before bao@other.com registers elsewhere
+            calls.append(len(owners))
+            validate(owners)
+            if len(calls) == 1:
+                User.objects.create_user(username='bao-web', email='bao@other.com', password='x')
+
+        with mock.patch.object(onboarding, '_validate', racing_validate):
+            result = onboarding.onboard(onboarding.read_csv(self.CSV))
+        self.assertEqual(calls, [5, 3])
+        self.assertEqual((result.users, result.stores, result.errors), (2, 3, 3))
+        self.assertEqual(result.results[2]['errors'], ['Email đã được sử dụng.'])
+        self.assertEqual(User.objects.get(email='bao@other.com').username, 'bao-web')
+
+    def test_dry_run_and_endpoint(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        url = reverse('admin-user-onboard')
+        res = self.client.post(url + '?dry_run=1', self.CSV, content_type='text/csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['users'], 0)
+        self.assertEqual(res.data['results'][0]['status'], 'valid')
+        self.assertFalse(User.objects.filter(email='an@example.com').exists())
+
+        upload = SimpleUploadedFile('owners.csv', self.CSV.encode('utf-8'), content_type='text/csv')
+        res = self.client.post(url, {'file': upload}, format='multipart')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data['stores'], 4)
+        self.assertFalse(User.objects.get(email='an@example.com').is_approved)
+
+        res = self.client.post(url, 'name\nx\n', content_type='text/csv')
+        self.assertEqual(res.status_code, 400)
+
+    def test_bulk_approve(self):
+        pending = [
+            User.objects.create_user(username=f'p{i}', email=f'p{i}@example.com', password='x') for i in range(3)
+        ]
+        url = reverse('admin-user-bulk-approve')
+        res = self.client.post(url, {'ids': [u.pk for u in pending[:2]] + [self.admin.pk]}, format='json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data, {'matched': 3, 'updated': 3})
+        self.assertEqual(list(User.objects.filter(username__startswith='p', is_approved=True).values_list('username', flat=True)), ['p0', 'p1'])
+        self.assertEqual(self.client.post(url, {'ids': 'all'}, format='json').status_code, 400)
+
+
+class UserListTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='boss', email='boss@example.com', password='x', is_system_admin=True, is_staff=True)
+        for i in range(5):
+            User.objects.create_user(
+                username=f'shop{i}', email=f'shop{i}@example.com', password='x', phone=f'09{i}',
+                account_type='store' if i % 2 else 'enterprise', is_approved=i < 2,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('admin-user-list')
+
+    def test_cursor_pages_with_filters(self):
+        with self.assertNumQueries(1):
+            res = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual([u['username'] for u in res.data['results']], ['shop0', 'shop1'])
+        self.assertNotIn('count', res.data)
+        res = self.client.get(res.data['next'])
+        self.assertEqual([u['username'] for u in res.data['results']], ['shop2', 'shop3'])
+
+        res = self.client.get(self.url, {'approved': 'false', 'account_type': 'store'})
+        self.assertEqual([u['username'] for u in res.data['results']], ['shop3'])
+        res = self.client.get(self.url, {'search': 'SHOP4@'})
+        self.assertEqual([u['username'] for u in res.data['results']], ['shop4'])
+        res = self.client.get(self.url, {'search': '091'})
+        self.assertEqual([u['username'] for u in res.data['results']], ['shop1'])
+        self.assertEqual(self.client.get(self.url, {'approved': 'maybe'}).status_code, 400)
+
+    def test_list_reads_only_serialized_columns(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(self.url, {'page_size': 1})
+        self.assertNotIn('password', ctx.captured_queries[0]['sql'])
+        self.assertTrue(set(res.data['results'][0]).issuperset({'id', 'username', 'phone', 'account_type', 'is_approved'}))
+
+    def test_export_streams_csv_and_ndjson(self):
+        import csv as csv_module
+        import io
+        import json as json_module
+        from unittest import mock
+
+        with mock.patch('user.service.EXPORT_CHUNK_SIZE', 2):
+            res = self.client.get(reverse('admin-user-export'), {'approved': 'false'})
+            self.assertTrue(res.streaming)
+            with self.assertNumQueries(2):  # keyset chunks of 2: 2 rows, then 1
+                body = b''.join(res.streaming_content).decode('utf-8')
+        rows = list(csv_module.DictReader(io.StringIO(body)))
+        self.assertEqual([r['username'] for r in rows], ['shop2', 'shop3', 'shop4'])
+        self.assertEqual(rows[0]['is_approved'], 'False')
+        self.assertIn('attachment; filename="users.csv"', res['Content-Disposition'])
+
+        res = self.client.get(reverse('admin-user-export'), {'output': 'ndjson', 'search': 'shop1'})
+        lines = [json_module.loads(line) for line in b''.join(res.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([(r['username'], r['phone']) for r in lines], [('shop1', '091')])
+        self.assertEqual(self.client.get(reverse('admin-user-export'), {'output': 'xml'}).status_code, 400)
+
+
+class DashboardCounterTests(TestCase):
+    def setUp(self):
+        from user.dashboard import clear_dashboard_cache
+
+        clear_dashboard_cache()
+        self.addCleanup(clear_dashboard_cache)
+        self.admin = User.objects.create_user(username='boss', email='boss@example.com', password='x', is_system_admin=True, is_staff=True)
+        User.objects.create_user(username='a', email='a@example.com', password='x', is_approved=True)
+        User.objects.create_user(username='b', email='b@example.com', password='x')
+
+    def test_first_load_computes_then_serves_cache(self):
+        from user.dashboard import get_dashboard_counts
+
+        counts = get_dashboard_counts()
+        self.assertEqual((counts['users'].value, counts['pending_users'].value, counts['orders'].value), (2, 1, 0))
+        self.assertTrue(counts['orders'].exact)
+        User.objects.create_user(username='c', email='c@example.com', password='x')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_counts()['users'].value, 2)
+
+    def test_reads_stored_counters_and_refreshes_when_stale(self):
+        from datetime import timedelta
+        from unittest import mock
+
+        from django.test import override_settings
+        from django.utils import timezone
+        from user.dashboard import clear_dashboard_cache, get_dashboard_counts, refresh_dashboard_counters
+        from user.models import DashboardCounter
+
+        refresh_dashboard_counters()
+        User.objects.create_user(username='c', email='c@example.com', password='x')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_dashboard_counts()['users'].value, 2)
+
+        clear_dashboard_cache()
+        DashboardCounter.objects.update(refreshed_at=timezone.now() - timedelta(hours=1))
+        with mock.patch('user.dashboard.refresh_in_background') as background:
+            get_dashboard_counts()
+        background.assert_called_once_with()
+
+        clear_dashboard_cache()
+        with override_settings(DASHBOARD_COUNTERS_BACKGROUND=False), mock.patch('user.dashboard.refresh_in_background') as background:
+            get_dashboard_counts()
+        background.assert_not_called()
+
+        self.assertEqual(refresh_dashboard_counters()['users'].value, 3)
+
+    def test_large_tables_use_estimates(self):
+        from unittest import mock
+
+        from user.dashboard import refresh_dashboard_counters
+        from user.models import DashboardCounter
+
+        with mock.patch('user.dashboard.table_estimate', return_value=2_500_000):
+            counts = refresh_dashboard_counters()
+        self.assertEqual(counts['orders'], (2_500_000, False))
+        self.assertEqual(counts['users'], (2, True))
+        self.assertFalse(DashboardCounter.objects.get(name='payments').exact)
+
+    def test_dashboard_page(self):
+        from unittest import mock
+
+        from user.dashboard import refresh_dashboard_counters
+
+        with mock.patch('user.dashboard.table_estimate', return_value=2_500_000):
+            refresh_dashboard_counters()
+        self.client.force_login(self.admin)
+        res = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, '~2500000')
@@ -19,6 +19,9 @@ urlpatterns += [
 # Note: UserViewSet already enforces IsAuthenticated + IsSystemAdmin
 urlpatterns += [
     path('api/users/', UserViewSet.as_view({'get': 'list'}), name='admin-user-list'),
+    path('api/users/export/', UserViewSet.as_view({'get': 'export'}), name='admin-user-export'),
+    path('api/users/approve/', UserViewSet.as_view({'post': 'bulk_approve'}), name='admin-user-bulk-approve'),
+    path('api/users/onboard/', UserViewSet.as_view({'post': 'onboard'}), name='admin-user-onboard'),
     path('api/users/<int:pk>/', UserViewSet.as_view({
         'get': 'retrieve',
         'patch': 'partial_update',
@@ -27,3 +30,8 @@ urlpatterns += [
     }), name='admin-user-detail'),
     path('api/users/<int:pk>/approve/', UserViewSet.as_view({'post': 'approve'}), name='admin-user-approve'),
 ]
+
+from .views import TokenCacheStatsView  # noqa: E402
+urlpatterns += [
+    path('api/auth/token-cache/', TokenCacheStatsView.as_view(), name='token-cache-stats'),
+]
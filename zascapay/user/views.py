@@ -1,10 +1,16 @@
+import csv
+import json
+
 from django.core.exceptions import ValidationError as DjangoValidationError, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.contrib.auth import get_user_model, login as auth_login, logout as auth_logout
 from django.contrib import messages
 from django.shortcuts import redirect, render
 from django.views import View
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.permissions import BasePermission, IsAuthenticated
@@ -12,11 +18,64 @@ from rest_framework.views import APIView
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import never_cache
 
+from .authentication import token_cache_stats
+from .dashboard import get_dashboard_counts
+from .onboarding import onboard, read_csv
 from .serializers import UserSerializer
 from .service import UserService
 
 User = get_user_model()
 
+# Model columns UserSerializer outputs: the list reads only these (`only()`)
+USER_LIST_FIELDS = [
+    name for name, field in UserSerializer().fields.items()
+    if not field.write_only and name in {f.name for f in User._meta.concrete_fields}
+]
+USER_EXPORT_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'phone', 'account_type',
+    'is_active', 'is_approved', 'date_joined', 'last_login',
+)
+_TRUE, _FALSE = ('1', 'true', 'yes'), ('0', 'false', 'no')
+
+
+class UserCursorPagination(CursorPagination):
+    # No COUNT(*) over the whole user table; pages stay stable while users register
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'id'
+
+
+def _user_filters(params) -> dict:
+    """`approved`, `account_type` (comma separated) and `search` query params; raises ValueError."""
+    approved = (params.get('approved') or '').lower()
+    if approved and approved not in _TRUE + _FALSE:
+        raise ValueError('approved must be true or false')
+    return {
+        'approved': (approved in _TRUE) if approved else None,
+        'account_types': [t for t in (params.get('account_type') or '').split(',') if t],
+        'search': params.get('search') or '',
+    }
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each line instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(USER_EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([v.isoformat() if hasattr(v, 'isoformat') else v for v in row])
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(USER_EXPORT_FIELDS, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
 
 
 class IsSystemAdmin(BasePermission):
@@ -35,9 +94,37 @@ class UserViewSet(viewsets.ViewSet):
 
 
     def list(self, request: Request) -> Response:
-        users = UserService.list_users()
-        data = UserSerializer(users, many=True, context={'request': request}).data
-        return Response(data)
+        """
+        Danh sách user theo trang (cursor): `?approved=false&account_type=store&search=abc&page_size=100`.
+        """
+        try:
+            filters = _user_filters(request.query_params)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        users = UserService.list_users(**filters).only(*USER_LIST_FIELDS)
+        paginator = UserCursorPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
+        return paginator.get_paginated_response(UserSerializer(page, many=True, context={'request': request}).data)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request: Request):
+        """
+        Xuất toàn bộ user (cùng bộ lọc với list) dạng stream: `?output=csv` (mặc định) hoặc `?output=ndjson`.
+        """
+        output = request.query_params.get('output') or 'csv'
+        if output not in ('csv', 'ndjson'):
+            return Response({'detail': 'output must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            filters = _user_filters(request.query_params)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        rows = UserService.export_rows(UserService.list_users(**filters), USER_EXPORT_FIELDS)
+        if output == 'csv':
+            response = StreamingHttpResponse(_csv_lines(rows), content_type='text/csv; charset=utf-8')
+        else:
+            response = StreamingHttpResponse(_ndjson_lines(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="users.{output}"'
+        return response
 
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -52,6 +139,35 @@ class UserViewSet(viewsets.ViewSet):
         except ValidationError:
             return Response({'detail': 'User không tồn tại.'}, status=404)
 
+    @action(detail=False, methods=['post'])
+    def bulk_approve(self, request):
+        """
+        Duyệt nhiều user một lần: {"ids": [...]} -> {"matched", "updated"}.
+        """
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({'detail': '`ids` must be a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return Response({'detail': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UserService.approve_users(ids))
+
+    @action(detail=False, methods=['post'])
+    def onboard(self, request):
+        """
+        Tạo hàng loạt chủ cửa hàng + cửa hàng từ CSV (file `file` multipart hoặc body text/csv).
+        `?approve=1` duyệt luôn, `?dry_run=1` chỉ kiểm tra.
+        """
+        upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+        try:
+            rows = read_csv(upload.read() if upload else request.body)
+        except (ValueError, UnicodeDecodeError) as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        flag = lambda name: request.query_params.get(name, '').lower() in ('1', 'true', 'yes')
+        result = onboard(rows, approve=flag('approve'), dry_run=flag('dry_run'))
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.users else status.HTTP_200_OK)
+
     def retrieve(self, request: Request, pk: str | int = None) -> Response:
         try:
             user = UserService.get_user(int(pk))
@@ -105,6 +221,16 @@ class UserViewSet(viewsets.ViewSet):
 
 
 
+class TokenCacheStatsView(APIView):
+    """
+    Thống kê cache token (hit rate...) của worker trả lời request này.
+    """
+    permission_classes = [IsAuthenticated, IsSystemAdmin]
+
+    def get(self, request):
+        return Response(token_cache_stats())
+
+
 class ProfileView(APIView):
     """
     User bình thường xem và chỉnh sửa profile của chính mình.
@@ -221,17 +347,14 @@ class AdminDashboardView(View):
         return super().dispatch(request, *args, **kwargs)
 
     def get(self, request):
-        # Basic counts for header stats (lazy, can optimize later)
-        from user.models import User as UserModel
-        from payment.models import Order, Payment
-        user_count = UserModel.objects.filter(is_staff=False, is_superuser=False).count()
-        pending_users = UserModel.objects.filter(is_approved=False, is_staff=False, is_superuser=False).count()
-        order_count = Order.objects.count()
-        payment_count = Payment.objects.count()
+        # Header stats: cached counters (user.dashboard), approximate for big tables
+        counts = get_dashboard_counts()
         context = {
-            'user_count': user_count,
-            'pending_users': pending_users,
-            'order_count': order_count,
-            'payment_count': payment_count,
+            'user_count': counts['users'].value,
+            'pending_users': counts['pending_users'].value,
+            'order_count': counts['orders'].value,
+            'orders_estimated': not counts['orders'].exact,
+            'payment_count': counts['payments'].value,
+            'payments_estimated': not counts['payments'].exact,
         }
         return render(request, self.template_name, context)
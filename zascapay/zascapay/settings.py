@@ -46,16 +46,23 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',  # DRF token auth
     # Local apps
+    'core',
     'user.apps.UserConfig',  # ✅ load đúng AppConfig
 
     # 'user',
     'product',
     'payment',
     'store',
+    'jobs',
+    'analytics',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Slow SQL log + sampled EXPLAIN (admin: Core > Slow queries)
+    'core.middleware.SlowQueryMiddleware',
+    # N+1 detector, off unless QUERY_INSPECTOR=1 (dev)
+    'core.middleware.QueryInspectorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -146,6 +153,81 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Bulk inventory PATCH bodies (tens of thousands of rows) exceed Django's 2.5 MB default
+DATA_UPLOAD_MAX_MEMORY_SIZE = 20 * 1024 * 1024
+
+# Per-process LRU of store price books (store.pricebook), in number of stores
+PRICE_BOOK_CACHE_SIZE = int(os.environ.get('PRICE_BOOK_CACHE_SIZE', '128'))
+
+# User -> owned store ids (store.membership): per-process LRU; other workers see changes after the TTL
+STORE_MEMBERSHIP_TTL = 60  # seconds
+STORE_MEMBERSHIP_CACHE_SIZE = 10000
+
+# API token -> user row (user.authentication): per-process LRU; revoked tokens work on other workers until the TTL
+TOKEN_AUTH_CACHE_TTL = 60  # seconds
+TOKEN_AUTH_CACHE_SIZE = 10000
+
+# Admin dashboard header counts (user.dashboard; cron: `python manage.py refresh_dashboard_counters`)
+DASHBOARD_COUNTERS_CACHE_SECONDS = 30  # per worker
+DASHBOARD_COUNTERS_MAX_AGE = 300  # older stored counts are refreshed in a background thread
+DASHBOARD_COUNTERS_BACKGROUND = True
+DASHBOARD_ESTIMATE_MIN_ROWS = 100000  # orders/payments: InnoDB estimate above this, exact COUNT below
+
+# Bulk onboarding (user.onboarding): threads hashing passwords (PBKDF2 releases the GIL)
+ONBOARDING_HASH_WORKERS = int(os.environ.get('ONBOARDING_HASH_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+# Background jobs (jobs app, worker: `python manage.py run_jobs`)
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '8'))  # per-job fan-out threads
+JOB_ITEM_RETRIES = 2
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 2.0  # seconds, doubled per attempt
+JOB_HEARTBEAT_INTERVAL = 30  # seconds; running jobs refresh locked_at this often
+JOB_LOCK_TIMEOUT = 600  # seconds without heartbeat before a running job is re-queued
+
+# Analytics rollups (`python manage.py rollup_analytics`): rows younger than this wait for the next run
+ANALYTICS_SETTLE_LAG = 60  # seconds
+
+# POS catalog sync (/api/sync/catalog/): change-log entries are served once older than the lag,
+# which must be far longer than the slowest writer transaction; purge with `purge_catalog_changes`
+CATALOG_SYNC_SETTLE_LAG = 60  # seconds
+CATALOG_CHANGE_RETENTION_DAYS = 30  # older sync tokens get a full snapshot
+
+# Max baskets per POST /api/orders/batch/ (offline POS sync)
+ORDER_BATCH_MAX_SIZE = 500
+
+# Idempotency-Key replays (core.idempotency): per-process LRU size and how long keys are kept
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '1024'))
+IDEMPOTENCY_KEY_TTL_HOURS = 24  # purge with `python manage.py purge_idempotency_keys`
+# Payment endpoints keep the key "in progress" during the provider call; duplicates wait this long
+IDEMPOTENCY_WAIT_SECONDS = 10
+# ...and a retry takes over a key still in progress after this long (its worker died mid-request).
+# Longer than the slowest provider call; the PENDING payment row still prevents a second charge.
+IDEMPOTENCY_LEASE_SECONDS = 120
+
+# Payment providers (payment.gateways); `stub` talks to `python manage.py run_stub_provider`
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'simulated')
+PAYMENT_GATEWAYS = {
+    'simulated': {'CLASS': 'payment.gateways.SimulatedGateway'},
+    'stub': {
+        'CLASS': 'payment.gateways.HttpGateway',
+        'BASE_URL': os.environ.get('PAYMENT_STUB_URL', 'http://127.0.0.1:8099'),
+        'TIMEOUT': 5,  # seconds; a timed-out charge stays PENDING
+        'POOL_SIZE': 20,  # keep-alive connections per worker thread
+        # HMAC key for POST /api/payments/webhooks/stub/; webhooks are rejected while empty
+        'WEBHOOK_SECRET': os.environ.get('PAYMENT_STUB_WEBHOOK_SECRET', ''),
+    },
+}
+
+# N+1 detector (core.middleware.QueryInspectorMiddleware): logs query shapes repeated
+# this many times in one request, with the code lines that issued them
+QUERY_INSPECTOR = os.environ.get('QUERY_INSPECTOR', '0') == '1'
+QUERY_INSPECTOR_REPEAT_THRESHOLD = 5
+
+# Slow query log (core.middleware.SlowQueryMiddleware)
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', '1') != '0'
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '200'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+
 # Custom user model (single concrete user table)
 AUTH_USER_MODEL = 'user.User'
 
@@ -155,7 +237,7 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'user.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -30,4 +30,6 @@ urlpatterns = [
     path('', include('product.urls')),
     path('', include('store.urls')),
     path('', include('payment.urls')),
+    path('', include('jobs.urls')),
+    path('', include('analytics.urls')),
 ]